@@ -0,0 +1,135 @@
+#
+# Sinfonia
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Carbon trace lookups per second, read_csv per lookup vs. CarbonTrace.
+
+Writes a synthetic hourly trace for a year to a temporary directory and looks
+up random timestamps, either by parsing the csv for every lookup (as Tier2
+used to) or with the in-memory CarbonTrace. Also compares the time to open
+the csv trace and the memory mapped binary trace. Run from the top of the
+source tree with,
+
+    poetry run python -m benchmarks.carbon_trace
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from src.sinfonia.carbon.simulation.binary_trace import convert_csv
+from src.sinfonia.carbon.simulation.trace import INTENSITY_COLUMN, CarbonTrace
+
+HOUR = 3600
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--hours", type=int, default=365 * 24, help="trace length [8760]"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=2.0, help="seconds per run [2.0]"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def write_trace(path: Path, hours: int, rng: np.random.Generator) -> None:
+    start = 1672531200  # 2023-01-01
+    pd.DataFrame(
+        {
+            "timestamp": start + HOUR * np.arange(hours),
+            "zone": "US-TEST",
+            INTENSITY_COLUMN: rng.uniform(50.0, 800.0, hours),
+        }
+    ).to_csv(path, index=False)
+
+
+def read_csv_lookup(path: Path) -> Callable[[int], float]:
+    """Baseline, the previous get_carbon_trace implementation."""
+
+    def lookup(timestamp: int) -> float:
+        h = pd.read_csv(path)
+        i = bisect_left(h["timestamp"], timestamp)
+        return h.iloc[i].to_dict()[INTENSITY_COLUMN]
+
+    return lookup
+
+
+def trace_lookup(path: Path) -> Callable[[int], float]:
+    trace = CarbonTrace(path)
+
+    def lookup(timestamp: int) -> float:
+        return trace.row(timestamp)[INTENSITY_COLUMN]
+
+    return lookup
+
+
+def open_ms(path: Path, runs: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        CarbonTrace(path)
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def lookups_per_second(
+    lookup: Callable[[int], float], timestamps: list[int], duration: float
+) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        lookup(timestamps[count % len(timestamps)])
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main() -> int:
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "trace.csv"
+        write_trace(path, args.hours, rng)
+
+        trace = CarbonTrace(path)
+        sampler = random.Random(args.seed)
+        timestamps = [sampler.randint(trace.start, trace.end) for _ in range(10000)]
+
+        # both implementations return the same samples
+        baseline = read_csv_lookup(path)
+        indexed = trace_lookup(path)
+        assert all(baseline(t) == indexed(t) for t in timestamps[:10])
+
+        baseline_rate = lookups_per_second(baseline, timestamps, args.duration)
+        indexed_rate = lookups_per_second(indexed, timestamps, args.duration)
+
+        binary_path = Path(tmpdir) / "trace.bin"
+        convert_csv(path, binary_path)
+        csv_ms = open_ms(path)
+        binary_ms = open_ms(binary_path)
+
+    print(f"{'trace (hours)':>14} {'read_csv (/s)':>14} {'CarbonTrace (/s)':>17}")
+    print(
+        f"{args.hours:>14} {baseline_rate:>14.1f} {indexed_rate:>17.1f}"
+        f"  {indexed_rate / baseline_rate:.0f}x"
+    )
+    print(f"open csv {csv_ms:.3f} ms, open binary {binary_ms:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#
+# Sinfonia
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Latency of sampling RAPL energy, full csv parse vs. csv tail vs. ring.
+
+Writes energy csv files as produced by the energy_report daemon, one row per
+second, of increasing length up to a full day and measures how long it takes
+to sum the last period rows. The same samples are also read from the shared
+memory EnergyRing. Run from the top of the source tree with,
+
+    poetry run python -m benchmarks.energy_sampler
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from src.sinfonia.carbon.meter.energy_ring import EnergyRing
+from src.sinfonia.carbon.meter.intel_rapl import sample_energy_joules
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[60, 3600, 21600, 86400],
+        help="rows in the energy csv [60 3600 21600 86400]",
+    )
+    parser.add_argument("--period", type=int, default=15, help="sampled seconds [15]")
+    parser.add_argument("--runs", type=int, default=20, help="samples per run [20]")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def write_energy_csv(
+    path: Path, ring: EnergyRing, rows: int, rng: random.Random
+) -> None:
+    start = 1672531200
+    with open(path, "w", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "average_joules", "summation_joules"])
+        for ts in range(start, start + rows):
+            joules = rng.uniform(10.0, 60.0)
+            writer.writerow([ts, joules, joules])
+            ring.append(ts, joules, joules)
+
+
+def read_csv_sample(path: Path, period_seconds: int) -> float:
+    """Baseline, the previous sample_energy_joules implementation."""
+    df = pd.read_csv(path, on_bad_lines="skip")
+    return df.tail(period_seconds).iloc[:, -1].sum()
+
+
+def mean_ms(
+    sample: Callable[[Path, int], float], path: Path, period: int, runs: int
+) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        sample(path, period)
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def main() -> int:
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'rows':>8} {'read_csv (ms)':>14} {'tail (ms)':>10} {'ring (ms)':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for rows in args.rows:
+            path = Path(tmpdir) / f"energy-{rows}.csv"
+            ring = EnergyRing.create(capacity=3600)
+            try:
+                write_energy_csv(path, ring, rows, rng)
+
+                expected = read_csv_sample(path, args.period)
+                assert abs(sample_energy_joules(path, args.period) - expected) < 1e-6
+                assert abs(ring.sum_joules(args.period) - expected) < 1e-6
+
+                baseline_ms = mean_ms(read_csv_sample, path, args.period, args.runs)
+                tail_ms = mean_ms(sample_energy_joules, path, args.period, args.runs)
+                ring_ms = mean_ms(
+                    lambda _, period: ring.sum_joules(period),
+                    path,
+                    args.period,
+                    args.runs,
+                )
+            finally:
+                ring.close()
+                ring.unlink()
+            print(f"{rows:>8} {baseline_ms:>14.3f} {tail_ms:>10.3f} {ring_ms:>10.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
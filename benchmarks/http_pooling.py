@@ -0,0 +1,119 @@
+#
+# Sinfonia
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Deploy request throughput against a stub Tier2, with and without pooling.
+
+Starts a local HTTP server that answers deployment requests with an empty
+list and sends requests from a thread pool, either with module level
+`requests.post` (a new connection for every request) or with a shared pooled
+session. Run from the top of the source tree with,
+
+    poetry run python -m benchmarks.http_pooling
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import requests
+
+from src.sinfonia.http_transport import create_session
+
+
+class StubTier2Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, avoid delayed ack stalls
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"[]")
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="requests per run [2000]"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32],
+        help="concurrent requests [1 8 32]",
+    )
+    return parser.parse_args()
+
+
+def run(post: Callable[[str], requests.Response], url: str, count: int, workers: int):
+    """Returns requests per second."""
+
+    def deploy(_):
+        post(url).raise_for_status()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(deploy, range(count)))
+    return count / (time.perf_counter() - start)
+
+
+def main() -> int:
+    args = parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTier2Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    url = f"http://{host}:{port}/api/v1/deploy/app/key"
+
+    print(
+        f"{'workers':>8} {'unpooled (req/s)':>17} {'conns':>6}"
+        f" {'pooled (req/s)':>15} {'conns':>6}"
+    )
+    for workers in args.concurrency:
+        server.connections = 0
+        unpooled = run(
+            lambda u: requests.post(u, timeout=5), url, args.requests, workers
+        )
+        unpooled_conns = server.connections
+
+        server.connections = 0
+        session = create_session(pool_maxsize=workers)
+        pooled = run(session.post, url, args.requests, workers)
+        pooled_conns = server.connections
+        session.close()
+
+        print(
+            f"{workers:>8} {unpooled:>17.0f} {unpooled_conns:>6}"
+            f" {pooled:>15.0f} {pooled_conns:>6}"
+        )
+
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
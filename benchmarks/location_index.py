@@ -0,0 +1,120 @@
+#
+# Sinfonia
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Per-request latency of the location matcher, full scan vs. spatial index.
+
+Run from the top of the source tree with,
+
+    poetry run python -m benchmarks.location_index
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from ipaddress import ip_address
+from uuid import uuid4
+
+import numpy as np
+from wireguard_tools import WireguardKey
+from yarl import URL
+
+from src.domain.logger import get_default_logger
+from src.sinfonia.client_info import ClientInfo
+from src.sinfonia.cloudlet_registry import CloudletRegistry
+from src.sinfonia.cloudlets import Cloudlet
+from src.sinfonia.geo_location import GeoLocation, coordinates_array, distances
+from src.sinfonia.matchers import MAX_DIST_KM, location_stage, tier1_best_match
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cloudlets",
+        type=int,
+        nargs="+",
+        default=[10, 1000, 100000],
+        help="number of registered cloudlets [10 1000 100000]",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=5, help="deploy requests per run [5]"
+    )
+    parser.add_argument("--results", type=int, default=3, help="results used [3]")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def random_location(rng: random.Random) -> GeoLocation:
+    return GeoLocation(rng.uniform(-60.0, 70.0), rng.uniform(-180.0, 180.0))
+
+
+def make_cloudlets(count: int, rng: random.Random) -> list[Cloudlet]:
+    endpoint = URL("http://127.0.0.1/api/v1/deploy")
+    return [
+        Cloudlet.new(
+            uuid4(),
+            endpoint,
+            locations=[random_location(rng)],
+            local_networks=[],
+        )
+        for _ in range(count)
+    ]
+
+
+def scan(client_info: ClientInfo, cloudlets: list[Cloudlet], results: int) -> list:
+    """Baseline, compute the distance to every cloudlet and sort."""
+    coordinates = coordinates_array([cloudlet.locations[0] for cloudlet in cloudlets])
+    by_distance = distances(client_info.location, coordinates)
+    order = np.argsort(by_distance, kind="stable")[:results]
+    return [cloudlets[i] for i in order if by_distance[i] <= MAX_DIST_KM]
+
+
+def indexed(client_info: ClientInfo, registry: CloudletRegistry, results: int) -> list:
+    return list(
+        tier1_best_match(
+            [location_stage], client_info, None, registry, results  # type: ignore
+        )
+    )
+
+
+def time_requests(matcher, cloudlets, clients: list[ClientInfo], results: int) -> float:
+    """Returns mean latency in milliseconds to get the first results."""
+    start = time.perf_counter()
+    for client_info in clients:
+        matcher(client_info, cloudlets, results)
+    return (time.perf_counter() - start) * 1000 / len(clients)
+
+
+def main() -> int:
+    args = parse_args()
+    get_default_logger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    publickey = WireguardKey.generate().public_key()
+
+    print(f"{'cloudlets':>10} {'scan (ms)':>12} {'index (ms)':>12} {'speedup':>8}")
+    for count in args.cloudlets:
+        cloudlets = make_cloudlets(count, rng)
+        clients = [
+            ClientInfo(publickey, ip_address("128.2.0.1"), random_location(rng))
+            for _ in range(args.requests)
+        ]
+
+        registry = CloudletRegistry.from_cloudlets(cloudlets)
+
+        scan_ms = time_requests(scan, cloudlets, clients, args.results)
+        index_ms = time_requests(indexed, registry, clients, args.results)
+        print(
+            f"{count:>10} {scan_ms:>12.3f} {index_ms:>12.3f}"
+            f" {scan_ms / index_ms:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    main()
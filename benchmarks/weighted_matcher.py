@@ -0,0 +1,136 @@
+#
+# Sinfonia
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Per-request latency of the weighted matcher vs. the default matcher chain.
+
+Run from the top of the source tree with,
+
+    poetry run python -m benchmarks.weighted_matcher
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import time
+from ipaddress import ip_address
+from uuid import uuid4
+
+from flask import Flask
+from wireguard_tools import WireguardKey
+from yarl import URL
+
+from src.domain.logger import get_default_logger
+from src.sinfonia.client_info import ClientInfo
+from src.sinfonia.cloudlet_registry import CloudletRegistry
+from src.sinfonia.cloudlets import Cloudlet
+from src.sinfonia.geo_location import GeoLocation
+from src.sinfonia.matchers import (
+    carbon_intensity_stage,
+    location_stage,
+    network_stage,
+    tier1_best_match,
+    weighted_stage,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--cloudlets",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="number of registered cloudlets [1000 10000 100000]",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=5, help="deploy requests per run [5]"
+    )
+    parser.add_argument("--results", type=int, default=3, help="results used [3]")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def random_location(rng: random.Random) -> GeoLocation:
+    return GeoLocation(rng.uniform(-60.0, 70.0), rng.uniform(-180.0, 180.0))
+
+
+def make_cloudlets(count: int, rng: random.Random) -> list[Cloudlet]:
+    endpoint = URL("http://127.0.0.1/api/v1/deploy")
+    return [
+        Cloudlet.new(
+            uuid4(),
+            endpoint,
+            locations=[random_location(rng)],
+            local_networks=[],
+            resources={
+                "carbon_intensity_gco2_kwh": rng.uniform(20.0, 800.0),
+                "cpu_ratio": rng.random(),
+                "mem_ratio": rng.random(),
+            },
+        )
+        for _ in range(count)
+    ]
+
+
+def time_requests(
+    app: Flask,
+    stages: list,
+    registry: CloudletRegistry,
+    clients: list[ClientInfo],
+    results: int,
+) -> float:
+    """Returns mean latency in milliseconds to get the best results."""
+    start = time.perf_counter()
+    with app.app_context():
+        for client_info in clients:
+            list(
+                tier1_best_match(
+                    stages, client_info, None, registry, results  # type: ignore
+                )
+            )
+    return (time.perf_counter() - start) * 1000 / len(clients)
+
+
+def main() -> int:
+    args = parse_args()
+    get_default_logger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    publickey = WireguardKey.generate().public_key()
+
+    chain = [network_stage, location_stage, carbon_intensity_stage]
+    runs = {}
+    for mode in ("linear", "pareto"):
+        app = Flask(mode)
+        app.config["WEIGHTED_MATCHER_MODE"] = mode
+        runs[mode] = app
+
+    print(
+        f"{'cloudlets':>10} {'chain (ms)':>12} {'linear (ms)':>12}"
+        f" {'pareto (ms)':>12}"
+    )
+    for count in args.cloudlets:
+        registry = CloudletRegistry.from_cloudlets(make_cloudlets(count, rng))
+        clients = [
+            ClientInfo(publickey, ip_address("128.2.0.1"), random_location(rng))
+            for _ in range(args.requests)
+        ]
+
+        chain_ms = time_requests(runs["linear"], chain, registry, clients, args.results)
+        linear_ms = time_requests(
+            runs["linear"], [weighted_stage], registry, clients, args.results
+        )
+        pareto_ms = time_requests(
+            runs["pareto"], [weighted_stage], registry, clients, args.results
+        )
+        print(f"{count:>10} {chain_ms:>12.3f} {linear_ms:>12.3f} {pareto_ms:>12.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#
+# Sinfonia
+#
+# Allocate client addresses from the deployment client network
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Constant time allocation of addresses from a network.
+
+Host addresses are identified by their offset in the network. Free offsets
+are kept in an array, with a second array mapping each offset to its position
+in the free array, or -1 when the address is in use. This second array acts as
+the occupancy bitmap. Allocating picks a random free entry and swaps the last
+free entry into its place, reserving or releasing a specific address moves a
+single entry as well, so all operations take constant time.
+
+Addresses are picked at random so that Tier2 replicas sharing a cluster are
+unlikely to hand out the same address at the same time. Callers still have to
+check the peers in the cluster, and reserve any address they find in use.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from array import array
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Iterable
+
+from attrs import define, field
+
+Address = IPv4Address | IPv6Address
+
+
+@define
+class AddressAllocator:
+    """Thread-safe allocator of host addresses in network."""
+
+    network: IPv4Network | IPv6Network
+    # allocations that have not been confirmed survive a sync for this long
+    pending_seconds: float = 300.0
+
+    _first: int = field(init=False)
+    _free: array = field(init=False)
+    _position: array = field(init=False)
+    _pending: dict[int, float] = field(init=False, factory=dict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def __attrs_post_init__(self) -> None:
+        # like network.hosts(), skip the network and broadcast addresses
+        first, last = 1, self.network.num_addresses - 2
+        if self.network.num_addresses <= 2:
+            first, last = 0, self.network.num_addresses - 1
+        if last - first + 1 > 1 << 24:
+            raise ValueError("network too large to allocate from")
+
+        self._first = first
+        size = last - first + 1
+        self._free = array("i", range(size))
+        self._position = array("i", range(size))
+
+    def __len__(self) -> int:
+        """Number of addresses in use."""
+        return len(self._position) - len(self._free)
+
+    @property
+    def available(self) -> int:
+        return len(self._free)
+
+    def __contains__(self, address: object) -> bool:
+        """Whether address is in use."""
+        offset = self._offset(address)
+        return offset is not None and self._position[offset] < 0
+
+    def _offset(self, address: object) -> int | None:
+        if not isinstance(address, (IPv4Address, IPv6Address)):
+            return None
+        if address not in self.network:
+            return None
+        offset = int(address) - int(self.network.network_address) - self._first
+        if not 0 <= offset < len(self._position):
+            return None
+        return offset
+
+    def _take(self, offset: int) -> None:
+        position = self._position[offset]
+        last = self._free.pop()
+        if last != offset:
+            self._free[position] = last
+            self._position[last] = position
+        self._position[offset] = -1
+
+    def _put(self, offset: int) -> None:
+        self._position[offset] = len(self._free)
+        self._free.append(offset)
+
+    def allocate(self) -> Address:
+        """Pick a random free address.
+
+        raises:
+        - ValueError when all addresses are in use.
+        """
+        with self._lock:
+            if not self._free:
+                raise ValueError(f"no free addresses in {self.network}")
+            offset = self._free[random.randrange(len(self._free))]
+            self._take(offset)
+            self._pending[offset] = time.monotonic()
+        return self.network.network_address + self._first + offset
+
+    def reserve(self, address: Address) -> bool:
+        """Mark address as in use, returns False when it already was."""
+        offset = self._offset(address)
+        if offset is None:
+            return False
+        with self._lock:
+            if self._position[offset] < 0:
+                return False
+            self._take(offset)
+        return True
+
+    def confirm(self, address: Address) -> None:
+        """An allocated address is now visible as in use in the cluster."""
+        offset = self._offset(address)
+        if offset is None:
+            return
+        with self._lock:
+            self._pending.pop(offset, None)
+
+    def release(self, address: Address) -> None:
+        """Return address to the pool, ignores addresses that are not in use."""
+        offset = self._offset(address)
+        if offset is None:
+            return
+        with self._lock:
+            self._pending.pop(offset, None)
+            if self._position[offset] < 0:
+                self._put(offset)
+
+    def sync(self, in_use: Iterable[Address]) -> None:
+        """Reconcile with the addresses that are in use in the cluster.
+
+        Addresses that are not in use are released, unless we allocated them
+        recently and the deployment may not be visible yet.
+        """
+        offsets = {self._offset(address) for address in in_use}
+        offsets.discard(None)
+
+        with self._lock:
+            expired = time.monotonic() - self.pending_seconds
+            self._pending = {
+                offset: allocated
+                for offset, allocated in self._pending.items()
+                if allocated > expired and offset not in offsets
+            }
+            for offset in range(len(self._position)):
+                in_use_now = offset in offsets or offset in self._pending
+                if in_use_now and self._position[offset] >= 0:
+                    self._take(offset)
+                elif not in_use_now and self._position[offset] < 0:
+                    self._put(offset)
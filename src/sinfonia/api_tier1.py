@@ -7,11 +7,9 @@
 #
 # SPDX-License-Identifier: MIT
 #
-from typing import Dict, List, Iterable
+from typing import Iterable
 
 import os
-from uuid import UUID
-from itertools import chain, filterfalse, islice, zip_longest
 
 from connexion import NoContent
 from connexion.exceptions import ProblemException
@@ -21,8 +19,11 @@ import csv
 import time
 
 from .client_info import ClientInfo
-from .cloudlets import Cloudlet
+from .cloudlet_registry import CloudletRegistry
+from .cloudlets import Cloudlet, deploy_timeout
 from .deployment_recipe import DeploymentRecipe
+from .fanout import deploy_first, gather_hedged
+from .http_transport import http_session
 from .matchers import tier1_best_match
 
 from src.domain.logger import get_default_logger
@@ -80,7 +81,7 @@ class CloudletsView(MethodView):
         return NoContent, 204
 
     def search(self):
-        cloudlets: Dict[UUID, Cloudlet] = current_app.config["cloudlets"]
+        cloudlets: CloudletRegistry = current_app.config["cloudlets"]
         return [cloudlet.summary() for cloudlet in cloudlets.values()]
 
 
@@ -99,30 +100,65 @@ class DeployView(MethodView):
             raise ProblemException(400, "Bad Request", "Incorrectly formatted request")
 
         matchers = config["match_functions"]
-        available: List[Cloudlet] = list(config["cloudlets"].values())
-        
-        candidates: Iterable[Cloudlet] = islice(
-            tier1_best_match(matchers, client_info, requested, available), max_results
-        )
-
-        # fire off deployment requests
-        requests = [
-            cloudlet.deploy_async(requested.uuid, client_info)
-            for cloudlet in candidates
-        ]
-
-        # gather the results,
-        # - interleave results from cloudlets in case any returned more than requested.
-        # - recombine into a single list, drop failed results, and limit to max_results.
-        results = list(
-            islice(
-                filterfalse(
-                    lambda r: r is None,
-                    chain(*zip_longest(*(request.result() for request in requests))),
+        timeout = deploy_timeout()
+        deadline = sum(timeout) if timeout is not None else None
+
+        if not config.get("DEPLOY_HEDGING", False):
+            spares = config["DEPLOY_SPARES"]
+            candidates: Iterable[Cloudlet] = tier1_best_match(
+                matchers,
+                client_info,
+                requested,
+                config["cloudlets"],
+                max_results + spares,
+            )
+            executor = config["executor"]
+            session = http_session()
+
+            # deploy to spare candidates as well and gather the first
+            # max_results deployments, ordered by candidate rank
+            results = deploy_first(
+                candidates,
+                deploy=lambda c: c.deploy_async(requested.uuid, client_info, timeout),
+                release=lambda c: c.release_async(
+                    requested.uuid, client_info, timeout, executor, session
+                ),
+                max_results=max_results,
+                spares=spares,
+                timeout=deadline,
+            )
+        else:
+            max_hedges = config["DEPLOY_HEDGE_MAX_REQUESTS"]
+            candidates = tier1_best_match(
+                matchers,
+                client_info,
+                requested,
+                config["cloudlets"],
+                max_results + max_hedges,
+            )
+            latency_stats = config["latency_stats"]
+            executor = config["executor"]
+            session = http_session()
+
+            def hedge_delay(cloudlet: Cloudlet) -> float:
+                delay = latency_stats.percentile(
+                    cloudlet.uuid, config["DEPLOY_HEDGE_PERCENTILE"]
+                )
+                if delay is None:
+                    return config["DEPLOY_HEDGE_DELAY_SECONDS"]
+                return delay
+
+            results = gather_hedged(
+                candidates,
+                deploy=lambda c: c.deploy_async(requested.uuid, client_info, timeout),
+                release=lambda c: c.release_async(
+                    requested.uuid, client_info, timeout, executor, session
                 ),
-                max_results,
+                hedge_delay=hedge_delay,
+                max_results=max_results,
+                max_hedges=max_hedges,
+                timeout=deadline,
             )
-        )
 
         # all requests failed?
         if not results:
@@ -142,6 +178,11 @@ class DeployView(MethodView):
         raise ProblemException(500, "Error", "Not implemented")
 
 
+class GeolocationCacheView(MethodView):
+    def search(self):
+        return current_app.config["geolocation_cache"].stats()
+
+
 class RecipeView(MethodView):
     def get(self, uuid):
         try:
@@ -8,6 +8,7 @@
 # SPDX-License-Identifier: MIT
 #
 from concurrent.futures import CancelledError
+from uuid import UUID
 
 from connexion import NoContent
 from connexion.exceptions import ProblemException
@@ -16,6 +17,7 @@ from flask.views import MethodView
 from pydantic import BaseModel, validator
 
 from src.domain.logger import get_default_logger
+from src.sinfonia.deploy_jobs import TooManyJobs
 from src.sinfonia.carbon import report as carbon_report
 
 
@@ -40,10 +42,11 @@ class CarbonView(MethodView):
             raise ProblemException(400, f"carbon trace timestamp not yet recorded")
         
         r = carbon_report.from_simulation(
-            node_name=config["OBELIX_NODE_NAME"],
             method=config["POWER_MEASURE_METHOD"],
-            t_sec=config["REPORT_TO_TIER1_INTERVAL_SECONDS"],
+            energy_csv_path=config["CARBON_ENERGY_REPORT_PATH"],
+            period_seconds=config["REPORT_TO_TIER1_INTERVAL_SECONDS"],
             timestamp=config["CARBON_TRACE_TIMESTAMP"],
+            energy_ring=config.get("energy_ring"),
             )
         logger.debug(f"[CarbonView] {config['OBELIX_NODE_NAME']} -- ts {config['CARBON_TRACE_TIMESTAMP']} -- ci {r.carbon_intensity_gco2_kwh}")
         return r
@@ -76,24 +79,55 @@ class ResuView(MethodView):
         return current_app.config['K8S_CLUSTER'].get_resources()
 
 
+def deploy(uuid, application_key) -> list[dict]:
+    config = current_app.config
+    cluster = config["K8S_CLUSTER"]
+    default_endpoint = config["TIER2_URL"]
+
+    deployment = cluster.get(uuid, application_key, create=True)
+    try:
+        created = deployment.deploy()
+    except (CancelledError, TimeoutError) as e:
+        raise ProblemException(400, "Error", f"Failed to deploy {e!r}")
+    except Exception as e:
+        raise ProblemException(500, "Error", f"Error occured {e!r}")
+
+    d = deployment.asdict(default_endpoint=default_endpoint)
+    # Tier1 only releases unused deployments that this request created
+    d["NewDeployment"] = created
+    logger.debug(f"[DeployView] POST {d}")
+
+    return [d]
+
+
 class DeployView(MethodView):
     def post(self, uuid, application_key):
         config = current_app.config
-        cluster = config["K8S_CLUSTER"]
-        default_endpoint = config["TIER2_URL"]
-        
-        deployment = cluster.get(uuid, application_key, create=True)
-        try:
-            deployment.deploy()
-        except (CancelledError, TimeoutError) as e:
-            raise ProblemException(400, "Error", f"Failed to deploy {e!r}")
-        except Exception as e:
-            raise ProblemException(500, "Error", f"Error occured {e!r}")
+        deploy_jobs = config.get("deploy_jobs")
+
+        # RFC 7240, ask to deploy in the background
+        prefer = request.headers.get("Prefer", "")
+        if deploy_jobs is None or "respond-async" not in prefer:
+            return deploy(uuid, application_key)
 
-        d = deployment.asdict(default_endpoint=default_endpoint)
-        logger.debug(f"[DeployView] POST {d}")
+        app = current_app._get_current_object()
 
-        return [d]
+        def deploy_job():
+            with app.app_context():
+                return deploy(uuid, application_key)
+
+        try:
+            job = deploy_jobs.submit(UUID(str(uuid)), application_key, deploy_job)
+        except TooManyJobs:
+            raise ProblemException(
+                503, "Service Unavailable", "Too many deployments in progress"
+            )
+
+        headers = {
+            "Location": f"{request.script_root}/api/v1/deploy_jobs/{job.id}",
+            "Preference-Applied": "respond-async",
+        }
+        return job.asdict(), 202, headers
 
     def get(self, uuid, application_key):
         cluster = current_app.config["K8S_CLUSTER"]
@@ -115,3 +149,17 @@ class DeployView(MethodView):
                 raise ProblemException(500, "Error", f"Error occured {e!r}")
         
         return NoContent, 204
+
+
+class DeployJobsView(MethodView):
+    def get(self, job_id, wait=0):
+        config = current_app.config
+        deploy_jobs = config.get("deploy_jobs")
+        job = deploy_jobs.get(UUID(str(job_id))) if deploy_jobs is not None else None
+        if job is None:
+            raise ProblemException(404, "Not Found", "Unknown deployment job")
+
+        # long-poll until the job completes
+        if wait:
+            job.wait(min(wait, config["DEPLOY_JOB_MAX_WAIT_SECONDS"]))
+        return job.asdict()
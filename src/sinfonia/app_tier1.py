@@ -11,13 +11,11 @@ from __future__ import annotations
 import signal
 import sys
 from pathlib import Path
-from uuid import UUID
 
 import connexion
 import typer
 from connexion.resolver import MethodViewResolver
 from flask_executor import Executor
-from geolite2 import geolite2
 from rich import print
 from werkzeug.middleware.proxy_fix import ProxyFix
 from yarl import URL
@@ -31,11 +29,17 @@ from .app_common import (
     recipes_option,
     version_option,
 )
-from .cloudlets import Cloudlet
+from .cloudlet_registry import CloudletRegistry
 from .cloudlets import load as cloudlets_load
 from .deployment_repository import DeploymentRepository
+from .recipe_cache import RecipeCache
+from .geo_location import geolite2_reader
+from .geolocation_cache import GeolocationCache
+from .http_transport import session_from_config
+from .latency_stats import LatencyStats
 from .jobs import scheduler, start_expire_cloudlets_job, start_broadcasting_job
-from .matchers import Tier1MatchFunction, get_match_function_plugins
+from .location_index import LocationIndex
+from .matchers import Tier1MatchStage, as_stage, get_match_function_plugins
 from .openapi import load_spec
 
 from src.domain.logger import get_default_logger
@@ -53,7 +57,52 @@ class Tier1DefaultConfig:
     MATCHERS: list[str] = ["network", "location", "carbon-intensity"] # "carbon-intensity"
     CLOUDLETS: str | Path | None = None
     RECIPES: str | Path | URL = "RECIPES"    
+    # parsed recipes, revalidated against the repository after max age
+    RECIPE_CACHE_SIZE = 1024
+    RECIPE_CACHE_MAX_AGE_SECONDS = 5
+    RECIPE_CACHE_NEGATIVE_TTL_SECONDS = 10
     CLOUDLET_EXPIRY_SECONDS = 60
+    # accuracy of client to cloudlet distances, "geodesic" or "haversine"
+    DISTANCE_MODE = "geodesic"
+    # objectives of the "weighted" matcher, any of distance, carbon_intensity,
+    # cpu_ratio and mem_ratio, ranked by "linear" weighted sum or "pareto" front
+    WEIGHTED_MATCHER_WEIGHTS = {
+        "distance": 1.0,
+        "carbon_intensity": 1.0,
+        "cpu_ratio": 0.5,
+        "mem_ratio": 0.5,
+    }
+    WEIGHTED_MATCHER_MODE = "linear"
+    # timeouts for deployment requests forwarded to Tier2 cloudlets
+    DEPLOY_CONNECT_TIMEOUT_SECONDS = 3.05
+    DEPLOY_TIMEOUT_SECONDS = 30
+    # deploy to this many candidates beyond the requested results, so one
+    # slow cloudlet does not hold up the response, each spare is an extra
+    # install that is released again when it is not used
+    DEPLOY_SPARES = 0
+    # duplicate deployment requests to the next best cloudlet when a cloudlet
+    # takes longer than the given percentile of its past response times
+    DEPLOY_HEDGING = False
+    DEPLOY_HEDGE_PERCENTILE = 95
+    DEPLOY_HEDGE_DELAY_SECONDS = 2.0  # used until we have enough samples
+    DEPLOY_HEDGE_MAX_REQUESTS = 1
+    # ask Tier2 to deploy in the background and long-poll the deployment job
+    DEPLOY_ASYNC = False
+    DEPLOY_ASYNC_POLL_SECONDS = 10
+    DEPLOY_ASYNC_DEADLINE_SECONDS = 300
+    # client geolocation cache, clients within the same prefix share an entry
+    GEOLOCATION_CACHE_SIZE = 65536
+    GEOLOCATION_CACHE_TTL_SECONDS = 3600
+    GEOLOCATION_CACHE_PREFIX_V4 = 32
+    GEOLOCATION_CACHE_PREFIX_V6 = 128
+    # pooled keep-alive connections to Tier2 cloudlets and recipe repository
+    HTTP_POOL_CONNECTIONS = 64  # number of hosts with a connection pool
+    HTTP_POOL_MAXSIZE = 16  # open connections per host
+    HTTP_POOL_BLOCK = False
+    HTTP_CONNECT_TIMEOUT_SECONDS = 3.05
+    HTTP_READ_TIMEOUT_SECONDS = 30
+    HTTP_RETRIES = 2
+    HTTP_RETRY_BACKOFF_SECONDS = 0.2
     EXPERIMENT_BROADCAST_TIMESTAMP_INTERVAL_SECONDS = 1
     EXPERIMENT_TICK_RATE_SECONDS = 12
     CARBON_TRACE_TIMESTAMP = 1672546320  # 1672549200 - 12 * 240
@@ -62,18 +111,18 @@ class Tier1DefaultConfig:
     # 2023-07-03 00:00:00 1688342400 / 1688342400 - (12*180) = 1688340240
 
 
-def load_cloudlets_conf(cloudlets_conf: str | Path | None) -> dict[UUID, Cloudlet]:
+def load_cloudlets_conf(
+    cloudlets_conf: str | Path | None, registry: CloudletRegistry
+) -> CloudletRegistry:
     """read cloudlets.yaml configuration file to preseed Tier2 cloudlets
 
     this depends on flask_app.config["geolite2_reader"]
     """
-    if cloudlets_conf is None:
-        return {}
-
-    with Path(cloudlets_conf).open() as stream:
-        cloudlets = cloudlets_load(stream)
-
-    return {cloudlet.uuid: cloudlet for cloudlet in cloudlets}
+    if cloudlets_conf is not None:
+        with Path(cloudlets_conf).open() as stream:
+            for cloudlet in cloudlets_load(stream):
+                registry.add(cloudlet)
+    return registry
 
 
 def list_match_functions(value):
@@ -84,11 +133,13 @@ def list_match_functions(value):
         raise typer.Exit()
 
 
-def load_match_functions(matchers: list[str]) -> list[Tier1MatchFunction]:
+def load_match_functions(matchers: list[str]) -> list[Tier1MatchStage]:
     """load pluggable functions to select Tier2 candidates"""
     try:
         tier1_matchers = get_match_function_plugins()
-        match_functions = [tier1_matchers[matcher].load() for matcher in matchers]
+        match_functions = [
+            as_stage(tier1_matchers[matcher].load()) for matcher in matchers
+        ]
         logger.info(f"Loaded match functions {matchers}")
     except KeyError as e:
         sys.exit(f"Error: Match function '{e.args[0]}' not found")
@@ -108,14 +159,31 @@ def wsgi_app_factory(**args) -> connexion.FlaskApp:
     flask_app.config.from_mapping(cmdargs)
 
     flask_app.config["executor"] = Executor(flask_app)
-    flask_app.config["geolite2_reader"] = geolite2.reader()
+    flask_app.config["http_session"] = session_from_config(flask_app.config)
+    flask_app.config["latency_stats"] = LatencyStats()
+    flask_app.config["geolite2_reader"] = geolite2_reader()
+    flask_app.config["geolocation_cache"] = GeolocationCache(
+        maxsize=flask_app.config["GEOLOCATION_CACHE_SIZE"],
+        ttl=flask_app.config["GEOLOCATION_CACHE_TTL_SECONDS"],
+        prefix_v4=flask_app.config["GEOLOCATION_CACHE_PREFIX_V4"],
+        prefix_v6=flask_app.config["GEOLOCATION_CACHE_PREFIX_V6"],
+    )
 
     with flask_app.app_context():
         flask_app.config["cloudlets"] = load_cloudlets_conf(
-            flask_app.config.get("CLOUDLETS")
+            flask_app.config.get("CLOUDLETS"),
+            CloudletRegistry(
+                location_index=LocationIndex(mode=flask_app.config["DISTANCE_MODE"])
+            ),
         )
     flask_app.config["deployment_repository"] = DeploymentRepository(
-        flask_app.config["RECIPES"]
+        flask_app.config["RECIPES"],
+        flask_app.config["http_session"],
+        recipe_cache=RecipeCache(
+            maxsize=flask_app.config["RECIPE_CACHE_SIZE"],
+            max_age=flask_app.config["RECIPE_CACHE_MAX_AGE_SECONDS"],
+            negative_ttl=flask_app.config["RECIPE_CACHE_NEGATIVE_TTL_SECONDS"],
+        ),
     )
     flask_app.config["match_functions"] = load_match_functions(
         flask_app.config["MATCHERS"]
@@ -8,10 +8,11 @@
 
 from __future__ import annotations
 
+import atexit
 import time
 import socket
 from pathlib import Path
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import connexion
 import typer
@@ -34,10 +35,17 @@ from .app_common import (
 )
 from .cluster import Cluster
 from .daemons import energy_report
+from .carbon.meter.energy_ring import EnergyRing
+from .chart_cache import ChartCache
+from .deploy_jobs import DeployJobs
+from .deployment_recipe import DeploymentRecipe
 from .deployment_repository import DeploymentRepository
+from .recipe_cache import RecipeCache
 from .jobs import scheduler, start_expire_deployments_job, start_reporting_job
 from .openapi import load_spec
 from .geo_location import GeoLocation
+from .warm_pool import WarmPool
+from .http_transport import session_from_config
 
 from src.domain import daemon_registry
 from src.domain.logger import get_default_logger
@@ -54,13 +62,59 @@ class Tier2DefaultConfig:
     TIER2_LATITUDE = 30.332184
     TIER2_LONGITUDE = -81.655647
     TIER2_ZONE = "US-FLA-JEA"
-    TRACE_GITHUB_REPO_URL = "https://github.com/k2nt/k2nt.github.io/blob/main/projects/sinfonia/carbon_traces"
+    TRACE_GITHUB_REPO_URL = (
+        "https://github.com/k2nt/k2nt.github.io/blob/main/projects/sinfonia"
+        "/carbon_traces"
+    )
     RECIPES: str | Path | URL = "RECIPES"
+    # parsed recipes, revalidated against the repository after max age
+    RECIPE_CACHE_SIZE = 1024
+    RECIPE_CACHE_MAX_AGE_SECONDS = 5
+    RECIPE_CACHE_NEGATIVE_TTL_SECONDS = 10
+    # download charts of a remote recipe repository once and install them
+    # from this directory
+    CHART_CACHE = True
+    CHART_CACHE_DIR: str | Path = "./chart-cache"
     PROMETHEUS: str = "http://10.43.247.5:9090"
+    # resource metrics are scraped at most once in this interval
+    RESOURCE_MAX_AGE_SECONDS = 10
+    # pooled keep-alive connections to Tier1, Prometheus and recipe repository
+    HTTP_POOL_CONNECTIONS = 16  # number of hosts with a connection pool
+    HTTP_POOL_MAXSIZE = 8  # open connections per host
+    HTTP_POOL_BLOCK = False
+    HTTP_CONNECT_TIMEOUT_SECONDS = 3.05
+    HTTP_READ_TIMEOUT_SECONDS = 30
+    HTTP_RETRIES = 2
+    HTTP_RETRY_BACKOFF_SECONDS = 0.2
+    # manage the cluster with "kubectl" (and helm) subprocesses, or through
+    # the "kubernetes" API client (requires the kubernetes package)
+    CLUSTER_BACKEND = "kubectl"
+    # cache deployment peers from a watch instead of querying the cluster
+    PEER_CACHE = True
+    PEER_CACHE_RESYNC_SECONDS = 300
+    # keep backends installed ahead of time for recipes with a warm_pool size,
+    # pools are filled at startup for all recipes in a local repository and
+    # for the listed recipe uuids, as a remote repository can not be listed
+    WARM_POOL = True
+    WARM_POOL_WORKERS = 2
+    WARM_POOL_RECIPES: list[str] = []
+    # number of expired deployments torn down concurrently
+    EXPIRY_WORKERS = 4
+    # deploy requests with 'Prefer: respond-async' return a job to poll
+    DEPLOY_JOBS = True
+    DEPLOY_JOB_WORKERS = 4
+    DEPLOY_JOB_MAX_PENDING = 64
+    DEPLOY_JOB_TTL_SECONDS = 300
+    DEPLOY_JOB_MAX_WAIT_SECONDS = 25  # longest long-poll on a job
         
     # Carbon
     CARBON_ENERGY_REPORT_PATH = './carbon-data/energy.csv'
     CARBON_ENERGY_REPORT_RESET_INTERVAL_SECONDS = TimeUnit.DAY
+    # the energy daemon shares its samples through a shared memory ring,
+    # the csv is only written for offline analysis (or without a ring)
+    CARBON_ENERGY_RING = True
+    CARBON_ENERGY_RING_CAPACITY = TimeUnit.HOUR  # one sample per second
+    CARBON_ENERGY_REPORT_CSV = False
         
     # Experiment
     REPORT_TO_TIER1_INTERVAL_SECONDS = 15
@@ -116,20 +170,61 @@ def tier2_app_factory(**args) -> connexion.FlaskApp:
     # uuid
         
     flask_app.config["UUID"] = uuid4()
+    flask_app.config["http_session"] = session_from_config(flask_app.config)
     flask_app.config["deployment_repository"] = DeploymentRepository(
-        flask_app.config["RECIPES"]
+        flask_app.config["RECIPES"],
+        flask_app.config["http_session"],
+        recipe_cache=RecipeCache(
+            maxsize=flask_app.config["RECIPE_CACHE_SIZE"],
+            max_age=flask_app.config["RECIPE_CACHE_MAX_AGE_SECONDS"],
+            negative_ttl=flask_app.config["RECIPE_CACHE_NEGATIVE_TTL_SECONDS"],
+        ),
     )
+    if flask_app.config["CHART_CACHE"]:
+        repository = flask_app.config["deployment_repository"]
+        repository.chart_cache = ChartCache(
+            flask_app.config["CHART_CACHE_DIR"], flask_app.config["http_session"]
+        )
+        # loading a recipe starts fetching its chart
+        for recipe_uuid in repository.recipe_uuids():
+            try:
+                DeploymentRecipe.from_repo(repository, recipe_uuid)
+            except Exception:
+                logger.warning(f"Failed to load recipe {recipe_uuid}")
 
     # connect to local kubernetes cluster
     
     cluster = Cluster.connect(
-        flask_app.config.get("KUBECONFIG", ""), flask_app.config.get("KUBECONTEXT", "")
+        flask_app.config.get("KUBECONFIG", ""),
+        flask_app.config.get("KUBECONTEXT", ""),
+        flask_app.config["http_session"],
+        flask_app.config["CLUSTER_BACKEND"],
     )
     cluster.prometheus_url = (
         URL(flask_app.config["PROMETHEUS"]) / "api" / "v1" / "query"
     )
+    cluster.resource_max_age = flask_app.config["RESOURCE_MAX_AGE_SECONDS"]
+    cluster.expiry_workers = flask_app.config["EXPIRY_WORKERS"]
+    if flask_app.config["PEER_CACHE"]:
+        cluster.watch_peers(flask_app.config["PEER_CACHE_RESYNC_SECONDS"])
+    if flask_app.config["WARM_POOL"]:
+        cluster.warm_pool = WarmPool(
+            cluster.backend, max_workers=flask_app.config["WARM_POOL_WORKERS"]
+        )
+        cluster.warm_pool.fill_all(
+            flask_app.config["deployment_repository"],
+            [UUID(uuid) for uuid in flask_app.config["WARM_POOL_RECIPES"]],
+        )
+        atexit.register(cluster.warm_pool.drain)
     flask_app.config["K8S_CLUSTER"] = cluster
 
+    if flask_app.config["DEPLOY_JOBS"]:
+        flask_app.config["deploy_jobs"] = DeployJobs(
+            max_workers=flask_app.config["DEPLOY_JOB_WORKERS"],
+            max_pending=flask_app.config["DEPLOY_JOB_MAX_PENDING"],
+            ttl=flask_app.config["DEPLOY_JOB_TTL_SECONDS"],
+        )
+
     # start background jobs to expire deployments and report to tier1
     
     scheduler.init_app(flask_app)
@@ -139,14 +234,28 @@ def tier2_app_factory(**args) -> connexion.FlaskApp:
     
     # start daemons
     
-    logger.info(f"Starting carbon energy daemon and creating energy report at {flask_app.config['CARBON_ENERGY_REPORT_PATH']} ...")
-    daemon_registry.register(
-        energy_report, 
-        {
-            "path": flask_app.config["CARBON_ENERGY_REPORT_PATH"],
-            "reset_interval_seconds": flask_app.config["CARBON_ENERGY_REPORT_RESET_INTERVAL_SECONDS"],
-        }
-    )
+    energy_report_args = {
+        "reset_interval_seconds": flask_app.config[
+            "CARBON_ENERGY_REPORT_RESET_INTERVAL_SECONDS"
+        ],
+    }
+    if flask_app.config["CARBON_ENERGY_RING"]:
+        ring = EnergyRing.create(flask_app.config["CARBON_ENERGY_RING_CAPACITY"])
+        atexit.register(ring.unlink)
+        flask_app.config["energy_ring"] = ring
+        energy_report_args["ring_name"] = ring.name
+        logger.info(f"Starting carbon energy daemon with energy ring {ring.name} ...")
+    if (
+        flask_app.config["CARBON_ENERGY_REPORT_CSV"]
+        or not flask_app.config["CARBON_ENERGY_RING"]
+    ):
+        energy_report_path = flask_app.config["CARBON_ENERGY_REPORT_PATH"]
+        energy_report_args["path"] = energy_report_path
+        logger.info(
+            "Starting carbon energy daemon and creating energy report at "
+            f"{energy_report_path} ..."
+        )
+    daemon_registry.register(energy_report, energy_report_args)
     daemon_registry.start()
 
     # handle running behind reverse proxy (should this be made configurable?)
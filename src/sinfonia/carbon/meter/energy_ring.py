@@ -0,0 +1,122 @@
+"""Shared memory ring buffer of energy samples.
+
+The energy daemon runs in its own process and appends a record every second,
+the Tier2 server reads the most recent records when it reports. Records are
+exchanged through a multiprocessing.shared_memory segment without locks.
+There is a single writer, which stores a record and then bumps the record
+count. Readers copy the records they need and check the count again, when
+the writer wrapped around onto the copied records in the meantime they retry.
+
+Layout, all little endian,
+
+    header   magic (u64), capacity (u64), records written (u64)
+    records  capacity + 1 x (timestamp i8, average_watts f8, joules f8)
+
+The spare record is the one being written, so readers can always get the
+most recent capacity records.
+"""
+
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+
+MAGIC = 0x53464552_00000001  # "SFER", version 1
+HEADER_DTYPE = np.dtype([("magic", "<u8"), ("capacity", "<u8"), ("count", "<u8")])
+RECORD_DTYPE = np.dtype(
+    [("timestamp", "<i8"), ("average_watts", "<f8"), ("joules", "<f8")]
+)
+
+# readers give up when the writer keeps overwriting what they are copying
+MAX_READ_ATTEMPTS = 100
+
+
+class EnergyRing:
+    """Single writer, multiple reader ring of energy samples."""
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if self.header["magic"] != MAGIC:
+            raise ValueError(f"{shm.name} is not an energy ring")
+        self.capacity = int(self.header["capacity"])
+        self.slots = self.capacity + 1
+        self.records = np.ndarray(
+            (self.slots,),
+            dtype=RECORD_DTYPE,
+            buffer=shm.buf,
+            offset=HEADER_DTYPE.itemsize,
+        )
+
+    @classmethod
+    def create(cls, capacity: int = 3600, name: Optional[str] = None) -> "EnergyRing":
+        """Allocate a new ring, the creator removes it with unlink()."""
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        shm = SharedMemory(
+            name=name,
+            create=True,
+            size=HEADER_DTYPE.itemsize + (capacity + 1) * RECORD_DTYPE.itemsize,
+        )
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header["capacity"] = capacity
+        header["count"] = 0
+        header["magic"] = MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "EnergyRing":
+        """Open a ring created by another process.
+
+        The creator should start the processes that attach, they share its
+        resource tracker, which then only removes the ring once.
+        """
+        return cls(SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def count(self) -> int:
+        """Number of records written since the ring was created."""
+        return int(self.header["count"])
+
+    def append(self, timestamp: int, average_watts: float, joules: float) -> None:
+        """Store a record, only one process may write to a ring."""
+        count = int(self.header["count"])
+        self.records[count % self.slots] = (timestamp, average_watts, joules)
+        # publish the record after it is complete
+        self.header["count"] = count + 1
+
+    def last(self, n: int) -> np.ndarray:
+        """Copy of the most recent n (or fewer) records, oldest first."""
+        n = max(0, min(n, self.capacity))
+        for _ in range(MAX_READ_ATTEMPTS):
+            count = int(self.header["count"])
+            available = min(n, count)
+            start = count - available
+
+            indices = np.arange(start, count) % self.slots
+            records = self.records[indices]
+
+            # the record being written next must not land on what we copied
+            if int(self.header["count"]) < start + self.slots:
+                return records
+        raise RuntimeError("energy ring reader kept being overrun by the writer")
+
+    def sum_joules(self, n: int) -> float:
+        """Energy use in Joules over the most recent n records."""
+        return float(self.last(n)["joules"].sum())
+
+    def close(self) -> None:
+        # views into the buffer have to be released before it can be closed
+        del self.header, self.records
+        self.shm.close()
+
+    def unlink(self) -> None:
+        if self.owner:
+            self.shm.unlink()
@@ -1,5 +1,75 @@
-import pandas as pd
+import csv
+import os
+import queue
+import threading
+import time
 from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# bytes read at a time when scanning the energy csv from the end
+BLOCK_SIZE = 4096
+CSV_HEADER = ['timestamp', 'average_joules', 'summation_joules']
+
+
+class EnergyCsvWriter:
+    """Write energy samples to a csv file for offline analysis.
+
+    Rows are queued and written by a background thread, so the sampling loop
+    never waits on the disk. The file is truncated once it covers more than
+    reset_interval_seconds.
+    """
+
+    def __init__(
+            self,
+            path: str | Path,
+            reset_interval_seconds: float,
+            max_pending: int = 3600,
+    ):
+        self.path = Path(path)
+        self.reset_interval_seconds = reset_interval_seconds
+        self.rows: queue.Queue[Optional[Tuple[int, float, float]]] = queue.Queue(
+            max_pending
+        )
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, timestamp: int, average_watts: float, joules: float) -> None:
+        """Queue a row, drops it when the writer fell too far behind."""
+        try:
+            self.rows.put_nowait((timestamp, average_watts, joules))
+        except queue.Full:
+            pass
+
+    def close(self) -> None:
+        """Write the queued rows and stop the writer."""
+        self.rows.put(None)
+        self.thread.join()
+
+    def _open(self):
+        self.path.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+        f = open(self.path, 'w', encoding='utf-8')
+        csv.writer(f).writerow(CSV_HEADER)
+        return f
+
+    def _run(self) -> None:
+        f = self._open()
+        writer = csv.writer(f)
+        last_reset_ts = int(time.time())
+        try:
+            while True:
+                row = self.rows.get()
+                if row is None:
+                    break
+                if row[0] - last_reset_ts > self.reset_interval_seconds:
+                    f.close()
+                    f = self._open()
+                    writer = csv.writer(f)
+                    last_reset_ts = row[0]
+                writer.writerow(row)
+                if self.rows.empty():
+                    f.flush()
+        finally:
+            f.close()
 
 
 def sample_energy_joules(
@@ -8,6 +78,10 @@ def sample_energy_joules(
 ) -> float:
     """Get instantaneous system energy use in Joules via Intel RAPL.
     
+    The energy csv grows by a row every second, only the last rows are read
+    by scanning backwards from the end of the file, so the cost depends on
+    the period and not on the size of the file.
+
     Args:
         energy_csv_path: str | Path: Path to read energy CSV
         period_seconds - float: Number of seconds over which to measure total energy use [default: 1]
@@ -15,6 +89,42 @@ def sample_energy_joules(
     Returns:
         float: Average system energy use in Joules over the specified period.
     """
-    df = pd.read_csv(energy_csv_path, on_bad_lines="skip")
-    energy_joules_samples = df.tail(period_seconds).iloc[:, -1]
-    return energy_joules_samples.sum()
+    samples = int(period_seconds)
+    total = 0.0
+    if samples <= 0:
+        return total
+
+    with open(energy_csv_path, "rb") as f:
+        for line in _reversed_lines(f):
+            # last column of the data rows, skips the header and bad lines
+            try:
+                total += float(line.rsplit(b",", 1)[-1])
+            except ValueError:
+                continue
+            samples -= 1
+            if samples == 0:
+                break
+    return total
+
+
+def _reversed_lines(f: BinaryIO, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Complete lines of f from last to first, a trailing line without a
+    newline is still being written and skipped."""
+    pos = f.seek(0, os.SEEK_END)
+    # bytes after pos that are not yet split into lines
+    tail = b""
+    skip_last = True
+    while pos > 0:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        lines = (f.read(size) + tail).split(b"\n")
+        # the first line may continue in the previous block
+        tail = lines.pop(0)
+        if skip_last and lines:
+            lines.pop()
+            skip_last = False
+        for line in reversed(lines):
+            yield line.rstrip(b"\r")
+    if not skip_last:
+        yield tail.rstrip(b"\r")
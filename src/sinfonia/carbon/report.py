@@ -2,8 +2,10 @@ from dataclasses import dataclass, asdict
 from enum import IntEnum
 
 from pathlib import Path
+from typing import Optional
 
 from .meter import intel_rapl, obelix
+from .meter.energy_ring import EnergyRing
 from .unit_conv import joules_to_kwh
 from .types import EnergyReportMethodType
 from .simulation.measures import get_average_carbon_intensity_gco2_kwh
@@ -30,6 +32,7 @@ def from_simulation(
         energy_csv_path: str | Path,
         period_seconds: int,
         timestamp: int,
+        energy_ring: Optional[EnergyRing] = None,
 ) -> CarbonReport:
     """Return simulated carbon report given a timestamp.
     
@@ -44,6 +47,8 @@ def from_simulation(
         energy_csv_path: str | Path
         period_seconds: int - Period to sample energy
         timestamp - int: Unix timestamp to get carbon trace
+        energy_ring - EnergyRing: Shared memory samples of the energy daemon,
+            read instead of the energy csv
     
     Returns:
         CarbonReport: Carbon trace
@@ -53,7 +58,10 @@ def from_simulation(
     method = EnergyReportMethodType(method)
     match method:
         case EnergyReportMethodType.RAPL:
-            eu = intel_rapl.sample_energy_joules(energy_csv_path, period_seconds)
+            if energy_ring is not None:
+                eu = energy_ring.sum_joules(int(period_seconds))
+            else:
+                eu = intel_rapl.sample_energy_joules(energy_csv_path, period_seconds)
         case EnergyReportMethodType.OBELIX:
             eu = obelix.sample_energy_joules()
         case _:
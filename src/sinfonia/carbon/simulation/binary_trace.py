@@ -0,0 +1,180 @@
+"""Compact binary carbon trace format.
+
+Parsing a csv trace takes time and every process holds its own copy of the
+parsed data. A binary trace is opened with numpy.memmap instead, there is
+nothing to parse and processes that open the same file share the page cache.
+
+Layout, all integers little endian,
+
+    header   magic "SFCT", version (u16), reserved (u16),
+             samples (u64), signals (u32), padding (4 bytes)
+    names    signals x 32 bytes, utf-8 signal names padded with zeros
+             signals x 8 bytes, numpy dtype of the signal ("<f8", "|S16", ...)
+    data     samples x int64 timestamps, sorted
+             samples x values for every signal, padded to a multiple of 8 bytes
+
+Numbers keep their csv precision, float64 or int64, and text is stored as
+fixed width utf-8, so a sample reads back the same as from the csv trace.
+Version 1 traces stored every signal as float32 and had no dtypes.
+
+Traces are converted from csv with,
+
+    python -m src.sinfonia.carbon.simulation.binary_trace trace.csv trace.bin
+"""
+
+import argparse
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+MAGIC = b"SFCT"
+VERSION = 2
+HEADER = struct.Struct("<4sHHQI4x")
+NAME_WIDTH = 32
+DTYPE_WIDTH = 8
+
+
+def is_binary_trace(path: str | Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _column(values: Any) -> np.ndarray:
+    """Little endian array of values, text is encoded as utf-8 and missing
+    text is stored as an empty string."""
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        return values.astype("|b1")
+    if values.dtype.kind in "iu":
+        return values.astype("<i8")
+    if values.dtype.kind == "f":
+        return values.astype("<f8")
+    encoded = [b"" if pd.isna(value) else str(value).encode() for value in values]
+    width = max(map(len, encoded), default=0) or 1
+    return np.array(encoded, dtype=f"|S{width}")
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+def write_trace(
+    path: str | Path,
+    timestamps: np.ndarray,
+    signals: Dict[str, np.ndarray],
+) -> None:
+    """Write a binary trace, samples are sorted by timestamp.
+
+    The file is replaced atomically, processes that still have the previous
+    trace mapped keep reading the old data.
+    """
+    path = Path(path)
+    order = np.argsort(timestamps, kind="stable")
+    columns = {name: _column(values)[order] for name, values in signals.items()}
+
+    names = b""
+    dtypes = b""
+    for name, column in columns.items():
+        encoded = name.encode()
+        if len(encoded) > NAME_WIDTH:
+            raise ValueError(f"signal name {name} longer than {NAME_WIDTH} bytes")
+        names += encoded.ljust(NAME_WIDTH, b"\0")
+        dtype = column.dtype.str.encode()
+        if len(dtype) > DTYPE_WIDTH:
+            raise ValueError(f"signal {name} values are too wide")
+        dtypes += dtype.ljust(DTYPE_WIDTH, b"\0")
+
+    fd, tmpname = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(timestamps), len(signals)))
+            f.write(names)
+            f.write(dtypes)
+            f.write(np.asarray(timestamps, dtype="<i8")[order].tobytes())
+            for column in columns.values():
+                f.write(column.tobytes())
+                f.write(b"\0" * _padding(column.nbytes))
+        os.replace(tmpname, path)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def read_trace(path: str | Path) -> Dict[str, np.ndarray]:
+    """Map a binary trace, returns read-only arrays by column name with the
+    timestamps as the 'timestamp' column."""
+    with open(path, "rb") as f:
+        magic, version, _, samples, nsignals = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary carbon trace")
+        if version not in (1, VERSION):
+            raise ValueError(f"unsupported carbon trace version {version}")
+        names = [f.read(NAME_WIDTH).rstrip(b"\0").decode() for _ in range(nsignals)]
+        if version == 1:
+            dtypes = [np.dtype("<f4")] * nsignals
+        else:
+            dtypes = [
+                np.dtype(f.read(DTYPE_WIDTH).rstrip(b"\0").decode())
+                for _ in range(nsignals)
+            ]
+        offset = f.tell()
+
+    columns: Dict[str, np.ndarray] = {}
+    if samples == 0:
+        columns["timestamp"] = np.empty(0, dtype="<i8")
+        columns.update(
+            (name, np.empty(0, dtype=dtype)) for name, dtype in zip(names, dtypes)
+        )
+        return columns
+
+    columns["timestamp"] = np.memmap(
+        path, dtype="<i8", mode="r", offset=offset, shape=(samples,)
+    )
+    offset += samples * 8
+    for name, dtype in zip(names, dtypes):
+        columns[name] = np.memmap(
+            path, dtype=dtype, mode="r", offset=offset, shape=(samples,)
+        )
+        size = samples * dtype.itemsize
+        offset += size if version == 1 else size + _padding(size)
+    return columns
+
+
+def convert_csv(
+    csv_path: str | Path,
+    path: str | Path,
+    signals: Optional[List[str]] = None,
+) -> None:
+    """Convert a csv trace, by default every column is kept."""
+    trace = pd.read_csv(csv_path)
+    if signals is None:
+        signals = [name for name in trace.columns if name != "timestamp"]
+    write_trace(
+        path,
+        trace["timestamp"].to_numpy(),
+        {name: trace[name].to_numpy() for name in signals},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert a csv carbon trace")
+    parser.add_argument("csv", type=Path)
+    parser.add_argument("output", type=Path)
+    parser.add_argument(
+        "--signal",
+        action="append",
+        dest="signals",
+        help="column to keep, may be repeated (default: all columns)",
+    )
+    args = parser.parse_args()
+    convert_csv(args.csv, args.output, args.signals)
+
+
+if __name__ == "__main__":
+    main()
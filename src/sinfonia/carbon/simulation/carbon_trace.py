@@ -1,14 +1,21 @@
+from pathlib import Path
+
 import requests
 from yarl import URL
 
 from src.domain.logger import get_default_logger
-from .metadata import CARBON_TRACE_FILE_PATH
+from .binary_trace import convert_csv
+from .metadata import CARBON_TRACE_BINARY_PATH, CARBON_TRACE_FILE_PATH
 
 
 logger = get_default_logger()
 
 
-def fetch_from_github(zone: str, repo_url: str):
+def download_trace(
+        zone: str, repo_url: str, csv_path: Path, binary_path: Path
+) -> None:
+    """Download the trace of zone to csv_path and convert it to a binary
+    trace in binary_path."""
     filename = f"{zone}_2023_hourly.csv"
     url = (URL(repo_url) / filename).with_query({"raw": "true"})
     
@@ -16,5 +23,14 @@ def fetch_from_github(zone: str, repo_url: str):
     
     resp = requests.get(url)
     resp.raise_for_status()
-    with open(CARBON_TRACE_FILE_PATH, "w") as f:
+    with open(csv_path, "w") as f:
         f.write(resp.text)
+
+    # memory mapped by the trace readers, nothing to parse
+    convert_csv(csv_path, binary_path)
+
+
+def fetch_from_github(zone: str, repo_url: str):
+    download_trace(
+        zone, repo_url, CARBON_TRACE_FILE_PATH, CARBON_TRACE_BINARY_PATH
+    )
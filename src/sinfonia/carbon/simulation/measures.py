@@ -1,9 +1,6 @@
 from typing import Dict
-from bisect import bisect_left
 
-import pandas as pd
-
-from .metadata import CARBON_TRACE_FILE_PATH
+from .trace import get_trace
 
 from src.domain.logger import get_default_logger
 
@@ -13,10 +10,8 @@ logger = get_default_logger()
 
 def get_carbon_trace(timestamp: int) -> Dict:
     """Return carbon trace given zone and timestamp."""
-    h = pd.read_csv(CARBON_TRACE_FILE_PATH)
-    i = bisect_left(h['timestamp'], timestamp)
-    return h.iloc[i].to_dict()
+    return get_trace().row(timestamp)
 
 
 def get_average_carbon_intensity_gco2_kwh(timestamp: int) -> float:
-    return get_carbon_trace(timestamp)["carbon_intensity_gco2_kwh_direct"]
+    return get_trace().intensity(timestamp, interpolate=False)
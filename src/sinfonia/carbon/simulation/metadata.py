@@ -3,10 +3,9 @@ from typing import Dict, List
 from dataclasses import dataclass
 from pathlib import Path
 
-import pandas as pd
-
 
 CARBON_TRACE_FILE_PATH = Path("trace.csv")
+CARBON_TRACE_BINARY_PATH = Path("trace.bin")
 
 
 @dataclass(init=True, frozen=True)
@@ -16,8 +15,10 @@ class MetaData:
     
 
 def get_metadata() -> MetaData:
-    h = pd.read_csv(CARBON_TRACE_FILE_PATH)        
+    from .trace import get_trace
+
+    trace = get_trace()
     return MetaData(
-            start_date_unix=h['timestamp'].min(),
-            end_date_unix=h['timestamp'].max(),
+            start_date_unix=trace.start,
+            end_date_unix=trace.end,
         )
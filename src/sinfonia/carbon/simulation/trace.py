@@ -0,0 +1,179 @@
+"""Carbon trace loaded into memory.
+
+The trace csv is parsed once into NumPy arrays sorted by timestamp, lookups
+are a binary search. A binary trace is memory mapped instead of parsed. The
+file is replaced when Tier2 fetches a new trace, so the trace is reloaded
+when the modification time of the file changes. A binary trace converted
+from a csv trace is converted again when the csv trace is newer.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .binary_trace import convert_csv, is_binary_trace, read_trace
+from .metadata import CARBON_TRACE_BINARY_PATH, CARBON_TRACE_FILE_PATH
+
+
+INTENSITY_COLUMN = "carbon_intensity_gco2_kwh_direct"
+
+# seconds between checks whether the trace file changed
+RELOAD_CHECK_SECONDS = 1.0
+
+
+def _newer(path: Path, than: Path) -> bool:
+    """Whether path exists and was modified after than, or than is missing."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return mtime_ns > os.stat(than).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+@dataclass
+class CarbonTrace:
+    path: Path
+    # csv trace that the binary trace in path is converted from
+    source: Optional[Path] = None
+    # replaced as a whole on reload, readers take a reference once
+    columns: Dict[str, np.ndarray] = field(init=False, repr=False)
+    mtime_ns: int = field(init=False, default=-1)
+    checked: float = field(init=False, default=0.0)
+    lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.path = Path(self.path)
+        if self.source is not None:
+            self.source = Path(self.source)
+        self.load()
+
+    def load(self) -> None:
+        if self.source is not None and _newer(self.source, self.path):
+            convert_csv(self.source, self.path)
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        if is_binary_trace(self.path):
+            self.columns = read_trace(self.path)
+        else:
+            trace = pd.read_csv(self.path).sort_values("timestamp", kind="stable")
+            self.columns = {name: trace[name].to_numpy() for name in trace.columns}
+        self.mtime_ns = mtime_ns
+        self.checked = time.monotonic()
+
+    def reload_if_changed(self) -> bool:
+        """Reload when the trace file was modified, checked at most once
+        every RELOAD_CHECK_SECONDS."""
+        now = time.monotonic()
+        if now - self.checked < RELOAD_CHECK_SECONDS:
+            return False
+
+        with self.lock:
+            if now - self.checked < RELOAD_CHECK_SECONDS:
+                return False
+            self.checked = now
+            if os.stat(self.path).st_mtime_ns == self.mtime_ns and not (
+                self.source is not None and _newer(self.source, self.path)
+            ):
+                return False
+            self.load()
+            return True
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.columns["timestamp"]
+
+    @property
+    def start(self) -> int:
+        return int(self.timestamps[0])
+
+    @property
+    def end(self) -> int:
+        return int(self.timestamps[-1])
+
+    def index(self, timestamp: int) -> int:
+        """Index of the first sample at or after timestamp.
+
+        Raises IndexError when timestamp is past the end of the trace.
+        """
+        self.reload_if_changed()
+        return self._index(self.timestamps, timestamp)
+
+    @staticmethod
+    def _index(timestamps: np.ndarray, timestamp: int) -> int:
+        i = int(np.searchsorted(timestamps, timestamp, side="left"))
+        if i >= len(timestamps):
+            raise IndexError(f"timestamp {timestamp} past end of carbon trace")
+        return i
+
+    def row(self, timestamp: int) -> Dict[str, Any]:
+        """All columns of the first sample at or after timestamp."""
+        self.reload_if_changed()
+        columns = self.columns
+        i = self._index(columns["timestamp"], timestamp)
+        return {name: _scalar(column[i]) for name, column in columns.items()}
+
+    def intensity(
+        self,
+        timestamp: float,
+        column: str = INTENSITY_COLUMN,
+        interpolate: bool = True,
+    ) -> float:
+        """Value of column at timestamp.
+
+        Linearly interpolates between the surrounding (hourly) samples, or
+        returns the first sample at or after timestamp. Timestamps outside of
+        the trace get the first or last sample when interpolating.
+        """
+        self.reload_if_changed()
+        columns = self.columns
+        timestamps = columns["timestamp"]
+        if not interpolate:
+            return float(columns[column][self._index(timestamps, timestamp)])
+        return float(np.interp(timestamp, timestamps, columns[column]))
+
+    def range(
+        self,
+        start: int,
+        end: int,
+        column: str = INTENSITY_COLUMN,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values of the samples in [start, end)."""
+        self.reload_if_changed()
+        columns = self.columns
+        timestamps = columns["timestamp"]
+        lo, hi = np.searchsorted(timestamps, [start, end], side="left")
+        return timestamps[lo:hi], columns[column][lo:hi]
+
+
+def _scalar(value: Any) -> Any:
+    """Python scalar for NumPy scalar values, text of binary traces is utf-8."""
+    if isinstance(value, np.bytes_):
+        return value.decode()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+_traces: Dict[Path, CarbonTrace] = {}
+_traces_lock = threading.Lock()
+
+
+def get_trace(path: Optional[str | Path] = None) -> CarbonTrace:
+    """Shared carbon trace for path, loaded on first use. Defaults to the
+    binary trace, which is converted from the csv trace when it is missing or
+    older than the csv trace."""
+    source = None
+    if path is None:
+        path, source = CARBON_TRACE_BINARY_PATH, CARBON_TRACE_FILE_PATH
+    path = Path(path)
+    with _traces_lock:
+        trace = _traces.get(path)
+        if trace is None:
+            trace = _traces[path] = CarbonTrace(path, source)
+    return trace
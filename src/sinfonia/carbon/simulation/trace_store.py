@@ -0,0 +1,183 @@
+"""Carbon traces of many zones in one table.
+
+A Tier2 only loads the trace of its own zone. Ranking cloudlets by carbon
+intensity from Tier1, or simulations that sweep over all zones, need the
+traces of many zones at once. The store resamples every zone on the union of
+the trace timestamps into a single zones x samples table, so the intensity of
+any number of zones at a time is one binary search and a gather. A second
+table holds the next sample of every zone, so lookups without interpolation
+only return values that are actually in the trace of the zone.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .carbon_trace import download_trace
+from .trace import INTENSITY_COLUMN, CarbonTrace
+
+_Tables = Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray]
+
+
+@dataclass
+class CarbonTraceStore:
+    signal: str = INTENSITY_COLUMN
+    # zone traces as added, the table is rebuilt on the next query
+    traces: Dict[str, Tuple[np.ndarray, np.ndarray]] = field(
+        default_factory=dict, repr=False
+    )
+    lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+    # zone index, timestamps, zones x timestamps interpolated values and next
+    # samples, replaced as a whole
+    _table: Optional[_Tables] = field(init=False, repr=False, default=None)
+
+    @classmethod
+    def from_paths(
+        cls, paths: Mapping[str, str | Path], signal: str = INTENSITY_COLUMN
+    ) -> "CarbonTraceStore":
+        """Load the csv or binary trace of every zone."""
+        store = cls(signal)
+        for zone, path in paths.items():
+            store.add_trace(zone, CarbonTrace(Path(path)))
+        return store
+
+    @classmethod
+    def from_directory(
+        cls, directory: str | Path, signal: str = INTENSITY_COLUMN
+    ) -> "CarbonTraceStore":
+        """Load <zone>.bin traces, or <zone>.csv when there is no binary."""
+        paths: Dict[str, Path] = {}
+        for path in sorted(Path(directory).glob("*.csv")):
+            paths[path.stem] = path
+        for path in sorted(Path(directory).glob("*.bin")):
+            paths[path.stem] = path
+        return cls.from_paths(paths, signal)
+
+    @classmethod
+    def fetch_from_github(
+        cls,
+        zones: Sequence[str],
+        repo_url: str,
+        directory: str | Path,
+        signal: str = INTENSITY_COLUMN,
+    ) -> "CarbonTraceStore":
+        """Download the traces of zones to directory and load them."""
+        directory = Path(directory)
+        paths = {}
+        for zone in zones:
+            paths[zone] = directory / f"{zone}.bin"
+            download_trace(zone, repo_url, directory / f"{zone}.csv", paths[zone])
+        return cls.from_paths(paths, signal)
+
+    def add(self, zone: str, timestamps: np.ndarray, values: np.ndarray) -> None:
+        order = np.argsort(timestamps, kind="stable")
+        with self.lock:
+            self.traces[zone] = (
+                np.asarray(timestamps, dtype=np.int64)[order],
+                np.asarray(values, dtype=np.float64)[order],
+            )
+            self._table = None
+
+    def add_trace(self, zone: str, trace: CarbonTrace) -> None:
+        columns = trace.columns
+        self.add(zone, columns["timestamp"], columns[self.signal])
+
+    def remove(self, zone: str) -> None:
+        with self.lock:
+            del self.traces[zone]
+            self._table = None
+
+    @property
+    def zones(self) -> List[str]:
+        return list(self.table()[0])
+
+    def table(self) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+        """Zone index, shared timestamps and the zones x timestamps table."""
+        index, timestamps, values, _ = self._tables()
+        return index, timestamps, values
+
+    def _tables(self) -> _Tables:
+        table = self._table
+        if table is not None:
+            return table
+
+        with self.lock:
+            if self._table is None:
+                zones = {zone: i for i, zone in enumerate(self.traces)}
+                if self.traces:
+                    timestamps = np.unique(
+                        np.concatenate([ts for ts, _ in self.traces.values()])
+                    )
+                else:
+                    timestamps = np.empty(0, dtype=np.int64)
+
+                values = np.full((len(zones), len(timestamps)), np.nan)
+                steps = np.full((len(zones), len(timestamps)), np.nan)
+                for i, (ts, vs) in enumerate(self.traces.values()):
+                    if not len(ts):
+                        continue
+                    values[i] = np.interp(timestamps, ts, vs)
+                    # first sample of the zone at or after each timestamp
+                    following = np.searchsorted(ts, timestamps, side="left")
+                    steps[i] = vs[np.minimum(following, len(ts) - 1)]
+                self._table = (zones, timestamps, values, steps)
+            return self._table
+
+    def intensity(
+        self,
+        zones: Sequence[str],
+        timestamp: float,
+        interpolate: bool = True,
+    ) -> np.ndarray:
+        """Signal of zones at timestamp, NaN for unknown zones.
+
+        Interpolates linearly between samples, or takes the first sample of
+        each zone at or after timestamp. Timestamps outside of the traces are
+        clamped.
+        """
+        index, timestamps, values, steps = self._tables()
+        rows = np.array([index.get(zone, -1) for zone in zones], dtype=np.intp)
+        result = np.full(len(rows), np.nan)
+        if not len(timestamps):
+            return result
+
+        known = rows >= 0
+        rows = rows[known]
+        i = int(np.searchsorted(timestamps, timestamp, side="left"))
+
+        if not interpolate:
+            result[known] = steps[rows, min(i, len(timestamps) - 1)]
+        elif i == 0 or i == len(timestamps):
+            result[known] = values[rows, min(i, len(timestamps) - 1)]
+        elif timestamps[i] == timestamp:
+            result[known] = values[rows, i]
+        else:
+            t0, t1 = timestamps[i - 1], timestamps[i]
+            weight = (timestamp - t0) / (t1 - t0)
+            result[known] = (
+                values[rows, i - 1] * (1 - weight) + values[rows, i] * weight
+            )
+        return result
+
+    def intensities(
+        self, timestamp: float, interpolate: bool = True
+    ) -> Dict[str, float]:
+        """Signal of every zone at timestamp."""
+        zones = self.zones
+        return dict(zip(zones, self.intensity(zones, timestamp, interpolate)))
+
+    def series(
+        self, zones: Sequence[str], start: int, end: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Shared timestamps in [start, end) and the zones x timestamps
+        values, rows of unknown zones are NaN."""
+        index, timestamps, values = self.table()
+        lo, hi = np.searchsorted(timestamps, [start, end], side="left")
+        result = np.full((len(zones), hi - lo), np.nan)
+        for row, zone in enumerate(zones):
+            if zone in index:
+                result[row] = values[index[zone], lo:hi]
+        return timestamps[lo:hi], result
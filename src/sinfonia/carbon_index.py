@@ -0,0 +1,110 @@
+#
+# Sinfonia
+#
+# Ordering of known cloudlets by their reported carbon intensity
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Sorted index over the carbon intensity reported by cloudlets.
+
+Cloudlets are identified by their registry slot. The (carbon_intensity, slot)
+pairs are kept in a sorted list which is updated whenever a cloudlet reports,
+so the k greenest candidates can be found by walking the head of the list
+instead of sorting all cloudlets for every deployment request. Cloudlets that
+did not report a carbon intensity are kept separately and ordered last.
+
+Iterating copies the ordering in small chunks under the lock, so finding the
+k greenest cloudlets does not copy the whole index. When cloudlets report
+while we iterate, the walk continues after the last entry it returned.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Iterator
+
+from attrs import define, field
+
+# entries copied under the lock at a time while iterating
+ITER_CHUNK = 32
+
+
+@define
+class CarbonIndex:
+    """Incrementally updated ordering of cloudlet slots by carbon intensity."""
+
+    _ordered: list[tuple[float, int]] = field(init=False, factory=list)
+    _unknown: list[int] = field(init=False, factory=list)
+    _values: dict[int, float | None] = field(init=False, factory=dict)
+    # bumped on every change, iterators re-find their position when it moved
+    _generation: int = field(init=False, default=0)
+    # matchers walk the ordering while cloudlets report and expire
+    _lock: threading.RLock = field(init=False, factory=threading.RLock)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, slot: object) -> bool:
+        return slot in self._values
+
+    def add(self, slot: int, carbon_intensity: float | None) -> None:
+        """Add (or update) the carbon intensity of the cloudlet in slot."""
+        with self._lock:
+            self.remove(slot)
+
+            if carbon_intensity is None or not math.isfinite(carbon_intensity):
+                carbon_intensity = None
+                insort(self._unknown, slot)
+            else:
+                insort(self._ordered, (carbon_intensity, slot))
+            self._values[slot] = carbon_intensity
+            self._generation += 1
+
+    def remove(self, slot: int) -> None:
+        """Drop the cloudlet in slot, ignores unknown slots."""
+        with self._lock:
+            if slot not in self._values:
+                return
+
+            carbon_intensity = self._values.pop(slot)
+            if carbon_intensity is None:
+                del self._unknown[bisect_left(self._unknown, slot)]
+            else:
+                del self._ordered[bisect_left(self._ordered, (carbon_intensity, slot))]
+            self._generation += 1
+
+    def __iter__(self) -> Iterator[tuple[float | None, int]]:
+        """Yield (carbon_intensity, slot) from lowest to highest intensity,
+        followed by (None, slot) for cloudlets without a carbon intensity.
+
+        Concurrent updates keep the order and every slot is yielded at most
+        once, but a cloudlet that moved behind the walk is not yielded.
+        """
+        seen: set[int] = set()
+        for carbon_intensity, slot in self._walk(self._ordered):
+            if slot not in seen:
+                seen.add(slot)
+                yield carbon_intensity, slot
+        for slot in self._walk(self._unknown):
+            if slot not in seen:
+                seen.add(slot)
+                yield None, slot
+
+    def _walk(self, entries: list[Any]) -> Iterator[Any]:
+        """Yield the sorted entries in chunks copied under the lock."""
+        position, generation, last = 0, self._generation, None
+        while True:
+            with self._lock:
+                if generation != self._generation and last is not None:
+                    position = bisect_right(entries, last)
+                generation = self._generation
+                chunk = entries[position : position + ITER_CHUNK]
+            if not chunk:
+                return
+            position += len(chunk)
+            last = chunk[-1]
+            yield from chunk
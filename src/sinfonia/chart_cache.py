@@ -0,0 +1,135 @@
+#
+# Sinfonia
+#
+# Local cache of helm chart archives referenced by deployment recipes
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Content-addressed cache of helm chart archives.
+
+When the recipe repository is remote, the chart reference handed to helm is
+a URL and helm downloads the chart archive on every install. Charts are
+immutable once a version is released, so Tier2 downloads every chart only
+once and helm installs from the cached file.
+
+Archives are stored as `<chart>-<version>-<sha256>.tgz` in the cache directory.
+An index maps chart URLs to cached archives so that the cache survives a
+restart. Downloads run in the background and concurrent requests for the same
+chart wait for the same download.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from attrs import define, field
+from yarl import URL
+
+from .http_transport import http_session
+
+from src.domain.logger import get_default_logger
+
+logger = get_default_logger()
+
+INDEX = "index.json"
+
+
+@define
+class ChartCache:
+    cache_dir: Path = field(converter=Path)
+    # uses the default session when not set, downloads run outside of the
+    # application context
+    session: requests.Session | None = field(default=None, eq=False, repr=False)
+    max_workers: int = 2
+
+    _charts: dict[str, Future[Path]] = field(init=False, factory=dict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+    _executor: ThreadPoolExecutor = field(init=False)
+
+    @_executor.default
+    def _default_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="chart-cache"
+        )
+
+    def __attrs_post_init__(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            index = json.loads((self.cache_dir / INDEX).read_text())
+        except (OSError, ValueError):
+            index = {}
+
+        for url, filename in index.items():
+            path = self.cache_dir / filename
+            if path.is_file():
+                future: Future[Path] = Future()
+                future.set_result(path)
+                self._charts[url] = future
+
+    def pull(self, chart_ref: URL, chart_version: str) -> Future[Path]:
+        """Start downloading chart_ref unless it is cached or already being
+        downloaded. Failed downloads are retried on the next pull.
+        """
+        url = str(chart_ref)
+        with self._lock:
+            future = self._charts.get(url)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._executor.submit(self._download, url, chart_version)
+                self._charts[url] = future
+        return future
+
+    def get(self, chart_ref: URL, chart_version: str) -> Path:
+        """Path of the cached chart archive, waits for the download.
+
+        raises:
+        - requests.RequestException when the chart could not be downloaded.
+        """
+        return self.pull(chart_ref, chart_version).result()
+
+    def _download(self, url: str, chart_version: str) -> Path:
+        session = self.session if self.session is not None else http_session()
+        digest = hashlib.sha256()
+
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmpfile, session.get(url, stream=True) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=65536):
+                    digest.update(chunk)
+                    tmpfile.write(chunk)
+
+            # chart may be a subdirectory or a url, only keep the name
+            name = Path(chart_version).name
+            path = self.cache_dir / f"{name}-{digest.hexdigest()}.tgz"
+            os.replace(tmpname, path)
+        except BaseException:
+            logger.exception(f"[chart_cache] failed to download {url}")
+            os.unlink(tmpname)
+            raise
+
+        logger.info(f"[chart_cache] cached {url} as {path.name}")
+        with self._lock:
+            self._write_index(url, path)
+        return path
+
+    def _write_index(self, url: str, path: Path) -> None:
+        index = {
+            key: future.result().name
+            for key, future in self._charts.items()
+            if future.done() and future.exception() is None
+        }
+        index[url] = path.name
+
+        fd, tmpname = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        with os.fdopen(fd, "w") as tmpfile:
+            json.dump(index, tmpfile, indent=2)
+        os.replace(tmpname, self.cache_dir / INDEX)
@@ -0,0 +1,253 @@
+#
+# Sinfonia
+#
+# Registry of known cloudlets with columnar storage of their metrics
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Columnar cloudlet registry.
+
+Every registered cloudlet is assigned a dense slot id, slots of expired
+cloudlets are reused by the next registration. The per-cloudlet scalars that
+matchers rank on are kept in contiguous NumPy arrays indexed by slot, so a
+matcher can take a read-only view of a column instead of walking the Cloudlet
+objects attribute by attribute.
+
+The registry behaves as a mapping of cloudlet uuid to Cloudlet and keeps the
+spatial, network and carbon intensity indexes up to date as cloudlets report
+and expire. Reads return copies taken under the registry lock. A slot's
+generation changes when its cloudlet is removed, so a matcher that pinned the
+generations when it started can tell when a slot was freed or reused while it
+was matching.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from typing import Any, Iterable, Iterator, MutableMapping
+from uuid import UUID
+
+import numpy as np
+from attrs import define, field
+
+from .carbon_index import CarbonIndex
+from .cloudlets import Cloudlet
+from .location_index import LocationIndex
+from .network_index import NetworkIndex
+
+# registry columns that are filled from the resources reported by a cloudlet
+RESOURCE_COLUMNS = {
+    "carbon_intensity": "carbon_intensity_gco2_kwh",
+    "cpu_ratio": "cpu_ratio",
+    "mem_ratio": "mem_ratio",
+}
+COLUMNS = ("latitude", "longitude", *RESOURCE_COLUMNS, "last_update")
+
+INITIAL_CAPACITY = 64
+
+
+def _number(value: Any) -> float:
+    """Reported resource value as a float, NaN when missing or not a number."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return np.nan
+    return number if math.isfinite(number) else np.nan
+
+
+@define
+class CloudletRegistry(MutableMapping[UUID, Cloudlet]):
+    location_index: LocationIndex = field(factory=LocationIndex)
+    network_index: NetworkIndex = field(factory=NetworkIndex)
+    carbon_index: CarbonIndex = field(factory=CarbonIndex)
+
+    _slots: dict[UUID, int] = field(init=False, factory=dict)
+    _cloudlets: list[Cloudlet | None] = field(init=False, factory=list)
+    _free: list[int] = field(init=False, factory=list)
+    _active: np.ndarray = field(
+        init=False, factory=lambda: np.zeros(INITIAL_CAPACITY, dtype=bool)
+    )
+    _generations: np.ndarray = field(
+        init=False, factory=lambda: np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+    )
+    _columns: dict[str, np.ndarray] = field(
+        init=False,
+        factory=lambda: {name: np.full(INITIAL_CAPACITY, np.nan) for name in COLUMNS},
+    )
+    _lock: threading.RLock = field(init=False, factory=threading.RLock)
+
+    @classmethod
+    def from_cloudlets(
+        cls, cloudlets: Iterable[Cloudlet], **kwargs
+    ) -> CloudletRegistry:
+        registry = cls(**kwargs)
+        for cloudlet in cloudlets:
+            registry.add(cloudlet)
+        return registry
+
+    # mapping interface
+    def __getitem__(self, uuid: UUID) -> Cloudlet:
+        with self._lock:
+            cloudlet = self._cloudlets[self._slots[uuid]]
+        assert cloudlet is not None
+        return cloudlet
+
+    def __setitem__(self, uuid: UUID, cloudlet: Cloudlet) -> None:
+        if uuid != cloudlet.uuid:
+            raise KeyError(uuid)
+        self.add(cloudlet)
+
+    def __delitem__(self, uuid: UUID) -> None:
+        self.remove(uuid)
+
+    def __iter__(self) -> Iterator[UUID]:
+        with self._lock:
+            return iter(list(self._slots))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, uuid: object) -> bool:
+        return uuid in self._slots
+
+    def values(self) -> list[Cloudlet]:  # type: ignore[override]
+        """Snapshot of the registered cloudlets."""
+        return [cloudlet for _, cloudlet in self.items()]
+
+    def items(self) -> list[tuple[UUID, Cloudlet]]:  # type: ignore[override]
+        """Snapshot of the registered (uuid, cloudlet) pairs."""
+        with self._lock:
+            cloudlets = [self._cloudlets[slot] for slot in self._slots.values()]
+            return [
+                (uuid, cloudlet)
+                for uuid, cloudlet in zip(self._slots, cloudlets)
+                if cloudlet is not None
+            ]
+
+    # slot management
+    @property
+    def capacity(self) -> int:
+        """Number of slots in use or free, the length of column views."""
+        return len(self._cloudlets)
+
+    def _grow(self) -> None:
+        size = 2 * len(self._active)
+        self._active = np.resize(self._active, size)
+        self._active[len(self._cloudlets) :] = False
+        self._generations = np.resize(self._generations, size)
+        self._generations[len(self._cloudlets) :] = 0
+        for name, column in self._columns.items():
+            grown = np.full(size, np.nan)
+            grown[: len(column)] = column
+            self._columns[name] = grown
+
+    def add(self, cloudlet: Cloudlet) -> int:
+        """Register or update a cloudlet, returns the assigned slot."""
+        with self._lock:
+            slot = self._slots.get(cloudlet.uuid)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    slot = len(self._cloudlets)
+                    if slot == len(self._active):
+                        self._grow()
+                    self._cloudlets.append(None)
+                self._slots[cloudlet.uuid] = slot
+
+            self._cloudlets[slot] = cloudlet
+            self._active[slot] = True
+            self._store(slot, cloudlet)
+
+            self.location_index.add(cloudlet.uuid, cloudlet.locations)
+            self.network_index.add(slot, cloudlet)
+            self.carbon_index.add(slot, float(self._columns["carbon_intensity"][slot]))
+        return slot
+
+    def remove(self, uuid: UUID) -> None:
+        """Drop a cloudlet and release its slot for reuse."""
+        with self._lock:
+            slot = self._slots.pop(uuid)
+            self._cloudlets[slot] = None
+            self._active[slot] = False
+            self._generations[slot] += 1
+            for column in self._columns.values():
+                column[slot] = np.nan
+            self._free.append(slot)
+
+            self.location_index.remove(uuid)
+            self.network_index.remove(slot)
+            self.carbon_index.remove(slot)
+
+    def _store(self, slot: int, cloudlet: Cloudlet) -> None:
+        columns = self._columns
+        if cloudlet.locations:
+            columns["latitude"][slot], columns["longitude"][slot] = cloudlet.locations[
+                0
+            ].coordinate
+        else:
+            columns["latitude"][slot] = columns["longitude"][slot] = np.nan
+
+        for name, resource in RESOURCE_COLUMNS.items():
+            columns[name][slot] = _number(cloudlet.resources.get(resource))
+
+        columns["last_update"][slot] = (
+            cloudlet.last_update.timestamp()
+            if cloudlet.last_update is not None
+            else np.nan
+        )
+
+    def slot(self, uuid: UUID) -> int:
+        with self._lock:
+            return self._slots[uuid]
+
+    def cloudlet(self, slot: int, generation: int | None = None) -> Cloudlet:
+        """Cloudlet in slot, with a generation only if the slot was not
+        freed since that generation was pinned."""
+        with self._lock:
+            cloudlet = self._cloudlets[slot]
+            if cloudlet is None or (
+                generation is not None and self._generations[slot] != generation
+            ):
+                raise KeyError(slot)
+        return cloudlet
+
+    def covers(self, cloudlets: Iterable[Cloudlet]) -> bool:
+        """Check if all cloudlets are registered (and current) in this registry."""
+        with self._lock:
+            return all(
+                cloudlet.uuid in self._slots
+                and self._cloudlets[self._slots[cloudlet.uuid]] is cloudlet
+                for cloudlet in cloudlets
+            )
+
+    def pin(self) -> tuple[np.ndarray, np.ndarray]:
+        """Consistent copies of the active mask and the slot generations."""
+        with self._lock:
+            return self.active, self._view(self._generations)
+
+    # columnar access
+    def _view(self, array: np.ndarray) -> np.ndarray:
+        view = array[: self.capacity].copy()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def active(self) -> np.ndarray:
+        """Read-only copy of the mask of slots that hold a registered cloudlet."""
+        with self._lock:
+            return self._view(self._active)
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only copy of a per-slot column, NaN for unknown values."""
+        with self._lock:
+            return self._view(self._columns[name])
+
+    def expired(self, cutoff: float) -> list[UUID]:
+        """Uuids of cloudlets that have not reported since the cutoff timestamp."""
+        with self._lock:
+            stale = np.flatnonzero(self.column("last_update") < cutoff)
+            return [self.cloudlet(slot).uuid for slot in stale.tolist()]
@@ -11,7 +11,8 @@
 from __future__ import annotations
 
 import socket
-from concurrent.futures import Future
+import time
+from concurrent.futures import Executor, Future
 from ipaddress import IPv4Network, IPv6Network, ip_interface
 from typing import Any, List, Union
 from uuid import UUID, uuid4
@@ -26,7 +27,14 @@ from jsonschema import Draft202012Validator
 from yarl import URL
 
 from .client_info import ClientInfo
-from .geo_location import GeoLocation, geolocate
+from .geo_location import (
+    DistanceMode,
+    GeoLocation,
+    coordinates_array,
+    distances,
+    geolocate,
+)
+from .http_transport import http_session
 
 from src.domain.logger import get_default_logger
 
@@ -265,8 +273,14 @@ class Cloudlet:
         self,
         app_uuid: UUID,
         client_info: ClientInfo,
+        timeout: float | tuple[float, float] | None = None,
     ) -> Future:
-        """Initiate backend deployment on this cloudlet."""
+        """Initiate backend deployment on this cloudlet.
+        Timeout is passed to requests, when not specified the Tier1
+        DEPLOY_CONNECT_TIMEOUT_SECONDS and DEPLOY_TIMEOUT_SECONDS are used.
+        With DEPLOY_ASYNC, Tier2 is asked to deploy in the background and the
+        returned deployment job is long-polled until it completes.
+        """
 
         def deploy(
             url: str,
@@ -279,17 +293,58 @@ class Cloudlet:
                     headers["X-ClientIP"] = client_address
                 if client_location is not None:
                     headers["X-Location"] = f"{client_location[0]},{client_location[1]}"
-                r = requests.post(url, headers=headers)
+                if async_poll is not None:
+                    headers["Prefer"] = "respond-async"
+                start = time.monotonic()
+                r = session.post(url, headers=headers, timeout=timeout)
                 r.raise_for_status()
-                return r.json()
+                if r.status_code == 202:
+                    result = wait_for_job(URL(url).join(URL(r.headers["Location"])))
+                else:
+                    result = r.json()
+                if latency_stats is not None:
+                    latency_stats.record(self.uuid, time.monotonic() - start)
+                return result
             except requests.exceptions.RequestException:
                 logger.exception("Exception while forwarding request")
                 return []
             except Exception as e:
                 logger.exception(f"cloudlet Exception occurred {str(e)}")
 
+        def wait_for_job(job_url: URL) -> list[dict[str, Any]]:
+            assert async_poll is not None
+            deadline = time.monotonic() + async_poll[1]
+            while time.monotonic() < deadline:
+                r = session.get(
+                    str(job_url),
+                    params={"wait": async_poll[0]},
+                    timeout=(deploy_connect_timeout, async_poll[0] + 5),
+                )
+                r.raise_for_status()
+                job = r.json()
+                if job["status"] == "succeeded":
+                    return job["result"]
+                if job["status"] == "failed":
+                    logger.error(f"Deployment on {self.name} failed: {job['error']}")
+                    return []
+            logger.error(f"Deployment on {self.name} did not finish in time")
+            return []
+
         request_url = self.endpoint / str(app_uuid) / client_info.publickey.urlsafe
 
+        if timeout is None:
+            timeout = deploy_timeout()
+        deploy_connect_timeout = timeout[0] if isinstance(timeout, tuple) else timeout
+
+        async_poll: tuple[float, float] | None = None
+        if current_app.config.get("DEPLOY_ASYNC"):
+            async_poll = (
+                current_app.config.get("DEPLOY_ASYNC_POLL_SECONDS", 10),
+                current_app.config.get("DEPLOY_ASYNC_DEADLINE_SECONDS", 300),
+            )
+
+        session = http_session()
+        latency_stats = current_app.config.get("latency_stats")
         executor = current_app.config["executor"]
         return executor.submit(
             deploy,
@@ -300,6 +355,37 @@ class Cloudlet:
             else None,
         )
 
+    def release_async(
+        self,
+        app_uuid: UUID,
+        client_info: ClientInfo,
+        timeout: float | tuple[float, float] | None = None,
+        executor: Executor | None = None,
+        session: requests.Session | None = None,
+    ) -> Future:
+        """Delete a deployment on this cloudlet that is no longer needed.
+        Timeout, executor and session default to the ones of the Tier1
+        application, they have to be passed when called outside of the
+        application context.
+        """
+
+        def release(url: str) -> None:
+            try:
+                r = session.delete(url, timeout=timeout)
+                r.raise_for_status()
+            except requests.exceptions.RequestException:
+                logger.exception("Exception while releasing deployment")
+
+        request_url = self.endpoint / str(app_uuid) / client_info.publickey.urlsafe
+
+        if timeout is None:
+            timeout = deploy_timeout()
+        if executor is None:
+            executor = current_app.config["executor"]
+        if session is None:
+            session = http_session()
+        return executor.submit(release, str(request_url))
+
     def deploy(self, app_uuid: UUID, client_info: ClientInfo) -> dict[str, Any]:
         """Request backend deployment on this cloudlet."""
 
@@ -310,16 +396,19 @@ class Cloudlet:
 
         return result
 
-    def distance_from(self, location: GeoLocation) -> float | None:
+    def distance_from(
+        self,
+        location: GeoLocation,
+        mode: DistanceMode | str = DistanceMode.GEODESIC,
+    ) -> float | None:
         """Calculate closest distance to any cloudlet managed by this Tier 2 instance.
         Return distance in kilometers, or None when cloudlet location is unknown.
         """
-        closest = None
-        for cloudlet_location in self.locations:
-            distance = cloudlet_location - location
-            if closest is None or distance < closest:
-                closest = distance
-        return closest
+        if not self.locations:
+            return None
+        return float(
+            distances(location, coordinates_array(self.locations), mode).min()
+        )
 
     def summary(self) -> dict[str, Any]:
         """Returns json encodeable 'CloudletSummary'"""
@@ -340,7 +429,7 @@ class Cloudlet:
         def send(url, params) -> Future:
             """Send a post request to carbon_trace_timestamp endpoint on this cloudlet"""
             try:
-                r = requests.post(url, params=params)
+                r = http_session().post(url, params=params)
                 r.raise_for_status()
                 return
             except Exception as e:
@@ -350,6 +439,16 @@ class Cloudlet:
         send(str(request_url), {"carbon_trace_timestamp": carbon_trace_timestamp})
 
 
+def deploy_timeout() -> tuple[float, float] | None:
+    """(connect, read) timeout for deployment requests from Tier1 config."""
+    config = current_app.config
+    read_timeout = config.get("DEPLOY_TIMEOUT_SECONDS")
+    if read_timeout is None:
+        return None
+    connect_timeout = config.get("DEPLOY_CONNECT_TIMEOUT_SECONDS", read_timeout)
+    return float(connect_timeout), float(read_timeout)
+
+
 def load(stream):
     """Load known cloudlets from configuration file."""
     validator = Draft202012Validator(CLOUDLET_SCHEMA)
@@ -13,8 +13,10 @@ from __future__ import annotations
 import ipaddress
 import json
 import math
-import random
-from ipaddress import IPv4Address
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import IPv4Address, IPv6Address, ip_address
 from typing import Any, Iterator, Sequence
 from uuid import UUID
 
@@ -22,17 +24,22 @@ import pendulum
 import requests
 from attrs import define, field
 from connexion.exceptions import ProblemException
-from plumbum.cmd import helm, kubectl
-from plumbum.commands.base import BaseCommand
-from plumbum.commands.processes import ProcessExecutionError
 from requests.exceptions import RequestException
 from wireguard_tools import WireguardKey
 from yarl import URL
 from io import StringIO
 
+from .address_allocator import AddressAllocator
+from .cluster_backend import ClusterBackend, ClusterBackendError, connect_backend
 from .deployment import CLIENT_NETWORK, Deployment
+from .deployment_expiry import ExpirySweep
+from .deployment_expiry import sweep as expiry_sweep
 from .deployment_recipe import DeploymentRecipe
 from .geo_location import GeoLocation
+from .http_transport import http_session
+from .latency_stats import LatencyStats
+from .peer_cache import PEER_SELECTOR, PeerCache
+from .warm_pool import WarmPool
 from .cloudlets import load
 
 from src.lib.time import TimeUnit
@@ -55,9 +62,8 @@ LEASE_DURATION = 15 * TimeUnit.MINUTE
 
 @define
 class Cluster:
-    # bound commands using the current cluster config and context
-    kubectl: BaseCommand = field()
-    helm: BaseCommand = field()
+    # access to the cluster, through kubectl/helm or the kubernetes api
+    backend: ClusterBackend = field()
 
     # tunnel public key and endpoint information
     tunnel_public_key: WireguardKey = field(init=False)
@@ -72,73 +78,123 @@ class Cluster:
     # right cluster.
     prometheus_url: URL = field()
 
+    # keep-alive connections to prometheus, queries run from background jobs
+    # without an application context so the session is resolved up front.
+    session: requests.Session = field(factory=http_session, eq=False, repr=False)
+
+    # watch based cache of deployment peers, lookups query the backend when unset
+    peer_cache: PeerCache | None = field(default=None, eq=False, repr=False)
+
+    # pre-installed backends for recipes that request a warm pool
+    warm_pool: WarmPool | None = field(default=None, eq=False, repr=False)
+
+    # the reporting job and the resources endpoint share a resource scrape
+    # that is no older than resource_max_age seconds
+    resource_max_age: float = field(default=10.0, eq=False, repr=False)
+    resource_latency: LatencyStats = field(
+        factory=lambda: LatencyStats(min_samples=1), eq=False, repr=False
+    )
+    _resources: tuple[float, dict[str, float]] | None = field(
+        init=False, default=None, eq=False, repr=False
+    )
+    _resources_lock: threading.Lock = field(
+        init=False, factory=threading.Lock, eq=False, repr=False
+    )
+
+    # number of deployments torn down concurrently when expiring
+    expiry_workers: int = field(default=4, eq=False, repr=False)
+
+    # client addresses of deployments, seeded from the existing peers
+    client_addresses: AddressAllocator = field(init=False, eq=False, repr=False)
+
     @classmethod
-    def connect(cls, kubeconfig: str = "", kubecontext: str = "") -> Cluster:
+    def connect(
+        cls,
+        kubeconfig: str = "",
+        kubecontext: str = "",
+        session: requests.Session | None = None,
+        backend: str = "kubectl",
+    ) -> Cluster:
         kcfg = "" if not kubeconfig else kubeconfig
         kctx = "" if not kubecontext else kubecontext
         
         return cls(
-            kubectl=kubectl[f"--kubeconfig={kcfg}", f"--context={kctx}"],
-            helm=helm[f"--kubeconfig={kcfg}", f"--kube-context={kctx}"],
+            backend=connect_backend(backend, kcfg, kctx),
+            session=session if session is not None else http_session(),
         )
 
     @tunnel_public_key.default
     def _tunnel_public_key(self) -> WireguardKey:
         try:
-            key = self.kubectl(
-                "get",
-                "node",
-                "-o",
-                r"jsonpath={.items[0].metadata.annotations.kilo\.squat\.ai/key}",
-            ).strip()
+            key = self.backend.node_annotation("kilo.squat.ai/key")
             return WireguardKey(key)
-        except ProcessExecutionError:
+        except (ClusterBackendError, ValueError):
             # fake it until we break it
             return WireguardKey.generate().public_key()
 
     @tunnel_endpoint.default
     def _tunnel_endpoint(self) -> str:
         try:
-            return self.kubectl(
-                "get",
-                "node",
-                "-o",
-                r"jsonpath={.items[0].metadata.annotations.kilo\.squat\.ai/endpoint}",
-            ).strip()
-        except ProcessExecutionError:
+            return self.backend.node_annotation("kilo.squat.ai/endpoint")
+        except ClusterBackendError:
             return ""
 
     @kubedns_address.default
     def _kubedns_address(self) -> str:
         try:
-            return self.kubectl(
-                "-n",
-                "kube-system",
-                "get",
-                "service",
-                "kube-dns",
-                "-o",
-                "jsonpath={.spec.clusterIP}",
-            ).strip()
-        except ProcessExecutionError:
+            return self.backend.service_ip("kube-system", "kube-dns")
+        except ClusterBackendError:
             return "8.8.8.8"
 
+    @client_addresses.default
+    def _client_addresses(self) -> AddressAllocator:
+        allocator = AddressAllocator(CLIENT_NETWORK)
+        allocator.sync(self._client_addresses_in_use())
+        return allocator
+
     @prometheus_url.default
     def _prometheus_url(self) -> URL:
         return URL(
             "http://kube-prometheus-stack-prometheus.monitoring:9090/api/v1/query"
         )
 
+    def watch_peers(self, resync_seconds: float = 300.0) -> PeerCache:
+        """Start caching deployment peers, used by get_peers once synced."""
+        self.peer_cache = PeerCache(self.backend, resync_seconds=resync_seconds)
+        self.peer_cache.start()
+        return self.peer_cache
+
     def get_peers(self, *args: str) -> list[dict[str, Any]]:
+        if self.peer_cache is not None:
+            peers = self.peer_cache.select(*args)
+            if peers is not None:
+                return peers
+
         selector = ",".join(args)
         try:
-            result = self.kubectl("get", "peer", "-o", "json", "-l", selector)
-            return json.loads(result)["items"]
-        except ProcessExecutionError:
+            return self.backend.list_peers(selector)["items"]
+        except ClusterBackendError:
             return []
 
+    def has_peer(self, name: str) -> bool:
+        if self.peer_cache is not None and self.peer_cache.synced:
+            return self.peer_cache.get(name) is not None
+        return self.backend.has_peer(name)
+
+    def apply_peer(self, manifest: dict[str, Any]) -> dict[str, Any]:
+        """Create or update a peer, returns the resulting object."""
+        peer = self.backend.apply_peer(manifest)
+        if self.peer_cache is not None:
+            self.peer_cache.apply(peer)
+        return peer
+
+    def delete_peer(self, name: str) -> None:
+        self.backend.delete_peer(name)
+        if self.peer_cache is not None:
+            self.peer_cache.delete(name)
+
     def deployments(self) -> Iterator[Deployment]:
-        for ns in self.get_peers("findcloudlet.org=deployment"):
+        for ns in self.get_peers(PEER_SELECTOR):
             yield Deployment.from_manifest(self, ns)
 
     def get(
@@ -181,47 +237,90 @@ class Cluster:
             client_public_key=key,
         )
 
+    def _client_addresses_in_use(
+        self, peers: list[dict[str, Any]] | None = None
+    ) -> Iterator[IPv4Address | IPv6Address]:
+        if peers is None:
+            peers = self.get_peers(PEER_SELECTOR)
+        for peer in peers:
+            try:
+                yield ip_address(peer["metadata"]["labels"]["findcloudlet.org/client"])
+            except (KeyError, ValueError):
+                pass
+
     def get_unique_client_address(self) -> IPv4Address:
         """Find an unused address to assign to a client"""
         while True:
-            hosts = list(CLIENT_NETWORK.hosts())
-            for client_ip in random.sample(hosts, 32):
-                ns_list = self.get_peers(f"findcloudlet.org/client={client_ip}")
-                if not ns_list:
-                    assert isinstance(client_ip, IPv4Address)
-                    return client_ip
-            print("Unable to find unique client ip in 32 tries, resampling candidates")
+            try:
+                client_ip = self.client_addresses.allocate()
+            except ValueError:
+                raise ProblemException(
+                    503, "Service Unavailable", "No client addresses available"
+                )
+
+            # another Tier2 replica sharing the cluster may have assigned it
+            if not self.get_peers(f"findcloudlet.org/client={client_ip}"):
+                assert isinstance(client_ip, IPv4Address)
+                return client_ip
+            self.client_addresses.confirm(client_ip)
 
     def get_resources(self) -> dict[str, float]:
-        resources: dict[str, float] = {}
+        """Cluster resource metrics, scraped at most once every
+        resource_max_age seconds. Concurrent callers share a scrape.
+        """
+        with self._resources_lock:
+            if self._resources is not None:
+                scraped, resources = self._resources
+                if time.monotonic() - scraped < self.resource_max_age:
+                    return dict(resources)
+
+            resources = self._scrape_resources()
+            self._resources = (time.monotonic(), resources)
+            return dict(resources)
+
+    def _scrape_resources(self) -> dict[str, float]:
+        with ThreadPoolExecutor(
+            max_workers=len(RESOURCE_QUERIES), thread_name_prefix="prometheus"
+        ) as executor:
+            metrics = executor.map(self._query_resource, RESOURCE_QUERIES)
+            resources = {
+                resource: metric
+                for resource, metric in zip(RESOURCE_QUERIES, metrics)
+                if metric is not None
+            }
+        logger.debug(
+            "[cluster] resource query latency %s", self.resource_latency.summary()
+        )
+        return resources
 
-        for resource in RESOURCE_QUERIES:
-            try:
-                r = requests.post(
-                    str(self.prometheus_url),
-                    data={
-                        "query": f"scalar({RESOURCE_QUERIES[resource]})",
-                    },
-                )
-                r.raise_for_status()
+    def _query_resource(self, resource: str) -> float | None:
+        try:
+            start = time.monotonic()
+            r = self.session.post(
+                str(self.prometheus_url),
+                data={
+                    "query": f"scalar({RESOURCE_QUERIES[resource]})",
+                },
+            )
+            r.raise_for_status()
+            self.resource_latency.record(resource, time.monotonic() - start)
 
-                result = r.json()
-                assert result["status"] == "success"
-                assert result["data"]["resultType"] == "scalar"
+            result = r.json()
+            assert result["status"] == "success"
+            assert result["data"]["resultType"] == "scalar"
 
-                metric = float(result["data"]["result"][1])
-                if math.isfinite(metric):
-                    resources[resource] = metric
+            metric = float(result["data"]["result"][1])
+            if math.isfinite(metric):
+                return metric
 
-            except (RequestException, AssertionError, ValueError):
-                logger.exception(f"Failed to retrieve {resource}")
-                pass
+        except (RequestException, AssertionError, ValueError):
+            logger.exception(f"Failed to retrieve {resource}")
 
-        return resources
+        return None
 
     def _active_peers(self, lease_duration: int) -> Sequence[WireguardKey]:
         try:
-            r = requests.post(
+            r = self.session.post(
                 str(self.prometheus_url),
                 data=dict(
                     query=(
@@ -245,14 +344,14 @@ class Cluster:
             logger.exception("Failed to retrieve active peers")
             return []
 
-    def expire_inactive_deployments(self) -> None:
+    def expire_inactive_deployments(self) -> ExpirySweep:
         cutoff = pendulum.now().subtract(seconds=LEASE_DURATION)
-        active_peers = self._active_peers(LEASE_DURATION)
-
-        for deployment in self.deployments():
-            if (
-                deployment.created < cutoff
-                and deployment.client_public_key not in active_peers
-            ):
-                logger.info(f"Expiring {deployment.name}")
-                deployment.expire()
+        active_peers = set(self._active_peers(LEASE_DURATION))
+        peers = self.get_peers(PEER_SELECTOR)
+
+        # pick up addresses assigned or released by other Tier2 replicas
+        self.client_addresses.sync(self._client_addresses_in_use(peers))
+
+        return expiry_sweep(
+            self, peers, active_peers, cutoff, max_workers=self.expiry_workers
+        )
@@ -0,0 +1,572 @@
+#
+# Sinfonia
+#
+# Backends to manage deployments on a kubernetes cluster
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Pluggable access to the kubernetes cluster of a Tier2 cloudlet.
+
+The Cluster and Deployment classes only use the operations defined by the
+ClusterBackend protocol to query and manage kilo Peer objects, namespaces and
+helm releases.
+
+- KubectlBackend runs kubectl and helm, every call spawns a process which
+  parses the kubeconfig and sets up a new connection to the API server.
+- KubernetesApiBackend uses the (optional) kubernetes client package and
+  reuses a single authenticated connection. There is no API for helm, so
+  charts are still installed with the helm command.
+- FakeBackend keeps everything in memory and counts the calls made, which is
+  useful to test and measure deployments without a cluster.
+
+Backends raise ClusterBackendError when an operation fails.
+"""
+
+from __future__ import annotations
+
+import codecs
+import copy
+import json
+import queue
+import subprocess
+import threading
+import time
+from collections import Counter
+from tempfile import NamedTemporaryFile
+from typing import Any, Iterable, Iterator, Protocol
+
+import yaml
+from attrs import define, field
+from plumbum import local
+from plumbum.commands.base import BaseCommand
+from plumbum.commands.processes import ProcessExecutionError
+
+PEER_GROUP = "kilo.squat.ai"
+PEER_VERSION = "v1alpha1"
+PEER_PLURAL = "peers"
+
+Manifest = dict[str, Any]
+
+
+class ClusterBackendError(Exception):
+    pass
+
+
+class PeerWatch(Protocol):
+    """Iterable of watch events, {"type": "ADDED", "object": {...}}."""
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class ClusterBackend(Protocol):
+    def node_annotation(self, annotation: str) -> str:
+        """Value of an annotation on the (first) cluster node."""
+        ...
+
+    def service_ip(self, namespace: str, name: str) -> str:
+        ...
+
+    def list_peers(self, selector: str) -> Manifest:
+        """List of peers matching the label selector, with the
+        resourceVersion of the listing in its metadata.
+        """
+        ...
+
+    def has_peer(self, name: str) -> bool:
+        ...
+
+    def apply_peer(self, manifest: Manifest) -> Manifest:
+        """Create or update a peer, returns the resulting object."""
+        ...
+
+    def delete_peer(self, name: str) -> None:
+        """Delete a peer, ignores peers that do not exist."""
+        ...
+
+    def watch_peers(self, selector: str, timeout_seconds: float) -> PeerWatch:
+        """Watch peers matching the label selector, the watch stops after
+        timeout_seconds or when it is closed.
+        """
+        ...
+
+    def install(self, name: str, chart_ref: str, values: dict[str, Any]) -> None:
+        """Install helm chart as release name in namespace name."""
+        ...
+
+    def uninstall(self, name: str) -> None:
+        ...
+
+    def delete_namespace(self, name: str) -> None:
+        ...
+
+
+def iter_json(chunks: Iterable[str]) -> Iterator[Any]:
+    """Decode a stream of concatenated JSON values, as output by kubectl
+    watch, where values may be split across chunks.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                break
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break  # wait for the rest of the value
+            yield value
+            buffer = buffer[end:]
+
+
+def _helm_install(
+    helm: BaseCommand, name: str, chart_ref: str, values: dict[str, Any]
+) -> None:
+    with NamedTemporaryFile("w", suffix=".yaml") as f:
+        yaml.dump(values, f)
+        f.flush()
+        helm(
+            "install",
+            "--namespace",
+            name,
+            "--create-namespace",
+            "--values",
+            f.name,
+            "--replace",
+            name,
+            chart_ref,
+        )
+
+
+#
+# kubectl / helm subprocesses
+#
+
+
+@define
+class _KubectlWatch:
+    process: subprocess.Popen
+    timer: threading.Timer
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        assert self.process.stdout is not None
+        decoder = codecs.getincrementaldecoder("utf-8")()
+
+        def chunks() -> Iterator[str]:
+            while chunk := self.process.stdout.read1(65536):  # type: ignore
+                yield decoder.decode(chunk)
+
+        return iter_json(chunks())
+
+    def close(self) -> None:
+        self.timer.cancel()
+        self.process.terminate()
+        self.process.wait()
+
+
+@define
+class KubectlBackend:
+    # bound commands using the current cluster config and context
+    kubectl: BaseCommand
+    helm: BaseCommand
+
+    @classmethod
+    def connect(cls, kubeconfig: str = "", kubecontext: str = "") -> KubectlBackend:
+        return cls(
+            kubectl=local["kubectl"][
+                f"--kubeconfig={kubeconfig}", f"--context={kubecontext}"
+            ],
+            helm=local["helm"][
+                f"--kubeconfig={kubeconfig}", f"--kube-context={kubecontext}"
+            ],
+        )
+
+    def _run(self, command: BaseCommand, *args: str, **kwargs: Any) -> str:
+        try:
+            return command(*args, **kwargs)
+        except ProcessExecutionError as e:
+            raise ClusterBackendError(str(e)) from e
+
+    def node_annotation(self, annotation: str) -> str:
+        jsonpath = annotation.replace(".", r"\.")
+        return self._run(
+            self.kubectl,
+            "get",
+            "node",
+            "-o",
+            f"jsonpath={{.items[0].metadata.annotations.{jsonpath}}}",
+        ).strip()
+
+    def service_ip(self, namespace: str, name: str) -> str:
+        return self._run(
+            self.kubectl,
+            "-n",
+            namespace,
+            "get",
+            "service",
+            name,
+            "-o",
+            "jsonpath={.spec.clusterIP}",
+        ).strip()
+
+    def list_peers(self, selector: str) -> Manifest:
+        return json.loads(
+            self._run(self.kubectl, "get", "peer", "-o", "json", "-l", selector)
+        )
+
+    def has_peer(self, name: str) -> bool:
+        retcode, _, _ = self.kubectl.run(
+            ["get", "peer", name, "-o", "name"], retcode=None
+        )
+        return retcode == 0
+
+    def apply_peer(self, manifest: Manifest) -> Manifest:
+        command = self.kubectl["apply", "-o", "json", "-f", "-"] << json.dumps(manifest)
+        return json.loads(self._run(command))
+
+    def delete_peer(self, name: str) -> None:
+        self.kubectl("delete", "peer", name, retcode=None)
+
+    def watch_peers(self, selector: str, timeout_seconds: float) -> PeerWatch:
+        process = self.kubectl.popen(
+            [
+                "get",
+                "peer",
+                "-l",
+                selector,
+                "--watch",
+                "--output-watch-events",
+                "-o",
+                "json",
+            ],
+            stdin=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timer = threading.Timer(timeout_seconds, process.terminate)
+        timer.daemon = True
+        timer.start()
+        return _KubectlWatch(process, timer)
+
+    def install(self, name: str, chart_ref: str, values: dict[str, Any]) -> None:
+        try:
+            _helm_install(self.helm, name, chart_ref, values)
+        except ProcessExecutionError as e:
+            raise ClusterBackendError(str(e)) from e
+
+    def uninstall(self, name: str) -> None:
+        self.helm("uninstall", "--namespace", name, name, retcode=None)
+
+    def delete_namespace(self, name: str) -> None:
+        self.kubectl("delete", "namespace", name, retcode=None)
+
+
+#
+# kubernetes python client
+#
+
+
+@define
+class _ApiWatch:
+    watch: Any
+    events: Iterator[dict[str, Any]]
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self.events)
+
+    def close(self) -> None:
+        self.watch.stop()
+
+
+@define
+class KubernetesApiBackend:
+    api_client: Any
+    helm: BaseCommand
+    _client: Any = field(init=False, repr=False)
+    _core: Any = field(init=False, repr=False)
+    _custom: Any = field(init=False, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        from kubernetes import client
+
+        self._client = client
+        self._core = client.CoreV1Api(self.api_client)
+        self._custom = client.CustomObjectsApi(self.api_client)
+
+    @classmethod
+    def connect(
+        cls, kubeconfig: str = "", kubecontext: str = ""
+    ) -> KubernetesApiBackend:
+        try:
+            from kubernetes import client, config
+        except ImportError:
+            raise ClusterBackendError(
+                "The kubernetes backend requires the 'kubernetes' package"
+            )
+
+        if kubeconfig or kubecontext:
+            api_client = config.new_client_from_config(
+                config_file=kubeconfig or None, context=kubecontext or None
+            )
+        else:
+            try:
+                config.load_incluster_config()
+            except config.ConfigException:
+                config.load_kube_config()
+            api_client = client.ApiClient()
+
+        helm = local["helm"]
+        if kubeconfig:
+            helm = helm[f"--kubeconfig={kubeconfig}"]
+        if kubecontext:
+            helm = helm[f"--kube-context={kubecontext}"]
+        return cls(api_client, helm)
+
+    def _call(self, method, *args: Any, missing_ok: bool = False, **kwargs: Any):
+        try:
+            return method(*args, **kwargs)
+        except self._client.ApiException as e:
+            if missing_ok and e.status == 404:
+                return None
+            raise ClusterBackendError(f"{e.status} {e.reason}") from e
+
+    def node_annotation(self, annotation: str) -> str:
+        nodes = self._call(self._core.list_node, limit=1).items
+        if not nodes:
+            return ""
+        return (nodes[0].metadata.annotations or {}).get(annotation, "")
+
+    def service_ip(self, namespace: str, name: str) -> str:
+        service = self._call(self._core.read_namespaced_service, name, namespace)
+        return service.spec.cluster_ip
+
+    def list_peers(self, selector: str) -> Manifest:
+        return self._call(
+            self._custom.list_cluster_custom_object,
+            PEER_GROUP,
+            PEER_VERSION,
+            PEER_PLURAL,
+            label_selector=selector,
+        )
+
+    def has_peer(self, name: str) -> bool:
+        peer = self._call(
+            self._custom.get_cluster_custom_object,
+            PEER_GROUP,
+            PEER_VERSION,
+            PEER_PLURAL,
+            name,
+            missing_ok=True,
+        )
+        return peer is not None
+
+    def apply_peer(self, manifest: Manifest) -> Manifest:
+        try:
+            return self._custom.create_cluster_custom_object(
+                PEER_GROUP, PEER_VERSION, PEER_PLURAL, manifest
+            )
+        except self._client.ApiException as e:
+            if e.status != 409:
+                raise ClusterBackendError(f"{e.status} {e.reason}") from e
+
+        # already exists, update it in place
+        return self._call(
+            self._custom.patch_cluster_custom_object,
+            PEER_GROUP,
+            PEER_VERSION,
+            PEER_PLURAL,
+            manifest["metadata"]["name"],
+            manifest,
+        )
+
+    def delete_peer(self, name: str) -> None:
+        self._call(
+            self._custom.delete_cluster_custom_object,
+            PEER_GROUP,
+            PEER_VERSION,
+            PEER_PLURAL,
+            name,
+            missing_ok=True,
+        )
+
+    def watch_peers(self, selector: str, timeout_seconds: float) -> PeerWatch:
+        from kubernetes import watch
+
+        w = watch.Watch()
+        events = w.stream(
+            self._custom.list_cluster_custom_object,
+            PEER_GROUP,
+            PEER_VERSION,
+            PEER_PLURAL,
+            label_selector=selector,
+            timeout_seconds=int(timeout_seconds),
+        )
+        return _ApiWatch(w, events)
+
+    def install(self, name: str, chart_ref: str, values: dict[str, Any]) -> None:
+        try:
+            _helm_install(self.helm, name, chart_ref, values)
+        except ProcessExecutionError as e:
+            raise ClusterBackendError(str(e)) from e
+
+    def uninstall(self, name: str) -> None:
+        self.helm("uninstall", "--namespace", name, name, retcode=None)
+
+    def delete_namespace(self, name: str) -> None:
+        self._call(self._core.delete_namespace, name, missing_ok=True)
+
+
+#
+# in-memory fake
+#
+
+
+def _matches(labels: dict[str, str], selector: str) -> bool:
+    for requirement in filter(None, selector.split(",")):
+        label, _, value = requirement.partition("=")
+        if labels.get(label) != value:
+            return False
+    return True
+
+
+@define
+class _FakeWatch:
+    events: queue.Queue
+    deadline: float
+    backend: FakeBackend
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = self.events.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if event is None:
+                return
+            yield event
+
+    def close(self) -> None:
+        self.backend._unwatch(self.events)
+        self.events.put(None)
+
+
+@define
+class FakeBackend:
+    """In-memory cluster that records the operations made on it."""
+
+    annotations: dict[str, str] = field(factory=dict)
+    services: dict[tuple[str, str], str] = field(factory=dict)
+    peers: dict[str, Manifest] = field(init=False, factory=dict)
+    namespaces: set[str] = field(init=False, factory=set)
+    releases: dict[str, tuple[str, dict[str, Any]]] = field(init=False, factory=dict)
+    calls: Counter = field(init=False, factory=Counter)
+
+    _version: int = field(init=False, default=0)
+    _watches: list[tuple[str, queue.Queue]] = field(init=False, factory=list)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def _notify(self, kind: str, manifest: Manifest) -> None:
+        labels = manifest["metadata"].get("labels", {})
+        for selector, events in self._watches:
+            if _matches(labels, selector):
+                events.put({"type": kind, "object": copy.deepcopy(manifest)})
+
+    def _unwatch(self, events: queue.Queue) -> None:
+        with self._lock:
+            self._watches = [w for w in self._watches if w[1] is not events]
+
+    def node_annotation(self, annotation: str) -> str:
+        self.calls["node_annotation"] += 1
+        return self.annotations.get(annotation, "")
+
+    def service_ip(self, namespace: str, name: str) -> str:
+        self.calls["service_ip"] += 1
+        try:
+            return self.services[namespace, name]
+        except KeyError:
+            raise ClusterBackendError(f"service {namespace}/{name} not found")
+
+    def list_peers(self, selector: str) -> Manifest:
+        with self._lock:
+            self.calls["list_peers"] += 1
+            return {
+                "metadata": {"resourceVersion": str(self._version)},
+                "items": [
+                    copy.deepcopy(peer)
+                    for peer in self.peers.values()
+                    if _matches(peer["metadata"].get("labels", {}), selector)
+                ],
+            }
+
+    def has_peer(self, name: str) -> bool:
+        self.calls["has_peer"] += 1
+        return name in self.peers
+
+    def apply_peer(self, manifest: Manifest) -> Manifest:
+        with self._lock:
+            self.calls["apply_peer"] += 1
+            self._version += 1
+            peer = copy.deepcopy(manifest)
+            peer["metadata"]["resourceVersion"] = str(self._version)
+            name = peer["metadata"]["name"]
+            kind = "MODIFIED" if name in self.peers else "ADDED"
+            self.peers[name] = peer
+            self._notify(kind, peer)
+            return copy.deepcopy(peer)
+
+    def delete_peer(self, name: str) -> None:
+        with self._lock:
+            self.calls["delete_peer"] += 1
+            peer = self.peers.pop(name, None)
+            if peer is not None:
+                self._version += 1
+                peer["metadata"]["resourceVersion"] = str(self._version)
+                self._notify("DELETED", peer)
+
+    def watch_peers(self, selector: str, timeout_seconds: float) -> PeerWatch:
+        with self._lock:
+            self.calls["watch_peers"] += 1
+            events: queue.Queue = queue.Queue()
+            for peer in self.peers.values():
+                if _matches(peer["metadata"].get("labels", {}), selector):
+                    events.put({"type": "ADDED", "object": copy.deepcopy(peer)})
+            self._watches.append((selector, events))
+        return _FakeWatch(events, time.monotonic() + timeout_seconds, self)
+
+    def install(self, name: str, chart_ref: str, values: dict[str, Any]) -> None:
+        self.calls["install"] += 1
+        self.namespaces.add(name)
+        self.releases[name] = (chart_ref, copy.deepcopy(values))
+
+    def uninstall(self, name: str) -> None:
+        self.calls["uninstall"] += 1
+        self.releases.pop(name, None)
+
+    def delete_namespace(self, name: str) -> None:
+        self.calls["delete_namespace"] += 1
+        self.namespaces.discard(name)
+
+
+BACKENDS = {
+    "kubectl": KubectlBackend.connect,
+    "kubernetes": KubernetesApiBackend.connect,
+}
+
+
+def connect_backend(
+    backend: str = "kubectl", kubeconfig: str = "", kubecontext: str = ""
+) -> ClusterBackend:
+    try:
+        connect = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown cluster backend '{backend}'")
+    return connect(kubeconfig, kubecontext)
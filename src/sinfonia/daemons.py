@@ -1,54 +1,57 @@
-import csv
-import os
 import time
 from pathlib import Path
+from typing import Optional
 
 import rapl
 
 from src.lib.time import TimeUnit
+from src.sinfonia.carbon.meter.energy_ring import EnergyRing
+from src.sinfonia.carbon.meter.intel_rapl import EnergyCsvWriter
 
 
 def energy_report(
-        path: str | Path, 
+        path: Optional[str | Path] = None,
         reset_interval_seconds: float = TimeUnit.DAY,
         sample_interval_seconds: float = TimeUnit.SECOND,
+        ring_name: Optional[str] = None,
 ):
     """Sample energy in Joules via Intel RAPL.
-    
+
     Args:
-        path - str | Path: File location to save energy data
-        sample_interval_seconds - float: Number of seconds over which to measure energy use [default: 1]
+        path - str | Path: File location to save energy data, optional when
+            the samples go to a ring
+        reset_interval_seconds - float: Number of seconds after which the
+            energy file is cleared [default: 1 day]
+        sample_interval_seconds - float: Number of seconds over which to
+            measure energy use [default: 1]
+        ring_name - str: Name of the shared memory EnergyRing to append
+            samples to
     """
-    path = Path(path)
-    path.parent.mkdir(mode=755, parents=True, exist_ok=True)
-    
-    f = open(path, 'w', encoding='utf-8')
-    writer = csv.writer(f)
-    writer.writerow(['timestamp', 'average_joules', 'summation_joules'])
-    last_reset_ts = int(time.time())
-    
+    if path is None and ring_name is None:
+        raise ValueError("energy report needs a path or a ring")
+
+    ring = EnergyRing.attach(ring_name) if ring_name is not None else None
+    csv_writer = (
+        EnergyCsvWriter(path, reset_interval_seconds) if path is not None else None
+    )
+
     while True:
-        # if over reset interval then re-open file and clear all previous contents
         ts = int(time.time())
-        if ts - last_reset_ts > reset_interval_seconds:    
-            f.close()
-            f = open(Path(path), 'w', encoding='utf-8')
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'average_joules', 'summation_joules'])
-            last_reset_ts = ts
-        
+
         # measure system energy use over the specified period
         s1 = rapl.RAPLMonitor.sample()
         time.sleep(sample_interval_seconds)
         s2 = rapl.RAPLMonitor.sample()
 
         diff = s2 - s1
-        
+
         eu_avg, eu_sum = 0, 0
         for d in diff.domains:
             domain = diff.domains[d]
             eu_avg += diff.average_power(package=domain.name)
             eu_sum += diff.energy(package=domain.name, unit=rapl.JOULES)
-        
-        writer.writerow([ts, eu_avg, eu_sum])
-        f.flush()
+
+        if ring is not None:
+            ring.append(ts, eu_avg, eu_sum)
+        if csv_writer is not None:
+            csv_writer.write(ts, eu_avg, eu_sum)
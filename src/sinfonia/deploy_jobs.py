@@ -0,0 +1,146 @@
+#
+# Sinfonia
+#
+# Run deployments in the background and track their progress
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Asynchronous deployment jobs.
+
+A deployment with a cold helm install can take a long time, which ties up a
+web server worker and may exceed the time Tier1 is willing to wait. With an
+asynchronous deploy request the deployment runs as a job on a bounded worker
+pool and the request returns a handle right away. Clients poll the job, or
+wait for it to complete with a long-poll, to get the result.
+
+Requests for a client that already has a job in progress return the existing
+job. Completed jobs are forgotten after ttl seconds.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from uuid import UUID, uuid4
+
+from attrs import define, field
+
+from src.domain.logger import get_default_logger
+
+logger = get_default_logger()
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+@define
+class DeployJob:
+    uuid: UUID
+    application_key: str
+    id: UUID = field(factory=uuid4)
+    status: str = PENDING
+    result: Any = None
+    error: str | None = None
+    finished: float | None = None
+    _done: threading.Event = field(init=False, factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def asdict(self) -> dict[str, Any]:
+        job: dict[str, Any] = {
+            "id": str(self.id),
+            "UUID": str(self.uuid),
+            "ApplicationKey": self.application_key,
+            "status": self.status,
+        }
+        if self.status == SUCCEEDED:
+            job["result"] = self.result
+        elif self.status == FAILED:
+            job["error"] = self.error
+        return job
+
+
+@define
+class DeployJobs:
+    """Bounded pool of workers running deployment jobs."""
+
+    max_workers: int = 4
+    max_pending: int = 64
+    ttl: float = 300.0
+
+    _jobs: dict[UUID, DeployJob] = field(init=False, factory=dict)
+    _active: dict[tuple[UUID, str], DeployJob] = field(init=False, factory=dict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+    _executor: ThreadPoolExecutor = field(init=False)
+
+    @_executor.default
+    def _default_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="deploy-job"
+        )
+
+    def submit(
+        self, uuid: UUID, application_key: str, deploy: Callable[[], Any]
+    ) -> DeployJob:
+        """Run deploy as a job, or return the job already running for this
+        application and client.
+
+        raises:
+        - TooManyJobs when max_pending jobs are already waiting or running.
+        """
+        with self._lock:
+            self._expire()
+
+            job = self._active.get((uuid, application_key))
+            if job is not None:
+                return job
+
+            if len(self._active) >= self.max_pending:
+                raise TooManyJobs
+
+            job = DeployJob(uuid, application_key)
+            self._jobs[job.id] = job
+            self._active[uuid, application_key] = job
+
+        self._executor.submit(self._run, job, deploy)
+        return job
+
+    def get(self, job_id: UUID) -> DeployJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: DeployJob, deploy: Callable[[], Any]) -> None:
+        job.status = RUNNING
+        try:
+            job.result = deploy()
+            job.status = SUCCEEDED
+        except Exception as e:
+            logger.exception(f"[deploy_jobs] deployment of {job.uuid} failed")
+            job.error = getattr(e, "detail", None) or repr(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.monotonic()
+            with self._lock:
+                self._active.pop((job.uuid, job.application_key), None)
+            job._done.set()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
@@ -18,24 +18,25 @@ from ipaddress import (
     ip_address,
     ip_network,
 )
-from tempfile import NamedTemporaryFile
 from typing import TYPE_CHECKING, Any, Callable, cast
 from uuid import UUID
 
 import pendulum
 import randomname
-import yaml
 from attrs import define, field
-from plumbum import TF
 from wireguard_tools import WireguardKey
 
 from .deployment_recipe import DeploymentRecipe
 
+from src.domain.logger import get_default_logger
+
 if TYPE_CHECKING:
     from .cluster import Cluster
 else:
     Cluster = object
 
+logger = get_default_logger()
+
 CLIENT_NETWORK = ip_network("10.5.0.0/16")
 
 
@@ -74,6 +75,16 @@ def key_to_k8s_label(key: WireguardKey) -> str:
     return f"wg-{key.urlsafe}-pubkey"
 
 
+def teardown(
+    cluster: Cluster, name: str, client_ip: IPv4Address | IPv6Address
+) -> None:
+    """Remove kilo peer and shut down the backend of deployment name"""
+    cluster.delete_peer(name)
+    cluster.backend.uninstall(name)
+    cluster.backend.delete_namespace(name)
+    cluster.client_addresses.release(client_ip)
+
+
 @define
 class Deployment:
     cluster: Cluster
@@ -84,6 +95,8 @@ class Deployment:
     )
     name: str = field()
     created: pendulum.DateTime = field(converter=parse_date)
+    # backend was installed ahead of time by the warm pool
+    warm: bool = field(default=False, eq=False)
 
     @name.default
     def _default_name(self) -> str:
@@ -140,34 +153,50 @@ class Deployment:
             created=metadata["annotations"]["findcloudlet.org/created"],
         )
 
-    def deploy(self) -> None:
+    def deploy(self) -> bool:
+        """Deploy the backend, returns False when the client already had a
+        deployment of the recipe and that one is used instead.
+
+        A new deployment takes an idle release from the warm pool when there
+        is one, it is torn down when the deployment fails so it is not leaked.
+        """
+        if self.is_deployed():
+            return False
+
+        if not self.warm and self.cluster.warm_pool is not None:
+            name = self.cluster.warm_pool.take(self.recipe)
+            if name is not None:
+                self.name, self.warm = name, True
+
+        try:
+            return self._deploy()
+        except BaseException:
+            if self.warm:
+                try:
+                    self.expire()
+                except Exception:
+                    logger.exception(f"[deployment] failed to tear down {self.name}")
+            raise
+
+    def _deploy(self) -> bool:
         while True:
             if self.is_deployed():
-                return
+                return False
 
-            client_key_label = key_to_k8s_label(self.client_public_key)
             self.created = self._default_created()
-            (
-                self.cluster.kubectl["apply", "-f", "-"]
-                << f"""\
-apiVersion: kilo.squat.ai/v1alpha1
-kind: Peer
-metadata:
-  name: "{self.name}"
-  labels:
-    findcloudlet.org: deployment
-    findcloudlet.org/uuid: "{self.recipe.uuid}"
-    findcloudlet.org/key: "{client_key_label}"
-    findcloudlet.org/client: "{self.client_ip}"
-  annotations:
-    findcloudlet.org/created: "{self.created}"
-spec:
-  allowedIPs:
-    - "{self.client_ip}/32"
-  publicKey: "{self.client_public_key}"
-  persistentKeepalive: 10
-"""
-            )()
+            self.cluster.apply_peer(self.peer_manifest())
+            self.cluster.client_addresses.confirm(self.client_ip)
+
+            # another Tier2 replica may have assigned the same client address
+            if self._client_address_conflict():
+                logger.warning(
+                    "[deployment] client address %s already in use, retrying",
+                    self.client_ip,
+                )
+                self.cluster.delete_peer(self.name)
+                self.client_ip = self.cluster.get_unique_client_address()
+                continue
+
             # check if we are the only deployment?
             # this is probably not how to do it...
             deployment = self.cluster.get(self.recipe.uuid, self.client_public_key)
@@ -178,36 +207,61 @@ spec:
             self.expire()
             self = deployment
 
-        self.helm_install()
+        # warm backends are already installed, adding the peer was enough
+        if not self.warm:
+            self.helm_install()
+        return True
+
+    def peer_manifest(self) -> dict[str, Any]:
+        """Kilo peer that routes the client address through the tunnel."""
+        return {
+            "apiVersion": "kilo.squat.ai/v1alpha1",
+            "kind": "Peer",
+            "metadata": {
+                "name": self.name,
+                "labels": {
+                    "findcloudlet.org": "deployment",
+                    "findcloudlet.org/uuid": str(self.recipe.uuid),
+                    "findcloudlet.org/key": key_to_k8s_label(self.client_public_key),
+                    "findcloudlet.org/client": str(self.client_ip),
+                },
+                "annotations": {
+                    "findcloudlet.org/created": str(self.created),
+                },
+            },
+            "spec": {
+                "allowedIPs": [f"{self.client_ip}/32"],
+                "publicKey": str(self.client_public_key),
+                "persistentKeepalive": 10,
+            },
+        }
+
+    def _client_address_conflict(self) -> bool:
+        """Whether an older peer was assigned our client address, the newest
+        of conflicting peers has to move.
+        """
+        peers = self.cluster.get_peers(f"findcloudlet.org/client={self.client_ip}")
+        for peer in peers:
+            metadata = peer["metadata"]
+            if metadata["name"] == self.name:
+                continue
+            created = parse_date(metadata["annotations"]["findcloudlet.org/created"])
+            if (created, metadata["name"]) < (self.created, self.name):
+                return True
+        return False
 
     def is_deployed(self) -> bool:
         """Kilo peer is removed when a lease expires"""
-        return self.cluster.kubectl["get", "peer", self.name, "-o", "name"] & TF
+        return self.cluster.has_peer(self.name)
 
     def expire(self) -> None:
         """Remove kilo peer and shut down backend"""
-        self.cluster.kubectl("delete", "peer", self.name, retcode=None)
-        self.cluster.helm(
-            "uninstall", "--namespace", self.name, self.name, retcode=None
-        )
-        self.cluster.kubectl("delete", "namespace", self.name, retcode=None)
+        teardown(self.cluster, self.name, self.client_ip)
 
     def helm_install(self) -> None:
-        with NamedTemporaryFile(delete=False) as f:
-            f.write(yaml.dump(self.recipe.values).encode("utf-8"))
-            f.flush()
-
-            self.cluster.helm(
-                "install",
-                "--namespace",
-                self.name,
-                "--create-namespace",
-                "--values",
-                f.name,
-                "--replace",
-                self.name,
-                self.recipe.chart_ref,
-            )
+        self.cluster.backend.install(
+            self.name, self.recipe.chart_path(), self.recipe.values
+        )
 
     def asdict(self, default_endpoint = "") -> dict[str, Any]:
         status = "Deployed" if self.is_deployed() else "Expired"
@@ -0,0 +1,115 @@
+#
+# Sinfonia
+#
+# Remove deployments of clients that are no longer active
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Batched expiration of inactive deployments.
+
+A sweep works from a single listing of the deployment peers. Peers are joined
+against the set of wireguard keys that were recently active, and everything
+needed to tear down a deployment is in the peer labels, so the recipe is not
+loaded. Expired deployments are torn down concurrently on a bounded number of
+workers, each teardown is a couple of slow cluster operations.
+"""
+
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import ip_address
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+import pendulum
+from attrs import define
+from wireguard_tools import WireguardKey
+
+from .deployment import key_from_k8s_label, parse_date, teardown
+
+from src.domain.logger import get_default_logger
+
+if TYPE_CHECKING:
+    from .cluster import Cluster
+
+logger = get_default_logger()
+
+
+@define
+class ExpirySweep:
+    """Outcome of a sweep over the deployments of a cluster."""
+
+    peers: int
+    expired: int
+    removed: int
+    duration: float
+
+
+def expired_peers(
+    peers: Iterable[dict[str, Any]],
+    active_keys: set[WireguardKey],
+    cutoff: pendulum.DateTime,
+) -> Iterator[dict[str, Any]]:
+    """Peers created before cutoff whose client key is not active."""
+    for peer in peers:
+        metadata = peer["metadata"]
+        try:
+            created = parse_date(metadata["annotations"]["findcloudlet.org/created"])
+            key = key_from_k8s_label(metadata["labels"]["findcloudlet.org/key"])
+        except (KeyError, ValueError):
+            logger.warning(f"Ignoring malformed peer {metadata.get('name')}")
+            continue
+
+        if created < cutoff and key not in active_keys:
+            yield peer
+
+
+def expire_peer(cluster: Cluster, peer: dict[str, Any]) -> None:
+    metadata = peer["metadata"]
+    logger.info(f"Expiring {metadata['name']}")
+    teardown(
+        cluster,
+        metadata["name"],
+        ip_address(metadata["labels"]["findcloudlet.org/client"]),
+    )
+
+
+def sweep(
+    cluster: Cluster,
+    peers: list[dict[str, Any]],
+    active_keys: set[WireguardKey],
+    cutoff: pendulum.DateTime,
+    max_workers: int = 4,
+) -> ExpirySweep:
+    """Tear down the deployments of peers that expired."""
+    start = time.monotonic()
+    expired = list(expired_peers(peers, active_keys, cutoff))
+
+    removed = 0
+    if expired:
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="expire"
+        ) as executor:
+            futures = [executor.submit(expire_peer, cluster, peer) for peer in expired]
+        for peer, future in zip(expired, futures):
+            if future.exception() is not None:
+                logger.error(
+                    f"Failed to expire {peer['metadata']['name']}: "
+                    f"{future.exception()!r}"
+                )
+            else:
+                removed += 1
+
+    result = ExpirySweep(
+        peers=len(peers),
+        expired=len(expired),
+        removed=removed,
+        duration=time.monotonic() - start,
+    )
+    logger.info(
+        f"Expired {result.removed}/{result.expired} of {result.peers} deployments"
+        f" in {result.duration:.3f}s"
+    )
+    return result
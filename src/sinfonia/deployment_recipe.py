@@ -35,6 +35,11 @@ Example recipe.yaml file,
     values:
         fullnameOverride: example
     restricted: false
+    warm_pool: 2
+
+The optional warm_pool field is the number of backends Tier2 keeps installed
+ahead of time, so that a deployment request only has to route the client to
+an already running backend.
 """
 
 from __future__ import annotations
@@ -51,6 +56,7 @@ from requests.exceptions import RequestException
 from yarl import URL
 
 from .deployment_repository import DeploymentRepository
+from .recipe_cache import Validator
 
 SINFONIA_RECIPE_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
@@ -77,9 +83,15 @@ SINFONIA_RECIPE_SCHEMA = {
             "description": "Try to keep recipe private (default: true)",
             "type": "boolean",
         },
+        "warm_pool": {
+            "description": "Number of pre-installed backends (default: 0)",
+            "type": "integer",
+            "minimum": 0,
+        },
     },
     "required": ["chart", "version"],
 }
+SINFONIA_RECIPE_VALIDATOR = Draft202012Validator(SINFONIA_RECIPE_SCHEMA)
 
 
 @define
@@ -91,6 +103,7 @@ class DeploymentRecipe:
     version: str
     values: dict
     restricted: bool
+    warm_pool: int = 0
 
     @classmethod
     def from_uuid(cls, uuid: UUID | str) -> DeploymentRecipe:
@@ -108,16 +121,32 @@ class DeploymentRecipe:
     def from_repo(
         cls, repository: DeploymentRepository, uuid: UUID
     ) -> DeploymentRecipe:
-        """Load deployment recipe from yaml document.
+        """Load deployment recipe from yaml document, or from the recipe
+        cache of the repository.
         May raise jsonschema.exceptions.ValidationError.
         """
-        recipe_yaml = repository.get(str(uuid) + ".yaml")
+        ref = str(uuid) + ".yaml"
+
+        def load(
+            validator: Validator | None,
+        ) -> tuple[DeploymentRecipe | None, Validator | None]:
+            recipe_yaml, validator = repository.get_if_changed(ref, validator)
+            if recipe_yaml is None:
+                return None, validator
+            return cls.from_yaml(repository, uuid, recipe_yaml), validator
 
+        if repository.recipe_cache is None:
+            return cls.from_yaml(repository, uuid, repository.get(ref))
+        return repository.recipe_cache.get(uuid, load)
+
+    @classmethod
+    def from_yaml(
+        cls, repository: DeploymentRepository, uuid: UUID, recipe_yaml: str
+    ) -> DeploymentRecipe:
         recipe = yaml.safe_load(recipe_yaml)
-        validator = Draft202012Validator(SINFONIA_RECIPE_SCHEMA)
-        validator.validate(recipe)
+        SINFONIA_RECIPE_VALIDATOR.validate(recipe)
 
-        return cls(
+        deployment_recipe = cls(
             repository=repository,
             uuid=uuid,
             chart=recipe["chart"],
@@ -125,7 +154,11 @@ class DeploymentRecipe:
             values=recipe.get("values", {}),
             description=recipe.get("description"),
             restricted=recipe.get("restricted", True),
+            warm_pool=recipe.get("warm_pool", 0),
         )
+        # start fetching the chart as soon as we see a recipe
+        deployment_recipe.prefetch_chart()
+        return deployment_recipe
 
     @property
     def chart_version(self) -> str:
@@ -135,6 +168,20 @@ class DeploymentRecipe:
     def chart_ref(self) -> URL:
         return self.repository.join(self.chart_version + ".tgz")
 
+    def prefetch_chart(self) -> None:
+        chart_cache = self.repository.chart_cache
+        if chart_cache is not None and self.chart_ref.scheme != "file":
+            chart_cache.pull(self.chart_ref, self.chart_version)
+
+    def chart_path(self) -> str:
+        """Chart reference to pass to helm, the locally cached archive when
+        the chart is remote and the repository has a chart cache.
+        """
+        chart_cache = self.repository.chart_cache
+        if chart_cache is None or self.chart_ref.scheme == "file":
+            return str(self.chart_ref)
+        return str(chart_cache.get(self.chart_ref, self.chart_version))
+
     def asdict(self) -> dict[str, Any]:
         assert not self.restricted
         recipe: dict[str, Any] = {
@@ -20,12 +20,17 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
+from uuid import UUID
 
 import requests
 from attrs import define, field
 from werkzeug.security import safe_join
 from yarl import URL
 
+from .chart_cache import ChartCache
+from .http_transport import http_session
+from .recipe_cache import RecipeCache, Validator
+
 
 def _root_to_url(repository_root: str | os.PathLike | URL) -> URL:
     """Canonicalize the repository root."""
@@ -44,6 +49,14 @@ def _root_to_url(repository_root: str | os.PathLike | URL) -> URL:
 @define
 class DeploymentRepository:
     base_url: URL = field(converter=_root_to_url)
+    # uses the session of the current application when not set
+    session: requests.Session | None = field(default=None, eq=False, repr=False)
+    # local copies of remote charts, helm fetches the chart on every install
+    # when not set
+    chart_cache: ChartCache | None = field(default=None, eq=False, repr=False)
+    # parsed and validated recipes, recipes are loaded on every lookup when
+    # set to None
+    recipe_cache: RecipeCache | None = field(factory=RecipeCache, eq=False, repr=False)
 
     def join(self, other: str | os.PathLike | URL) -> URL:
         """Try to safely join the current repository with 'other'.
@@ -77,11 +90,57 @@ class DeploymentRepository:
         - requests.Timeout when the request timed out during connect or read.
         (requests related exceptions can be caught with 'requests.RequestException')
         """
+        content, _ = self.get_if_changed(ref)
+        assert content is not None
+        return content
+
+    def get_if_changed(
+        self, ref: str | URL, validator: Validator | None = None
+    ) -> tuple[str | None, Validator | None]:
+        """Retrieves the contents of 'ref' unless it still matches the
+        validator returned by an earlier call.
+
+        Returns the contents, or None when unchanged, and a validator based on
+        the modification time of a local file or the ETag or Last-Modified
+        header of a remote one. Raises the same exceptions as get.
+        """
         ref_url = self.join(ref)
 
         if ref_url.scheme == "file":
-            return Path(ref_url.path).read_text()
-
-        r = requests.get(str(ref_url))
+            path = Path(ref_url.path)
+            stat = path.stat()
+            current = ("mtime", f"{stat.st_mtime_ns}:{stat.st_size}")
+            if current == validator:
+                return None, validator
+            return path.read_text(), current
+
+        headers = {}
+        if validator is not None:
+            headers[validator[0]] = validator[1]
+
+        session = self.session if self.session is not None else http_session()
+        r = session.get(str(ref_url), headers=headers)
+        if r.status_code == 304:
+            return None, validator
         r.raise_for_status()
-        return r.text
+
+        if "ETag" in r.headers:
+            return r.text, ("If-None-Match", r.headers["ETag"])
+        if "Last-Modified" in r.headers:
+            return r.text, ("If-Modified-Since", r.headers["Last-Modified"])
+        return r.text, None
+
+    def recipe_uuids(self) -> list[UUID]:
+        """UUIDs of the recipes in a local repository, a remote repository
+        can not be listed and returns no recipes.
+        """
+        if self.base_url.scheme != "file":
+            return []
+
+        uuids = []
+        for path in Path(self.base_url.path).glob("*.yaml"):
+            try:
+                uuids.append(UUID(path.stem))
+            except ValueError:
+                continue
+        return sorted(uuids)
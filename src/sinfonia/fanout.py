@@ -0,0 +1,277 @@
+#
+# Sinfonia
+#
+# Gather deployment results from multiple cloudlets
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""First-k gathering of concurrent deployment requests.
+
+Tier1 forwards a deployment request to several candidate cloudlets at once.
+Instead of waiting for every cloudlet in turn, results are collected as the
+requests complete and we return as soon as enough deployments have been
+returned. Requests that are still outstanding at that point are cancelled
+when they have not started yet, or are left to finish in the background.
+Deploying to a few spare candidates beyond the number of results keeps a
+single slow cloudlet from delaying the response. Unused deployments are only
+released when Tier2 created them for this request, a cloudlet may have
+returned a deployment the client is already using.
+
+With hedging, a request that has not been answered within its hedge delay,
+or that failed, is duplicated to the next candidate cloudlet. Deployments
+that lost the race are released once they complete, when they are new.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, as_completed, wait
+from itertools import chain, filterfalse, islice, zip_longest
+from typing import Any, Callable, Iterable, Sequence, TypeVar
+
+from attrs import define
+
+from src.domain.logger import get_default_logger
+
+logger = get_default_logger()
+
+Deployments = list[dict[str, Any]]
+
+T = TypeVar("T")
+
+# set by Tier2 on deployments created by the request
+NEW_DEPLOYMENT = "NewDeployment"
+
+
+def _deployments(request: Future) -> Deployments:
+    try:
+        return request.result() or []
+    except Exception:
+        logger.exception("[fanout] deployment request failed")
+        return []
+
+
+def _created(deployments: Deployments) -> bool:
+    return any(deployment.get(NEW_DEPLOYMENT) for deployment in deployments)
+
+
+def _abandon(request: Future) -> None:
+    """Cancel a request, or log its result once a running request completes."""
+    if request.cancel():
+        return
+
+    def straggler(request: Future) -> None:
+        logger.info(
+            "[fanout] straggler returned %d deployments after we responded",
+            len(_deployments(request)),
+        )
+
+    request.add_done_callback(straggler)
+
+
+def gather_first(
+    requests: Sequence[Future],
+    max_results: int,
+    timeout: float | None = None,
+    release: Callable[[int], Any] | None = None,
+) -> Deployments:
+    """Returns up to max_results deployments from the first requests to complete.
+
+    Requests are expected to be ordered by cloudlet preference, the returned
+    deployments are ordered the same way and interleaved across cloudlets in
+    case any returned more than one. Failed requests are skipped, we give up
+    waiting on outstanding requests after timeout seconds. When release is
+    given it is called with the index of every request whose new deployments
+    did not make it into the result, outstanding ones once they complete.
+    """
+    rank = {request: index for index, request in enumerate(requests)}
+    completed: dict[int, Deployments] = {}
+    returned = 0
+
+    try:
+        for request in as_completed(requests, timeout=timeout):
+            deployments = _deployments(request)
+            completed[rank[request]] = deployments
+            returned += len(deployments)
+            if returned >= max_results:
+                break
+    except concurrent.futures.TimeoutError:
+        logger.warning(
+            "[fanout] timed out waiting for %d of %d cloudlets",
+            len(requests) - len(completed),
+            len(requests),
+        )
+
+    outstanding = []
+    for index, request in enumerate(requests):
+        if index in completed:
+            continue
+        # requests that already finished may have a better rank
+        if request.done() and not request.cancelled():
+            completed[index] = _deployments(request)
+        else:
+            outstanding.append(index)
+
+    results = _interleave(completed, max_results)
+
+    if release is None:
+        for index in outstanding:
+            _abandon(requests[index])
+        return results
+
+    # release new deployments that did not make it into the results
+    used = {id(deployment) for deployment in results}
+    for index, deployments in completed.items():
+        if _created(deployments) and not any(id(d) in used for d in deployments):
+            release(index)
+    for index in outstanding:
+        _release_when_done(requests[index], index, release)
+    return results
+
+
+def deploy_first(
+    candidates: Iterable[T],
+    deploy: Callable[[T], Future],
+    release: Callable[[T], Any],
+    max_results: int,
+    spares: int = 1,
+    timeout: float | None = None,
+) -> Deployments:
+    """Returns the first max_results deployments from the best candidates.
+
+    Deploys to max_results + spares candidates at once, so the response does
+    not have to wait for the slowest of them. New deployments that are not
+    part of the result are released.
+    """
+    chosen = list(islice(candidates, max_results + spares))
+    requests = [deploy(candidate) for candidate in chosen]
+    return gather_first(
+        requests, max_results, timeout, release=lambda index: release(chosen[index])
+    )
+
+
+def _interleave(completed: dict[int, Deployments], max_results: int) -> Deployments:
+    """Combine deployments ordered by rank, interleaved across cloudlets in
+    case any returned more than requested.
+    """
+    ordered = (completed[index] for index in sorted(completed))
+    return list(
+        islice(
+            filterfalse(lambda r: r is None, chain(*zip_longest(*ordered))),
+            max_results,
+        )
+    )
+
+
+@define
+class _Attempt:
+    rank: int
+    candidate: Any
+    hedge_at: float
+    hedged: bool = False
+
+
+def gather_hedged(
+    candidates: Iterable[T],
+    deploy: Callable[[T], Future],
+    release: Callable[[T], Any],
+    hedge_delay: Callable[[T], float],
+    max_results: int,
+    max_hedges: int = 1,
+    timeout: float | None = None,
+) -> Deployments:
+    """Returns up to max_results deployments, hedging slow or failed requests.
+
+    Deploys to the first max_results candidates. Whenever one of these has
+    not answered within hedge_delay seconds, or returned no deployments, the
+    request is sent to the next candidate, up to max_hedges extra requests.
+    Deployments from cloudlets that are not part of the result are released.
+    """
+    remaining = iter(candidates)
+    deadline = math.inf if timeout is None else time.monotonic() + timeout
+    inflight: dict[Future, _Attempt] = {}
+    completed: dict[int, Deployments] = {}
+    answered: dict[int, Any] = {}
+    launched = hedges = 0
+
+    def launch() -> bool:
+        nonlocal launched
+        candidate = next(remaining, None)
+        if candidate is None:
+            return False
+        request = deploy(candidate)
+        inflight[request] = _Attempt(
+            launched, candidate, time.monotonic() + hedge_delay(candidate)
+        )
+        launched += 1
+        return True
+
+    def hedge(attempt: _Attempt) -> None:
+        nonlocal hedges
+        attempt.hedged = True
+        if hedges < max_hedges and launch():
+            hedges += 1
+            logger.debug("[fanout] hedging request %d", attempt.rank)
+
+    while len(inflight) < max_results and launch():
+        pass
+
+    while inflight and sum(map(len, completed.values())) < max_results:
+        now = time.monotonic()
+        for attempt in list(inflight.values()):
+            if not attempt.hedged and attempt.hedge_at <= now:
+                hedge(attempt)
+
+        pending = [a.hedge_at for a in inflight.values() if not a.hedged]
+        wakeup = min(pending + [deadline]) if hedges < max_hedges else deadline
+        if now >= deadline:
+            logger.warning("[fanout] timed out waiting for %d cloudlets", len(inflight))
+            break
+
+        done, _ = wait(
+            list(inflight),
+            timeout=None if wakeup == math.inf else max(wakeup - now, 0.0),
+            return_when=FIRST_COMPLETED,
+        )
+        for request in done:
+            attempt = inflight.pop(request)
+            deployments = _deployments(request)
+            completed[attempt.rank] = deployments
+            answered[attempt.rank] = attempt.candidate
+            if not deployments and not attempt.hedged:
+                hedge(attempt)
+
+    # requests that already finished may have a better rank
+    for request in [request for request in inflight if request.done()]:
+        attempt = inflight.pop(request)
+        completed[attempt.rank] = _deployments(request)
+        answered[attempt.rank] = attempt.candidate
+
+    results = _interleave(completed, max_results)
+
+    # release new deployments that did not make it into the results
+    used = {id(deployment) for deployment in results}
+    for rank, deployments in completed.items():
+        if _created(deployments) and not any(id(d) in used for d in deployments):
+            release(answered[rank])
+
+    for request, attempt in inflight.items():
+        _release_when_done(request, attempt.candidate, release)
+
+    return results
+
+
+def _release_when_done(request: Future, candidate: Any, release: Callable) -> None:
+    if request.cancel():
+        return
+
+    def loser(request: Future) -> None:
+        if _created(_deployments(request)):
+            logger.info("[fanout] releasing deployment that lost the race")
+            release(candidate)
+
+    request.add_done_callback(loser)
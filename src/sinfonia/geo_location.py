@@ -10,13 +10,37 @@
 
 from __future__ import annotations
 
+from enum import Enum
+from functools import lru_cache
 from ipaddress import IPv4Address, IPv6Address, ip_address
+from typing import Sequence
 
 import geopy.distance
+import numpy as np
 from attrs import define, field
-from flask import current_app, request
+from flask import current_app, has_app_context, request
 from geolite2 import geolite2
 
+from .geolocation_cache import GeolocationCache
+
+# shared by lookups that happen outside of a configured application
+default_geolocation_cache = GeolocationCache()
+
+
+@lru_cache(maxsize=None)
+def geolite2_reader():
+    """GeoLite2 database reader, opened once per process."""
+    return geolite2.reader()
+
+
+def geolocation_cache() -> GeolocationCache:
+    """Geolocation cache of the current application, or the default cache."""
+    if has_app_context():
+        cache = current_app.config.get("geolocation_cache")
+        if cache is not None:
+            return cache
+    return default_geolocation_cache
+
 
 @define
 class GeoLocation:
@@ -49,16 +73,26 @@ class GeoLocation:
         """Get geolocation from ip address.
         Raises ValueError when no valid location is found for the IP address.
         """
-        # geolite2_reader = current_app.config["geolite2_reader"]
-        geolite2_reader = geolite2.reader()
         try:
             address = ip_address(ipaddress)
-            match = geolite2_reader.get(str(address))
+        except ValueError:
+            raise ValueError(f"No valid location found for {ipaddress}")
+
+        location = geolocation_cache().get(address, cls._lookup)
+        if location is None:
+            raise ValueError(f"No valid location found for {ipaddress}")
+        return location
+
+    @classmethod
+    def _lookup(cls, address: IPv4Address | IPv6Address) -> GeoLocation | None:
+        """Find address in the GeoLite2 database, bypassing the cache."""
+        try:
+            match = geolite2_reader().get(str(address))
             assert match is not None
             location = match["location"]
             return cls(location["latitude"], location["longitude"])
         except (AssertionError, KeyError, ValueError):
-            raise ValueError(f"No valid location found for {ipaddress}")
+            return None
 
     @classmethod
     def from_request_or_addr(
@@ -83,6 +117,157 @@ class GeoLocation:
         return geopy.distance.distance(self.coordinate, other.coordinate).km
 
 
+class DistanceMode(Enum):
+    """Accuracy of batched distance calculations.
+
+    HAVERSINE treats the earth as a sphere, it is fast but may be off by up to
+    0.5% compared to the geodesic distance.
+    GEODESIC uses Vincenty's formulae on the WGS-84 ellipsoid, which matches
+    geopy to well below a meter.
+    """
+
+    HAVERSINE = "haversine"
+    GEODESIC = "geodesic"
+
+
+# mean earth radius (IUGG) used for the spherical approximation
+EARTH_RADIUS_KM = 6371.0088
+
+# WGS-84 ellipsoid
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_B_KM = WGS84_A_KM * (1 - WGS84_F)
+
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 200
+
+
+def coordinates_array(locations: Sequence[GeoLocation]) -> np.ndarray:
+    """Convert a sequence of geolocations to a Nx2 array of lat/long."""
+    return np.array(
+        [location.coordinate for location in locations], dtype=np.float64
+    ).reshape(-1, 2)
+
+
+def _haversine_km(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    hav = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(hav, 0.0, 1.0)))
+
+
+def _vincenty_km(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """Vincenty's inverse formula, vectorized over all coordinate pairs.
+
+    Nearly antipodal points may fail to converge, those are recomputed with
+    geopy's geodesic solver.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+
+    L = lon2 - lon1
+    U1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    sin_sigma = np.zeros(L.shape)
+    cos_sigma = np.zeros(L.shape)
+    sigma = np.zeros(L.shape)
+    cos2_alpha = np.zeros(L.shape)
+    cos_2sigma_m = np.zeros(L.shape)
+
+    # only keep iterating on the pairs that have not converged yet, a few
+    # nearly antipodal pairs can otherwise keep the whole array iterating
+    active = np.arange(L.size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sU1, cU1 = sinU1.flat[active], cosU1.flat[active]
+            sU2, cU2 = sinU2.flat[active], cosU2.flat[active]
+            lam_prev = lam.flat[active]
+
+            sin_lam, cos_lam = np.sin(lam_prev), np.cos(lam_prev)
+            s_sigma = np.hypot(cU2 * sin_lam, cU1 * sU2 - sU1 * cU2 * cos_lam)
+            c_sigma = sU1 * sU2 + cU1 * cU2 * cos_lam
+            sig = np.arctan2(s_sigma, c_sigma)
+
+            sin_alpha = np.where(s_sigma == 0, 0.0, cU1 * cU2 * sin_lam / s_sigma)
+            c2_alpha = 1 - sin_alpha**2
+            c_2sigma_m = np.where(
+                c2_alpha == 0, 0.0, c_sigma - 2 * sU1 * sU2 / c2_alpha
+            )
+
+            C = WGS84_F / 16 * c2_alpha * (4 + WGS84_F * (4 - 3 * c2_alpha))
+            lam_next = L.flat[active] + (1 - C) * WGS84_F * sin_alpha * (
+                sig
+                + C * s_sigma * (c_2sigma_m + C * c_sigma * (-1 + 2 * c_2sigma_m**2))
+            )
+
+            lam.flat[active] = lam_next
+            sin_sigma.flat[active] = s_sigma
+            cos_sigma.flat[active] = c_sigma
+            sigma.flat[active] = sig
+            cos2_alpha.flat[active] = c2_alpha
+            cos_2sigma_m.flat[active] = c_2sigma_m
+
+            done = np.abs(lam_next - lam_prev) < VINCENTY_TOLERANCE
+            converged.flat[active[done]] = True
+            active = active[~done]
+            if not active.size:
+                break
+
+    u2 = cos2_alpha * (WGS84_A_KM**2 - WGS84_B_KM**2) / WGS84_B_KM**2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = (
+        B
+        * sin_sigma
+        * (
+            cos_2sigma_m
+            + B
+            / 4
+            * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+                - B
+                / 6
+                * cos_2sigma_m
+                * (-3 + 4 * sin_sigma**2)
+                * (-3 + 4 * cos_2sigma_m**2)
+            )
+        )
+    )
+    result = WGS84_B_KM * A * (sigma - delta_sigma)
+
+    for i in zip(*np.nonzero(~converged | ~np.isfinite(result))):
+        result[i] = geopy.distance.geodesic(
+            (np.degrees(lat1[i]), np.degrees(lon1[i])),
+            (np.degrees(lat2[i]), np.degrees(lon2[i])),
+        ).km
+    return result
+
+
+def distances(
+    origin: GeoLocation,
+    coordinates: np.ndarray,
+    mode: DistanceMode | str = DistanceMode.GEODESIC,
+) -> np.ndarray:
+    """Calculate distances in km from origin to each row of a Nx2 lat/long array."""
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    lat1, lon1 = np.radians(origin.coordinate)
+    lat2 = np.radians(coordinates[:, 0])
+    lon2 = np.radians(coordinates[:, 1])
+
+    if DistanceMode(mode) == DistanceMode.HAVERSINE:
+        return _haversine_km(lat1, lon1, lat2, lon2)
+    return _vincenty_km(lat1, lon1, lat2, lon2)
+
+
 def geolocate(ipaddress: IPv4Address | IPv6Address) -> GeoLocation | None:
     try:
         return GeoLocation.from_address(ipaddress)
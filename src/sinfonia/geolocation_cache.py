@@ -0,0 +1,115 @@
+#
+# Sinfonia
+#
+# Cache of ip address to geolocation lookups
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Bounded LRU cache with expiration for client geolocation lookups.
+
+Deploy requests from the same client, or from clients in the same network,
+would otherwise repeat the same GeoLite2 database lookup. Entries are keyed by
+address prefix, by default the full address, but addresses in the same /24 or
+/48 are generally close enough to share a location. Failed lookups are cached
+as well so unknown addresses do not hit the database on every request.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from ipaddress import IPv4Address, IPv6Address
+from typing import TYPE_CHECKING, Callable
+
+from attrs import define, field
+
+if TYPE_CHECKING:
+    from .geo_location import GeoLocation
+
+CacheKey = tuple[int, int]
+
+
+@define
+class GeolocationCache:
+    """Thread-safe LRU cache of address prefix to geolocation."""
+
+    maxsize: int = 65536
+    ttl: float = 3600.0
+    prefix_v4: int = field(default=32)
+    prefix_v6: int = field(default=128)
+
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    evictions: int = field(init=False, default=0)
+
+    _entries: OrderedDict[CacheKey, tuple[float, GeoLocation | None]] = field(
+        init=False, factory=OrderedDict
+    )
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    @prefix_v4.validator
+    def _valid_prefix_v4(self, _attribute, value):
+        if not 0 <= value <= 32:
+            raise ValueError("IPv4 prefix length out of range")
+
+    @prefix_v6.validator
+    def _valid_prefix_v6(self, _attribute, value):
+        if not 0 <= value <= 128:
+            raise ValueError("IPv6 prefix length out of range")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, address: IPv4Address | IPv6Address) -> CacheKey:
+        prefixlen = self.prefix_v4 if address.version == 4 else self.prefix_v6
+        return address.version, int(address) >> (address.max_prefixlen - prefixlen)
+
+    def get(
+        self,
+        address: IPv4Address | IPv6Address,
+        lookup: Callable[[IPv4Address | IPv6Address], GeoLocation | None],
+    ) -> GeoLocation | None:
+        """Return the cached location for address, calls lookup on a miss."""
+        key = self.key(address)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # don't hold the lock while we are looking up the address
+        location = lookup(address)
+
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = (now + self.ttl, location)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return location
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Cache counters, used to size the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,123 @@
+#
+# Sinfonia
+#
+# Shared HTTP transport for requests between Tier1, Tier2 and Prometheus
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Pooled HTTP sessions.
+
+Module level `requests.get` and `requests.post` open a new TCP connection for
+every call. A session keeps connections alive in a pool per host, so repeated
+requests to the same cloudlet, Tier1 endpoint or Prometheus server reuse an
+established connection. The pool size bounds the number of connections we
+keep open to each host.
+
+Requests that are sent without an explicit timeout get the session default,
+and failed connection attempts are retried with exponential backoff. Server
+errors are only retried for idempotent methods, a POST that reached the server
+is never sent twice.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Mapping
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = float | tuple[float, float]
+
+RETRY_STATUS = (502, 503, 504)
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout: Timeout | None = None):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, *args, **kwargs)
+
+
+def create_session(
+    pool_connections: int = 16,
+    pool_maxsize: int = 32,
+    pool_block: bool = False,
+    retries: int = 2,
+    backoff_factor: float = 0.2,
+    timeout: Timeout | None = (3.05, 30.0),
+) -> requests.Session:
+    """Create a session with keep-alive connection pools.
+
+    pool_connections is the number of hosts for which a pool is cached,
+    pool_maxsize is the number of connections kept open to a single host.
+    When pool_block is set, requests wait for a free connection instead of
+    opening (and then discarding) additional connections to a busy host.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=retry,
+    )
+    session = TimeoutSession(timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session_from_config(config: Mapping[str, Any]) -> requests.Session:
+    """Create a session from the HTTP_* application settings."""
+    read_timeout = config.get("HTTP_READ_TIMEOUT_SECONDS")
+    timeout = None
+    if read_timeout is not None:
+        connect_timeout = config.get("HTTP_CONNECT_TIMEOUT_SECONDS", read_timeout)
+        timeout = (float(connect_timeout), float(read_timeout))
+
+    return create_session(
+        pool_connections=config.get("HTTP_POOL_CONNECTIONS", 16),
+        pool_maxsize=config.get("HTTP_POOL_MAXSIZE", 32),
+        pool_block=config.get("HTTP_POOL_BLOCK", False),
+        retries=config.get("HTTP_RETRIES", 2),
+        backoff_factor=config.get("HTTP_RETRY_BACKOFF_SECONDS", 0.2),
+        timeout=timeout,
+    )
+
+
+@lru_cache(maxsize=None)
+def default_http_session() -> requests.Session:
+    """Session used outside of an application that did not create its own."""
+    return create_session()
+
+
+def http_session(config: Mapping[str, Any] | None = None) -> requests.Session:
+    """HTTP session of the given config or the current application, or the
+    default session.
+    """
+    if config is None and has_app_context():
+        config = current_app.config
+    if config is not None:
+        session = config.get("http_session")
+        if session is not None:
+            return session
+    return default_http_session()
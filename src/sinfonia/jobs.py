@@ -11,12 +11,12 @@
 from typing import Dict
 
 import pendulum
-import requests
 from flask_apscheduler import APScheduler
 from requests.exceptions import RequestException
 from yarl import URL
 
 from .carbon import report as carbon_report
+from .http_transport import http_session
 from src.domain.logger import get_default_logger
 
 
@@ -27,12 +27,18 @@ scheduler = APScheduler()
 def expire_cloudlets():
     cloudlets = scheduler.app.config["cloudlets"]
 
-    expiration = pendulum.now().subtract(seconds=scheduler.app.config["CLOUDLET_EXPIRY_SECONDS"])
+    expiration = pendulum.now().subtract(
+        seconds=scheduler.app.config["CLOUDLET_EXPIRY_SECONDS"]
+    )
 
-    for cloudlet in list(cloudlets.values()):
-        if cloudlet.last_update is not None and cloudlet.last_update < expiration:
+    for uuid in cloudlets.expired(expiration.timestamp()):
+        cloudlet = cloudlets.pop(uuid, None)
+        if cloudlet is not None:
             logger.info(f"Removing stale cloudlet at {cloudlet.endpoint}")
-            cloudlets.pop(cloudlet.uuid, None)
+
+        latency_stats = scheduler.app.config.get("latency_stats")
+        if latency_stats is not None:
+            latency_stats.forget(uuid)
 
 
 def start_expire_cloudlets_job():
@@ -81,6 +87,7 @@ def report_to_tier1_endpoints():
             energy_csv_path=config["CARBON_ENERGY_REPORT_PATH"],
             period_seconds=config["REPORT_TO_TIER1_INTERVAL_SECONDS"],
             timestamp=config["CARBON_TRACE_TIMESTAMP"],
+            energy_ring=config.get("energy_ring"),
         )
         resources.update(r.to_dict())
     
@@ -89,10 +96,11 @@ def report_to_tier1_endpoints():
 
     logger.debug("Reporting %s", str(resources))
 
+    session = http_session(config)
     for tier1_url in config["TIER1_URLS"]:
         tier1_endpoint = URL(tier1_url) / "api/v1/cloudlets/"
         try:
-            requests.post(
+            session.post(
                 str(tier1_endpoint),
                 json={
                     "uuid": str(tier2_uuid),
@@ -0,0 +1,97 @@
+#
+# Sinfonia
+#
+# Latency histograms of deployment requests to cloudlets
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Per-cloudlet latency histograms.
+
+Histograms are keyed by cloudlet uuid, but any hashable key can be used, i.e.
+Tier2 tracks the latency of each of its Prometheus queries.
+
+Latencies are counted in logarithmically spaced buckets, so a histogram has
+a small fixed size and percentiles are accurate to within the bucket growth
+factor. Counts are halved once a histogram holds more than DECAY_AFTER
+samples, so older measurements gradually lose their weight when a cloudlet
+speeds up or slows down.
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Hashable
+
+from attrs import define, field
+
+# bucket upper bounds in seconds, 1ms up to about 2 minutes
+BUCKET_GROWTH = 1.2
+BUCKETS = [0.001 * BUCKET_GROWTH**i for i in range(65)]
+
+DECAY_AFTER = 1000
+
+
+@define
+class LatencyHistogram:
+    counts: list[float] = field(factory=lambda: [0.0] * len(BUCKETS))
+    total: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        bucket = min(bisect_left(BUCKETS, seconds), len(BUCKETS) - 1)
+        self.counts[bucket] += 1
+        self.total += 1
+        if self.total > DECAY_AFTER:
+            self.counts = [count / 2 for count in self.counts]
+            self.total /= 2
+
+    def percentile(self, percentile: float) -> float:
+        """Upper bound of the bucket that holds the requested percentile."""
+        target = self.total * percentile / 100
+        cumulative = 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if count and cumulative >= target:
+                return bound
+        return BUCKETS[-1]
+
+
+@define
+class LatencyStats:
+    """Thread-safe collection of latency histograms by key."""
+
+    min_samples: int = 10
+    _histograms: dict[Hashable, LatencyHistogram] = field(init=False, factory=dict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        with self._lock:
+            self._histograms.setdefault(key, LatencyHistogram()).record(seconds)
+
+    def percentile(self, key: Hashable, percentile: float) -> float | None:
+        """Latency percentile for a cloudlet, None without enough samples."""
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None or histogram.total < self.min_samples:
+                return None
+            return histogram.percentile(percentile)
+
+    def summary(
+        self, percentiles: tuple[float, ...] = (50, 95)
+    ) -> dict[str, dict[str, float]]:
+        """Latency percentiles in seconds of every key with enough samples."""
+        with self._lock:
+            return {
+                str(key): {
+                    f"p{percentile:g}": histogram.percentile(percentile)
+                    for percentile in percentiles
+                }
+                for key, histogram in self._histograms.items()
+                if histogram.total >= self.min_samples
+            }
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._histograms.pop(key, None)
@@ -0,0 +1,206 @@
+#
+# Sinfonia
+#
+# Spatial index over the locations of known cloudlets
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Grid cell index over cloudlet locations.
+
+The globe is divided into fixed size latitude/longitude cells, every location
+of a cloudlet is bucketed into the cell that contains it. A radius query only
+has to look at the cells that overlap with the bounding box of the spherical
+cap around the client and compute exact distances for the cloudlets found in
+those cells, instead of for every registered cloudlet.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+from typing import Iterable, Iterator
+from uuid import UUID
+
+import numpy as np
+from attrs import define, field
+
+from .geo_location import EARTH_RADIUS_KM, DistanceMode, GeoLocation, distances
+
+# geodesic distances on the WGS-84 ellipsoid differ up to ~0.6% from the
+# spherical distance, widen the covering to not miss cloudlets near the edge.
+RADIUS_SLACK = 1.01
+
+Cell = tuple[int, int]
+
+
+@define
+class LocationIndex:
+    """Incrementally updated grid index mapping cloudlet locations to uuids."""
+
+    cell_size: float = field(default=2.0)
+    mode: DistanceMode = field(default=DistanceMode.GEODESIC, converter=DistanceMode)
+    _cells: dict[Cell, dict[UUID, list[GeoLocation]]] = field(init=False, factory=dict)
+    _entries: dict[UUID, set[Cell]] = field(init=False, factory=dict)
+    # queries run concurrently with cloudlets reporting and expiring
+    _lock: threading.RLock = field(init=False, factory=threading.RLock)
+
+    @cell_size.validator
+    def _valid_cell_size(self, _attribute, value):
+        if value <= 0.0 or not (180.0 / value).is_integer():
+            raise ValueError("cell size should evenly divide 180 degrees")
+
+    @property
+    def rows(self) -> int:
+        return int(180.0 / self.cell_size)
+
+    @property
+    def columns(self) -> int:
+        return 2 * self.rows
+
+    def _cell(self, location: GeoLocation) -> Cell:
+        row = int((location.latitude + 90.0) // self.cell_size)
+        column = int((location.longitude + 180.0) // self.cell_size)
+        return min(row, self.rows - 1), column % self.columns
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, uuid: object) -> bool:
+        return uuid in self._entries
+
+    def add(self, uuid: UUID, locations: Iterable[GeoLocation]) -> None:
+        """Add (or replace) the locations of a cloudlet."""
+        with self._lock:
+            self.remove(uuid)
+
+            cells: set[Cell] = set()
+            for location in locations:
+                cell = self._cell(location)
+                self._cells.setdefault(cell, {}).setdefault(uuid, []).append(location)
+                cells.add(cell)
+
+            if cells:
+                self._entries[uuid] = cells
+
+    def remove(self, uuid: UUID) -> None:
+        """Drop all locations of a cloudlet, ignores unknown uuids."""
+        with self._lock:
+            for cell in self._entries.pop(uuid, ()):
+                bucket = self._cells[cell]
+                del bucket[uuid]
+                if not bucket:
+                    del self._cells[cell]
+
+    def _covering(self, location: GeoLocation, radius_km: float) -> Iterator[Cell]:
+        """Yield cells overlapping the bounding box of the spherical cap."""
+        angular = math.degrees(radius_km * RADIUS_SLACK / EARTH_RADIUS_KM)
+        lat_min = location.latitude - angular
+        lat_max = location.latitude + angular
+
+        row_min = max(int((lat_min + 90.0) // self.cell_size), 0)
+        row_max = min(int((lat_max + 90.0) // self.cell_size), self.rows - 1)
+
+        # longitude range of the cap, the whole circle when we reach a pole
+        full_circle = lat_min <= -90.0 or lat_max >= 90.0
+        if not full_circle:
+            ratio = math.sin(math.radians(angular)) / math.cos(
+                math.radians(location.latitude)
+            )
+            full_circle = ratio >= 1.0
+
+        if full_circle:
+            columns: Iterable[int] = range(self.columns)
+        else:
+            delta = math.degrees(math.asin(ratio))
+            col_min = int((location.longitude - delta + 180.0) // self.cell_size)
+            col_max = int((location.longitude + delta + 180.0) // self.cell_size)
+            if col_max - col_min + 1 >= self.columns:
+                columns = range(self.columns)
+            else:
+                columns = [col % self.columns for col in range(col_min, col_max + 1)]
+
+        for row in range(row_min, row_max + 1):
+            for column in columns:
+                yield row, column
+
+    def within(
+        self, location: GeoLocation, radius_km: float | None = None
+    ) -> list[tuple[float, UUID]]:
+        """Return (distance, uuid) of cloudlets within radius_km of location.
+
+        Distance is to the closest location of each cloudlet, the result is
+        not ordered, use `nearest` when an ordering is needed.
+        """
+        if radius_km is None:
+            covering: Iterable[Cell] | None = None
+        else:
+            covering = list(self._covering(location, radius_km))
+
+        # collect the candidate locations under the lock, distances are
+        # computed on the snapshot
+        owners: list[UUID] = []
+        coordinates: list[tuple[float, float]] = []
+        with self._lock:
+            if covering is None:
+                buckets = list(self._cells.values())
+            else:
+                buckets = [
+                    self._cells[cell] for cell in covering if cell in self._cells
+                ]
+            for bucket in buckets:
+                for uuid, locations in bucket.items():
+                    owners.extend(uuid for _ in locations)
+                    coordinates.extend(other.coordinate for other in locations)
+
+        if not owners:
+            return []
+
+        closest: dict[UUID, float] = {}
+        km = distances(location, np.array(coordinates), self.mode)
+        for uuid, distance in zip(owners, km.tolist()):
+            if uuid not in closest or distance < closest[uuid]:
+                closest[uuid] = distance
+
+        return [
+            (distance, uuid)
+            for uuid, distance in closest.items()
+            if radius_km is None or distance <= radius_km
+        ]
+
+    def closest(
+        self, location: GeoLocation, uuids: Iterable[UUID | None]
+    ) -> np.ndarray:
+        """Distance from location to the closest location of each cloudlet,
+        NaN for cloudlets that are not indexed.
+        """
+        uuids = list(uuids)
+        owners: list[int] = []
+        coordinates: list[tuple[float, float]] = []
+        with self._lock:
+            for owner, uuid in enumerate(uuids):
+                for cell in self._entries.get(uuid, ()):  # type: ignore[arg-type]
+                    for other in self._cells[cell][uuid]:  # type: ignore[index]
+                        owners.append(owner)
+                        coordinates.append(other.coordinate)
+
+        closest = np.full(len(uuids), np.inf)
+        if owners:
+            km = distances(location, np.array(coordinates), self.mode)
+            np.minimum.at(closest, owners, km)
+        return np.where(np.isinf(closest), np.nan, closest)
+
+    def nearest(
+        self, location: GeoLocation, radius_km: float | None = None
+    ) -> Iterator[tuple[float, UUID]]:
+        """Yield (distance, uuid) within radius_km ordered by distance.
+
+        Ordering is done lazily with a heap, so a consumer that only needs
+        the k nearest cloudlets pays O(n + k log n) instead of a full sort.
+        """
+        heap = self.within(location, radius_km)
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)
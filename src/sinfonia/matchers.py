@@ -9,22 +9,41 @@
 
 Plugin setup, additional functions can be added by external python modules
 by defining 'sinfonia_tier1_matchers' setuptools entry points.
+
+Matchers are implemented as pipeline stages. A stage does not modify shared
+state, it receives the current Candidates (a mask over registry slots) and
+returns new Candidates. Slots that the stage assigned a (finite) score to are
+settled and will be returned in order of increasing score, slots that were
+cleared from the mask are dropped, and the rest is passed on to the next
+stage. Because stages are side-effect free, tier1_best_match can stop running
+stages as soon as enough candidates have been settled.
+
+Plugins that implement the original Tier1MatchFunction interface, which
+yields cloudlets while removing them from a list, are wrapped by legacy_stage.
 """
 
 from __future__ import annotations
 
 import csv
 import os
-import random
 import time
-from operator import itemgetter
+from enum import Enum
+from functools import wraps
 from typing import Callable, Iterator, List, Sequence, Any
+from uuid import UUID
 
+import numpy as np
+from attrs import define, field
+from flask import current_app
 from importlib_metadata import EntryPoint, entry_points
 
 from .client_info import ClientInfo
+from .cloudlet_registry import CloudletRegistry
 from .cloudlets import Cloudlet
 from .deployment_recipe import DeploymentRecipe
+from .geo_location import DistanceMode
+from .location_index import LocationIndex
+from .network_index import bitset_mask
 
 from src.domain.logger import get_default_logger
 
@@ -36,72 +55,273 @@ CURRENT_PATH = os.path.abspath(__file__)
 PROJECT_PATH = os.path.dirname(CURRENT_PATH)
 LOG_PATH = f"{PROJECT_PATH}/logs"
 
+# cloudlets further away from the client are dropped by the location matcher
+MAX_DIST_KM = 1000.0
+
+# objectives and default weights of the weighted matcher, lower is better
+WEIGHTED_OBJECTIVES = ("distance", "carbon_intensity", "cpu_ratio", "mem_ratio")
+WEIGHTED_DEFAULT_WEIGHTS = {
+    "distance": 1.0,
+    "carbon_intensity": 1.0,
+    "cpu_ratio": 0.5,
+    "mem_ratio": 0.5,
+}
+# bounds memory use of pairwise dominance checks to about 4MB
+PARETO_CHUNK_SIZE = 1 << 22
+# points that are checked against the current pareto front at a time
+PARETO_BATCH_SIZE = 256
+
 # CARBON_INTENSITY_LOG_FILE_PATH = f"{LOG_PATH}/carbon_intensity.csv"
 # CARBON_INTENSITY_CSV_HEADER = ['timestamp', 'names', 'carbon_intensity_gco2_per_kwh']
 
+
+def _readonly(array: Any) -> np.ndarray:
+    array = np.array(array)
+    array.flags.writeable = False
+    return array
+
+
+@define(frozen=True)
+class Candidates:
+    """Immutable set of candidate registry slots with per-slot scores.
+
+    A NaN score means the slot has not been ranked, lower scores rank first.
+    Limit is the number of results that are still needed, a stage may settle
+    only the best `limit` candidates and leave the rest unranked.
+    """
+
+    mask: np.ndarray = field(converter=_readonly)
+    scores: np.ndarray = field(converter=_readonly)
+    limit: int | None = None
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, limit: int | None = None) -> Candidates:
+        return cls(mask, np.full(len(mask), np.nan), limit)
+
+    @classmethod
+    def from_cloudlets(
+        cls, registry: CloudletRegistry, cloudlets: Sequence[Cloudlet]
+    ) -> Candidates:
+        mask = np.zeros(registry.capacity, dtype=bool)
+        mask[[registry.slot(cloudlet.uuid) for cloudlet in cloudlets]] = True
+        return cls.from_mask(mask)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    def slots(self) -> np.ndarray:
+        """Candidate slots in slot order."""
+        return np.flatnonzero(self.mask)
+
+    def settled(self) -> np.ndarray:
+        """Mask of candidates that have been ranked."""
+        return self.mask & ~np.isnan(self.scores)
+
+    def ranked(self, limit: int | None = None) -> np.ndarray:
+        """Settled slots ordered by score, ties are broken by slot.
+
+        With a limit only the best `limit` slots are selected and sorted.
+        """
+        settled = np.flatnonzero(self.settled())
+        scores = self.scores[settled]
+        if limit is not None and limit < len(settled):
+            best = np.argpartition(scores, limit - 1)[:limit]
+            settled, scores = settled[best], scores[best]
+        return settled[np.lexsort((settled, scores))]
+
+    def unranked(self, limit: int | None = None) -> Candidates:
+        """Candidates that are left for the next stage."""
+        return Candidates.from_mask(self.mask & np.isnan(self.scores), limit)
+
+
 # Type definition for a Sinfonia Tier1 match function
 Tier1MatchFunction = Callable[
     [ClientInfo, DeploymentRecipe, List[Cloudlet]], Iterator[Cloudlet]
 ]
 
+# Type definition for a Sinfonia Tier1 match pipeline stage
+Tier1MatchStage = Callable[
+    [ClientInfo, DeploymentRecipe, CloudletRegistry, Candidates], Candidates
+]
+
 
 def get_match_function_plugins() -> dict[str, EntryPoint]:
     """Returns a list of match function plugin entrypoints"""
     return {ep.name: ep for ep in entry_points(group="src.sinfonia.tier1_matchers")}
 
 
+def tier1_stage(stage: Tier1MatchStage) -> Tier1MatchStage:
+    """Mark a function as implementing the Tier1MatchStage interface."""
+    setattr(stage, "tier1_stage", True)
+    return stage
+
+
+def legacy_stage(match_function: Tier1MatchFunction) -> Tier1MatchStage:
+    """Wrap a list based Tier1MatchFunction as a pipeline stage.
+
+    The match function works on a private list of the candidate cloudlets,
+    yielded cloudlets are settled in the order they were returned.
+    """
+
+    @tier1_stage
+    @wraps(match_function)
+    def stage(
+        client_info: ClientInfo,
+        deployment_recipe: DeploymentRecipe,
+        registry: CloudletRegistry,
+        candidates: Candidates,
+    ) -> Candidates:
+        # slots of the candidates as they were when we looked them up, the
+        # registry may change while the match function runs
+        slots: dict[UUID, int] = {}
+        cloudlets = []
+        for slot in candidates.slots().tolist():
+            try:
+                cloudlet = registry.cloudlet(slot)
+            except KeyError:
+                continue  # expired while we were matching
+            slots[cloudlet.uuid] = slot
+            cloudlets.append(cloudlet)
+        remaining = cloudlets[:]
+
+        scores = np.full(len(candidates.mask), np.nan)
+        for rank, cloudlet in enumerate(
+            match_function(client_info, deployment_recipe, remaining)
+        ):
+            slot = slots.get(cloudlet.uuid)
+            if slot is not None and np.isnan(scores[slot]):
+                scores[slot] = rank
+
+        mask = ~np.isnan(scores)
+        for cloudlet in remaining:
+            if cloudlet.uuid in slots:
+                mask[slots[cloudlet.uuid]] = True
+        return Candidates(candidates.mask & mask, scores)
+
+    return stage
+
+
+def as_stage(match_function: Tier1MatchFunction | Tier1MatchStage) -> Tier1MatchStage:
+    """Return the pipeline stage for a (possibly legacy) match function."""
+    stage = getattr(match_function, "stage", match_function)
+    if getattr(stage, "tier1_stage", False):
+        return stage
+    return legacy_stage(match_function)
+
+
+def _as_match_function(stage: Tier1MatchStage) -> Tier1MatchFunction:
+    """Expose a pipeline stage through the list based Tier1MatchFunction
+    interface. Dropped and settled cloudlets are removed from the list.
+    """
+
+    @wraps(stage)
+    def match_function(
+        client_info: ClientInfo,
+        deployment_recipe: DeploymentRecipe,
+        cloudlets: list[Cloudlet],
+    ) -> Iterator[Cloudlet]:
+        registry = _registry_for(cloudlets)
+        result = stage(
+            client_info,
+            deployment_recipe,
+            registry,
+            Candidates.from_cloudlets(registry, cloudlets),
+        )
+        remaining = result.unranked().mask
+        cloudlets[:] = [
+            cloudlet
+            for cloudlet in cloudlets
+            if remaining[registry.slot(cloudlet.uuid)]
+        ]
+        for slot in result.ranked().tolist():
+            yield registry.cloudlet(slot)
+
+    setattr(match_function, "stage", stage)
+    return match_function
+
+
 def tier1_best_match(
-    match_functions: Sequence[Tier1MatchFunction],
+    match_functions: Sequence[Tier1MatchFunction | Tier1MatchStage],
     client_info: ClientInfo,
     deployment_recipe: DeploymentRecipe,
-    cloudlets: list[Cloudlet],
+    cloudlets: CloudletRegistry | list[Cloudlet],
+    max_results: int | None = None,
 ) -> Iterator[Cloudlet]:
-    """Generator which yields cloudlets based on selected matchers."""
-    for matcher in match_functions:
-        yield from matcher(client_info, deployment_recipe, cloudlets)
+    """Generator which yields cloudlets based on selected matchers.
+
+    Stops running matchers once max_results cloudlets have been settled.
+    """
+    if isinstance(cloudlets, CloudletRegistry):
+        registry = cloudlets
+        active, generations = registry.pin()
+        candidates = Candidates.from_mask(active, max_results)
+    else:
+        registry = _registry_for(cloudlets)
+        _, generations = registry.pin()
+        candidates = Candidates.from_cloudlets(registry, cloudlets).unranked(
+            max_results
+        )
+
+    remaining = max_results
+    for stage in map(as_stage, match_functions):
+        if not candidates.mask.any() or remaining == 0:
+            return
+
+        result = stage(client_info, deployment_recipe, registry, candidates)
+        for slot in result.ranked(remaining).tolist():
+            try:
+                cloudlet = registry.cloudlet(slot, int(generations[slot]))
+            except (KeyError, IndexError):
+                continue  # expired (or replaced) while we were matching
+            yield cloudlet
+            if remaining is not None:
+                remaining -= 1
+
+        candidates = result.unranked(remaining)
+
+
+def _registry_for(cloudlets: list[Cloudlet]) -> CloudletRegistry:
+    """Returns the Tier1 cloudlet registry when it holds all candidates,
+    otherwise builds a temporary registry for just these cloudlets.
+    """
+    registry = current_app.config.get("cloudlets")
+    if isinstance(registry, CloudletRegistry) and registry.covers(cloudlets):
+        return registry
+    mode = current_app.config.get("DISTANCE_MODE", DistanceMode.GEODESIC)
+    return CloudletRegistry.from_cloudlets(
+        cloudlets, location_index=LocationIndex(mode=mode)
+    )
 
 
 # ------------------ Collection of Match functions follows --------------
 
 
-def match_by_network(
+@tier1_stage
+def network_stage(
     client_info: ClientInfo,
     _deployment_recipe: DeploymentRecipe,
-    cloudlets: list[Cloudlet],
-) -> Iterator[Cloudlet]:
-    """Yields any cloudlets that claim to be local.
-    Also removes cloudlets that explicitly blacklist the client address
+    registry: CloudletRegistry,
+    candidates: Candidates,
+) -> Candidates:
+    """Settles any cloudlets that claim to be local.
+    Also drops cloudlets that explicitly blacklist the client address, or
+    that do not accept clients from the client address.
     """
-    
     logger.debug("[matchers] Network matcher")
 
-    # Used to jump the loop whenever a cloudlet can be removed from the list
-    class DropCloudlet(Exception):
-        pass
+    size = len(candidates.mask)
+    match = registry.network_index.lookup(client_info.ipaddress)
+    rejected = bitset_mask(match.rejected, size)
+    local = bitset_mask(match.local, size)
+    accepted = bitset_mask(match.accepted, size)
 
-    for cloudlet in cloudlets[:]:        
-        try:
-            for network in cloudlet.rejected_clients:
-                if client_info.ipaddress in network:
-                    logger.debug("[matchers] Cloudlet (%s) would reject client", cloudlet.name)
-                    raise DropCloudlet
-
-            for network in cloudlet.local_networks:
-                if client_info.ipaddress in network:
-                    logger.debug("[matchers] Network (%s)", cloudlet.name)
-                    cloudlets.remove(cloudlet)
-                    yield cloudlet
-                    continue
-
-            for network in cloudlet.accepted_clients:
-                if client_info.ipaddress not in network:
-                    logger.debug("[matchers] Cloudlet (%s) will not accept client", cloudlet.name)
-                    raise DropCloudlet
-                
-            yield cloudlet
-            cloudlets.remove(cloudlet)
-        except DropCloudlet:
-            cloudlets.remove(cloudlet)
+    mask = candidates.mask & ~rejected & (local | accepted)
+    logger.debug(
+        "[matchers] Network dropped %d, local %d",
+        len(candidates) - np.count_nonzero(mask),
+        np.count_nonzero(mask & local),
+    )
+    return Candidates(mask, np.where(mask & local, 0.0, np.nan))
 
 
 def _estimated_rtt(distance_in_km):
@@ -112,57 +332,52 @@ def _estimated_rtt(distance_in_km):
     return 2 * (distance_in_km / speed_of_light)
 
 
-def match_by_location(
+@tier1_stage
+def location_stage(
     client_info: ClientInfo,
     _deployment_recipe: DeploymentRecipe,
-    cloudlets: list[Cloudlet],
-) -> Iterator[Cloudlet]:
-    """Yields any geographically close cloudlets"""
-    
+    registry: CloudletRegistry,
+    candidates: Candidates,
+) -> Candidates:
+    """Ranks geographically close cloudlets by distance.
+    Drops cloudlets with a known location further away than MAX_DIST_KM.
+    """
     logger.debug("[matchers] Location matcher")
-    
+
     if client_info.location is None:
         logger.warning(f"[matcher] client info location None")
-        return
-
-    by_distance = []
-
-    for cloudlet in cloudlets:
-        distance = cloudlet.distance_from(client_info.location)
-        if distance is not None:
-            by_distance.append((distance, cloudlet))
-
-    if not by_distance:
-        logger.warning(f"[matcher] by distance None")
-        logger.warning(f"[matcher] client location {client_info.location}")
-        return
-    
-    MAX_DIST_KM = 1000.0
-
-    by_distance.sort(key=itemgetter(0))
-    for distance_km, cloudlet in by_distance:
-        if distance_km > MAX_DIST_KM:
-            cloudlets.remove(cloudlet)
-            continue
-        
-        logger.debug(f"[matcher] yield {cloudlet}")
-        yield cloudlet
+        return candidates
+
+    size = len(candidates.mask)
+    scores = np.full(size, np.nan)
+    for distance_km, uuid in registry.location_index.within(
+        client_info.location, MAX_DIST_KM
+    ):
+        try:
+            slot = registry.slot(uuid)
+        except KeyError:
+            continue  # expired while we were matching
+        if slot < size:
+            scores[slot] = distance_km
+
+    located = ~np.isnan(registry.column("latitude")[:size])
+    mask = candidates.mask & (~located | ~np.isnan(scores))
+    return Candidates(mask, np.where(mask, scores, np.nan))
 
 
-def match_random(
+@tier1_stage
+def random_stage(
     _client_info: ClientInfo,
     _deployment_recipe: DeploymentRecipe,
-    cloudlets: list[Cloudlet],
-) -> Iterator[Cloudlet]:
-    """Shuffle anything that is left and return in randomized order"""
-    
+    _registry: CloudletRegistry,
+    candidates: Candidates,
+) -> Candidates:
+    """Rank anything that is left in randomized order"""
     logger.debug("[matchers] Random matcher")
-    
-    random.shuffle(cloudlets)
-    for cloudlet in cloudlets[:]:
-        logger.info("random (%s)", cloudlet.name)
-        cloudlets.remove(cloudlet)
-        yield cloudlet
+
+    scores = np.full(len(candidates.mask), np.nan)
+    scores[candidates.mask] = np.random.default_rng().random(len(candidates))
+    return Candidates(candidates.mask, scores)
 
 
 # def _append_to_csv(path: str, header: List[Any], row: List[Any]):
@@ -186,32 +401,186 @@ def match_random(
 #         writer.writerow(row)
 
 
-def match_carbon_intensity(
+@tier1_stage
+def carbon_intensity_stage(
     _client_info: ClientInfo,
     _deployment_recipe: DeploymentRecipe,
-    cloudlets: list[Cloudlet],
-) -> Iterator[Cloudlet]:
-    """Yields cloudlet recommendations based on lowest carbon intensity level"""
-    
+    registry: CloudletRegistry,
+    candidates: Candidates,
+) -> Candidates:
+    """Ranks cloudlets by lowest carbon intensity level.
+    Cloudlets that did not report a carbon intensity are ranked last.
+    """
     logger.debug("[matchers] Carbon intensity matcher")
-    # for c in cloudlets:
-    #     logger.debug(f"[matchers] {c.endpoint} {c.resources['carbon_intensity_gco2_kwh']}")
-    
-    # Sort cloudlets by lowest carbon intensity level
-    cloudlets = sorted(cloudlets, key=lambda c: c.resources['carbon_intensity_gco2_kwh'])
-
-    # Append decision to persistent log
-    # This is for debugging purposes only
-    # timestamp = int(time.time())
-    # names = [c.name for c in cloudlets]
-    # carbon_intensity = [c.resources['carbon_intensity_gco2_kwh'] for c in cloudlets]
-    # _append_to_csv(
-    #     path=CARBON_INTENSITY_LOG_FILE_PATH,
-    #     header=CARBON_INTENSITY_CSV_HEADER,
-    #     row=[timestamp, names, carbon_intensity]
-    # )
-
-    # Yield cloudlets
-    for cloudlet in cloudlets:
-        cloudlets.remove(cloudlet)
-        yield cloudlet
+
+    size = len(candidates.mask)
+    if candidates.limit is None:
+        carbon_intensity = registry.column("carbon_intensity")[:size]
+        scores = np.where(np.isnan(carbon_intensity), np.inf, carbon_intensity)
+        return Candidates(candidates.mask, np.where(candidates.mask, scores, np.nan))
+
+    # only walk the head of the carbon index until we found enough candidates
+    scores = np.full(size, np.nan)
+    settled = 0
+    for carbon_intensity, slot in registry.carbon_index:
+        if settled == candidates.limit:
+            break
+        if slot < size and candidates.mask[slot] and np.isnan(scores[slot]):
+            scores[slot] = np.inf if carbon_intensity is None else carbon_intensity
+            settled += 1
+    return Candidates(candidates.mask, scores, candidates.limit)
+
+
+class WeightedMode(Enum):
+    LINEAR = "linear"
+    PARETO = "pareto"
+
+
+def _weighted_config() -> tuple[dict[str, float], WeightedMode]:
+    config = current_app.config
+    weights = dict(config.get("WEIGHTED_MATCHER_WEIGHTS", WEIGHTED_DEFAULT_WEIGHTS))
+    for objective, weight in weights.items():
+        if objective not in WEIGHTED_OBJECTIVES:
+            raise ValueError(f"Unknown weighted matcher objective '{objective}'")
+        if weight < 0:
+            raise ValueError(f"Negative weight for objective '{objective}'")
+    mode = WeightedMode(config.get("WEIGHTED_MATCHER_MODE", WeightedMode.LINEAR))
+    return weights, mode
+
+
+def _normalized(values: np.ndarray) -> np.ndarray:
+    """Scale values to [0, 1] across candidates, unknown values are worst."""
+    known = ~np.isnan(values)
+    if not known.any():
+        return np.ones_like(values)
+    low, high = values[known].min(), values[known].max()
+    scaled = (values - low) / (high - low) if high > low else np.zeros_like(values)
+    return np.where(known, scaled, 1.0)
+
+
+def _objectives(
+    client_info: ClientInfo,
+    registry: CloudletRegistry,
+    slots: np.ndarray,
+    weights: dict[str, float],
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the normalized candidates x objectives matrix and its weights.
+    Objectives without weight, or distance for an unlocated client, are left out.
+    """
+    columns = []
+    used = []
+    for objective in WEIGHTED_OBJECTIVES:
+        weight = weights.get(objective, 0.0)
+        if not weight:
+            continue
+
+        if objective == "distance":
+            if client_info.location is None:
+                continue
+            # distance to the closest location of each cloudlet, like the
+            # location stage
+            uuids: list[UUID | None] = []
+            for slot in slots.tolist():
+                try:
+                    uuids.append(registry.cloudlet(slot).uuid)
+                except KeyError:
+                    uuids.append(None)
+            values = registry.location_index.closest(client_info.location, uuids)
+        else:
+            values = registry.column(objective)[slots]
+
+        columns.append(_normalized(values))
+        used.append(weight)
+
+    if not columns:
+        return np.zeros((len(slots), 0)), np.zeros(0)
+    return np.column_stack(columns), np.array(used)
+
+
+def _dominated(points: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Mask of points that are dominated by any of the others."""
+    dominated = np.zeros(len(points), dtype=bool)
+    if not len(points) or not len(others):
+        return dominated
+
+    step = max(1, PARETO_CHUNK_SIZE // (len(points) * points.shape[1]))
+    for start in range(0, len(others), step):
+        chunk = others[None, start : start + step]
+        dominated |= (
+            (chunk <= points[:, None]).all(axis=2)
+            & (chunk < points[:, None]).any(axis=2)
+        ).any(axis=1)
+    return dominated
+
+
+def _pareto_front(points: np.ndarray, limit: int | None = None) -> np.ndarray:
+    """Mask of the non-dominated points.
+
+    Points have to be ordered by a positively weighted sum of their objectives,
+    a point can then only be dominated by points that precede it, so every
+    batch only has to be checked against itself and the front found so far.
+    This also means that we can stop once we found `limit` points on the front.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    front = points[:0]
+    for start in range(0, len(points), PARETO_BATCH_SIZE):
+        if limit is not None and len(front) >= limit:
+            break
+        # most points are dominated by the (small) front found so far
+        batch = start + np.flatnonzero(
+            ~_dominated(points[start : start + PARETO_BATCH_SIZE], front)
+        )
+        survivors = batch[~_dominated(points[batch], points[batch])]
+        keep[survivors] = True
+        front = np.concatenate((front, points[survivors]))
+    return keep
+
+
+@tier1_stage
+def weighted_stage(
+    client_info: ClientInfo,
+    _deployment_recipe: DeploymentRecipe,
+    registry: CloudletRegistry,
+    candidates: Candidates,
+) -> Candidates:
+    """Ranks cloudlets on distance, carbon intensity, cpu and memory load.
+
+    Weights and mode are taken from the WEIGHTED_MATCHER_WEIGHTS and
+    WEIGHTED_MATCHER_MODE settings. In linear mode cloudlets are ranked by the
+    weighted sum of their normalized objectives. In pareto mode cloudlets are
+    ranked by successive pareto fronts, and by the weighted sum within a front.
+    """
+    logger.debug("[matchers] Weighted matcher")
+
+    weights, mode = _weighted_config()
+    slots = candidates.slots()
+    objectives, used = _objectives(client_info, registry, slots, weights)
+
+    linear = objectives @ used / used.sum() if used.size else np.zeros(len(slots))
+    scores = np.full(len(candidates.mask), np.nan)
+
+    if mode is WeightedMode.LINEAR:
+        scores[slots] = linear
+        return Candidates(candidates.mask, scores, candidates.limit)
+
+    # peel off pareto fronts until we have settled enough candidates
+    remaining = np.argsort(linear, kind="stable")
+    needed = len(slots) if candidates.limit is None else candidates.limit
+    front = 0
+    while remaining.size and needed > 0:
+        nondominated = _pareto_front(objectives[remaining], needed)
+        settled = remaining[nondominated]
+        # linear is in [0, 1], so it only breaks ties within a front
+        scores[slots[settled]] = front + linear[settled] / 2
+        remaining = remaining[~nondominated]
+        needed -= len(settled)
+        front += 1
+    return Candidates(candidates.mask, scores, candidates.limit)
+
+
+# Tier1MatchFunction interface to the matcher stages
+match_by_network = _as_match_function(network_stage)
+match_by_location = _as_match_function(location_stage)
+match_random = _as_match_function(random_stage)
+match_carbon_intensity = _as_match_function(carbon_intensity_stage)
+match_weighted = _as_match_function(weighted_stage)
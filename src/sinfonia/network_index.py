@@ -0,0 +1,166 @@
+#
+# Sinfonia
+#
+# Network membership index over the client ACLs of known cloudlets
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Binary radix trie over the networks advertised by cloudlets.
+
+Cloudlets are identified by their (small, dense) registry slot. Each trie
+node, which corresponds to a network prefix, holds three bitsets (python ints)
+with the slots of the cloudlets that list the prefix in their rejected_clients,
+local_networks or accepted_clients. Walking the trie along the bits of a client
+address passes every prefix that contains the address, so a single lookup
+returns which cloudlets would reject, consider local, or accept the client.
+Cloudlets with an empty accepted_clients list accept any client.
+"""
+
+from __future__ import annotations
+
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Iterator
+
+import numpy as np
+from attrs import define, field
+
+from .cloudlets import Cloudlet
+
+
+class _Node:
+    __slots__ = ("children", "rejected", "local", "accepted")
+
+    def __init__(self) -> None:
+        self.children: list[_Node | None] = [None, None]
+        self.rejected = 0
+        self.local = 0
+        self.accepted = 0
+
+    def is_empty(self) -> bool:
+        return not (
+            self.rejected
+            or self.local
+            or self.accepted
+            or self.children[0]
+            or self.children[1]
+        )
+
+
+@define(frozen=True)
+class NetworkMatch:
+    """Bitsets of cloudlet slots whose network lists contain the client address."""
+
+    rejected: int = 0
+    local: int = 0
+    accepted: int = 0
+
+
+def _bits(address: int, max_prefixlen: int, prefixlen: int) -> Iterator[int]:
+    for shift in range(max_prefixlen - 1, max_prefixlen - prefixlen - 1, -1):
+        yield (address >> shift) & 1
+
+
+@define
+class NetworkIndex:
+    """Incrementally updated IPv4/IPv6 network membership trie."""
+
+    _roots: dict[int, _Node] = field(
+        init=False, factory=lambda: {4: _Node(), 6: _Node()}
+    )
+    _networks: dict[int, list[tuple[str, IPv4Network | IPv6Network]]] = field(
+        init=False, factory=dict
+    )
+    # slots of cloudlets without accepted_clients, which accept everyone
+    _accept_all: int = field(init=False, default=0)
+
+    def __len__(self) -> int:
+        return len(self._networks)
+
+    def __contains__(self, slot: object) -> bool:
+        return slot in self._networks
+
+    def add(self, slot: int, cloudlet: Cloudlet) -> None:
+        """Add (or replace) the network lists of the cloudlet in slot."""
+        self.remove(slot)
+
+        networks = [
+            *(("rejected", network) for network in cloudlet.rejected_clients),
+            *(("local", network) for network in cloudlet.local_networks),
+            *(("accepted", network) for network in cloudlet.accepted_clients),
+        ]
+        mask = 1 << slot
+        for kind, network in networks:
+            node = self._roots[network.version]
+            for bit in _bits(
+                int(network.network_address), network.max_prefixlen, network.prefixlen
+            ):
+                child = node.children[bit]
+                if child is None:
+                    child = node.children[bit] = _Node()
+                node = child
+            setattr(node, kind, getattr(node, kind) | mask)
+        if not cloudlet.accepted_clients:
+            self._accept_all |= mask
+        self._networks[slot] = networks
+
+    def remove(self, slot: int) -> None:
+        """Drop all networks of the cloudlet in slot, ignores unknown slots."""
+        mask = ~(1 << slot)
+        self._accept_all &= mask
+        for kind, network in self._networks.pop(slot, ()):
+            path = [self._roots[network.version]]
+            for bit in _bits(
+                int(network.network_address), network.max_prefixlen, network.prefixlen
+            ):
+                child = path[-1].children[bit]
+                if child is None:
+                    break
+                path.append(child)
+            else:
+                node = path[-1]
+                setattr(node, kind, getattr(node, kind) & mask)
+
+            # prune nodes that no longer hold any networks
+            for depth in range(len(path) - 1, 0, -1):
+                if not path[depth].is_empty():
+                    break
+                parent = path[depth - 1]
+                parent.children[parent.children.index(path[depth])] = None
+
+    def lookup(self, address: IPv4Address | IPv6Address) -> NetworkMatch:
+        """Find all cloudlets with a network list entry containing address."""
+        node: _Node | None = self._roots[address.version]
+        rejected = local = 0
+        accepted = self._accept_all
+        for bit in _bits(int(address), address.max_prefixlen, address.max_prefixlen):
+            assert node is not None
+            rejected |= node.rejected
+            local |= node.local
+            accepted |= node.accepted
+            node = node.children[bit]
+            if node is None:
+                break
+        else:
+            assert node is not None
+            rejected |= node.rejected
+            local |= node.local
+            accepted |= node.accepted
+
+        return NetworkMatch(rejected=rejected, local=local, accepted=accepted)
+
+
+def slots(bitset: int) -> Iterator[int]:
+    """Yield the slots that are set in a bitset, lowest first."""
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def bitset_mask(bitset: int, size: int) -> np.ndarray:
+    """Convert a bitset into a boolean array over the first size slots."""
+    nbytes = max((size + 7) // 8, (bitset.bit_length() + 7) // 8)
+    packed = np.frombuffer(bitset.to_bytes(nbytes, "little"), dtype=np.uint8)
+    return np.unpackbits(packed, count=size, bitorder="little").astype(bool)
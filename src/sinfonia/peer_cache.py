@@ -0,0 +1,248 @@
+#
+# Sinfonia
+#
+# In-memory cache of the kilo Peer objects of our deployments
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Watch based cache of deployment Peer objects.
+
+Looking up the Peer objects of a deployment with `kubectl get peer -l ...`
+spawns a process and makes a round trip to the API server, which happens
+several times for every deploy request. Instead we keep a single long-running
+watch (`kubectl get peer --watch`, or a Kubernetes API watch) that streams
+changes, and maintain a copy of all `findcloudlet.org=deployment` peers
+indexed on the uuid, key and client address labels.
+
+The cache only answers queries once it has been synced with a full listing of
+the peers, until then (or when the selector uses a label that is not indexed)
+callers fall back on querying the cluster backend. The watch is restarted
+and the listing refreshed every resync_seconds to recover from missed events.
+Objects are only replaced by newer versions, based on their resourceVersion,
+so a stale listing cannot resurrect peers that the watch has already seen
+deleted. Lookups return copies, callers are free to modify them.
+"""
+
+from __future__ import annotations
+
+import threading
+from copy import deepcopy
+from typing import Any
+
+from attrs import define, field
+
+from .cluster_backend import ClusterBackend, ClusterBackendError, PeerWatch
+
+from src.domain.logger import get_default_logger
+
+logger = get_default_logger()
+
+PEER_SELECTOR = "findcloudlet.org=deployment"
+INDEXED_LABELS = (
+    "findcloudlet.org/uuid",
+    "findcloudlet.org/key",
+    "findcloudlet.org/client",
+)
+
+Manifest = dict[str, Any]
+
+
+def _resource_version(manifest: Manifest) -> int:
+    """Resource versions are opaque strings, but etcd backed versions are
+    increasing integers. Anything else is treated as always up to date.
+    """
+    try:
+        return int(manifest["metadata"]["resourceVersion"])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+@define
+class PeerCache:
+    """Thread-safe cache of peers with label indexes, fed by a watch."""
+
+    backend: ClusterBackend
+    selector: str = PEER_SELECTOR
+    resync_seconds: float = 300.0
+
+    _peers: dict[str, Manifest] = field(init=False, factory=dict)
+    # last resourceVersion seen by name, also remembers recently deleted peers
+    _versions: dict[str, int] = field(init=False, factory=dict)
+    _index: dict[str, dict[str, set[str]]] = field(
+        init=False, factory=lambda: {label: {} for label in INDEXED_LABELS}
+    )
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+    _synced: threading.Event = field(init=False, factory=threading.Event)
+    _stopped: threading.Event = field(init=False, factory=threading.Event)
+    _watch: PeerWatch | None = field(init=False, default=None)
+    _thread: threading.Thread | None = field(init=False, default=None)
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def wait_synced(self, timeout: float | None = None) -> bool:
+        return self._synced.wait(timeout)
+
+    # lookups
+
+    def get(self, name: str) -> Manifest | None:
+        with self._lock:
+            return deepcopy(self._peers.get(name))
+
+    def select(self, *selectors: str) -> list[Manifest] | None:
+        """Return peers matching all label=value selectors, or None when the
+        cache cannot answer the query.
+        """
+        if not self.synced:
+            return None
+
+        with self._lock:
+            names: set[str] | None = None
+            for selector in selectors:
+                if selector == self.selector:
+                    continue
+                label, sep, value = selector.partition("=")
+                if not sep or label not in self._index:
+                    return None
+                matches = self._index[label].get(value, set())
+                names = matches if names is None else names & matches
+            if names is None:
+                names = set(self._peers)
+            return [deepcopy(self._peers[name]) for name in sorted(names)]
+
+    # updates, also used to write through changes we make ourselves
+
+    def apply(self, manifest: Manifest) -> None:
+        with self._lock:
+            self._apply(manifest)
+
+    def delete(self, manifest_or_name: Manifest | str) -> None:
+        with self._lock:
+            self._delete(manifest_or_name)
+
+    def replace(self, items: list[Manifest], resource_version: int) -> None:
+        """Reconcile with a full listing at resource_version."""
+        with self._lock:
+            listed = set()
+            for manifest in items:
+                listed.add(manifest["metadata"]["name"])
+                self._apply(manifest)
+
+            for name in list(self._peers):
+                if name not in listed and self._versions[name] <= resource_version:
+                    self._delete(name)
+
+            for name in list(self._versions):
+                if name not in self._peers and self._versions[name] <= resource_version:
+                    del self._versions[name]
+        self._synced.set()
+
+    def _apply(self, manifest: Manifest) -> None:
+        name = manifest["metadata"]["name"]
+        version = _resource_version(manifest)
+        known = self._versions.get(name)
+        if known is not None and (
+            version < known or (version == known and name not in self._peers)
+        ):
+            return  # older than what we have, or than when it was deleted
+
+        self._unindex(name)
+        self._peers[name] = manifest
+        self._versions[name] = version
+        labels = manifest["metadata"].get("labels", {})
+        for label, index in self._index.items():
+            if label in labels:
+                index.setdefault(labels[label], set()).add(name)
+
+    def _delete(self, manifest_or_name: Manifest | str) -> None:
+        if isinstance(manifest_or_name, str):
+            name, version = manifest_or_name, self._versions.get(manifest_or_name, 0)
+        else:
+            name = manifest_or_name["metadata"]["name"]
+            version = _resource_version(manifest_or_name)
+            if version < self._versions.get(name, 0):
+                return
+
+        self._unindex(name)
+        self._peers.pop(name, None)
+        self._versions[name] = version
+
+    def _unindex(self, name: str) -> None:
+        manifest = self._peers.get(name)
+        if manifest is None:
+            return
+        labels = manifest["metadata"].get("labels", {})
+        for label, index in self._index.items():
+            names = index.get(labels.get(label, ""))
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del index[labels[label]]
+
+    def handle_event(self, event: dict[str, Any]) -> None:
+        """Apply a watch event."""
+        kind, manifest = event.get("type"), event.get("object")
+        if not isinstance(manifest, dict) or "metadata" not in manifest:
+            return
+        if kind in ("ADDED", "MODIFIED"):
+            self.apply(manifest)
+        elif kind == "DELETED":
+            self.delete(manifest)
+
+    # background watch
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="peer-cache", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        watch = self._watch
+        if watch is not None:
+            watch.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def resync(self) -> None:
+        """List all peers and reconcile the cache with the result."""
+        # kubectl does not return the resourceVersion of a List, but versions
+        # increase, so the listing is at least as recent as anything we have
+        # seen before and any of the listed items
+        with self._lock:
+            known = max(self._versions.values(), default=0)
+        result = self.backend.list_peers(self.selector)
+        items = result.get("items", [])
+        resource_version = _resource_version(result) or max(
+            [known, *(_resource_version(manifest) for manifest in items)]
+        )
+        self.replace(items, resource_version)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                # the watch is restarted periodically to pick up any events
+                # we missed, it is started before listing so that changes
+                # made while listing are seen by the watch as well
+                watch = self._watch = self.backend.watch_peers(
+                    self.selector, self.resync_seconds
+                )
+                try:
+                    self.resync()
+                    for event in watch:
+                        self.handle_event(event)
+                finally:
+                    watch.close()
+            except (ClusterBackendError, OSError, ValueError):
+                logger.exception("[peer_cache] failed to watch peers")
+                # fall back on the backend until we have a fresh listing
+                self._synced.clear()
+            self._stopped.wait(1.0)
@@ -0,0 +1,151 @@
+#
+# Sinfonia
+#
+# Cache of parsed and validated deployment recipes
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Bounded LRU cache of deployment recipes.
+
+A single deploy request looks up the same recipe several times, and the
+expiration job looks up the recipe of every deployment. Without a cache each
+lookup reads or fetches the recipe document, parses the YAML and validates it.
+
+Entries remember a validator for the document they were loaded from, the
+modification time of a local file or the ETag/Last-Modified header of a remote
+one. Entries older than max_age are revalidated, a recipe is only parsed again
+when the document changed. Lookups of recipes that do not exist are cached
+for negative_ttl seconds so repeated requests for unknown recipes do not each
+hit the repository. Other failures, such as timeouts or server errors, may be
+transient and are not cached.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import requests
+from attrs import define, field
+
+# opaque token identifying the version of a recipe document
+Validator = tuple[str, str]
+Loader = Callable[[Validator | None], tuple[Any, Validator | None]]
+
+
+def is_not_found(error: Exception) -> bool:
+    """Whether a failed load means the recipe does not exist."""
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in (404, 410)
+    return isinstance(error, (FileNotFoundError, ValueError))
+
+
+def _fresh(error: Exception) -> Exception:
+    """Copy of a cached error, raising the same instance from several threads
+    would mix up their tracebacks.
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        return error.with_traceback(None)
+
+
+@define
+class _Entry:
+    checked: float
+    value: Any = None
+    validator: Validator | None = None
+    error: Exception | None = None
+
+
+@define
+class RecipeCache:
+    """Thread-safe LRU cache of the recipes of a repository."""
+
+    maxsize: int = 1024
+    max_age: float = 5.0
+    negative_ttl: float = 10.0
+    # which load failures are cached
+    negative: Callable[[Exception], bool] = is_not_found
+
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    evictions: int = field(init=False, default=0)
+
+    _entries: OrderedDict[Hashable, _Entry] = field(init=False, factory=OrderedDict)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, load: Loader) -> Any:
+        """Return the cached recipe for key.
+
+        load is called with the validator of the cached entry, or None, and
+        returns a (recipe, validator) tuple. The recipe is None when the
+        document did not change. Exceptions raised by load that match the
+        negative predicate are cached for negative_ttl seconds and raised again
+        for every lookup.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.error is not None:
+                    if now < entry.checked + self.negative_ttl:
+                        self.hits += 1
+                        raise _fresh(entry.error)
+                    entry = None
+                elif now < entry.checked + self.max_age:
+                    self.hits += 1
+                    return entry.value
+            self.misses += 1
+
+        # don't hold the lock while we are fetching the recipe
+        try:
+            value, validator = load(entry.validator if entry is not None else None)
+        except Exception as e:
+            if self.negative(e):
+                self._store(key, _Entry(now, error=e))
+            raise
+
+        if value is None:
+            assert entry is not None
+            value = entry.value
+        self._store(key, _Entry(now, value, validator))
+        return value
+
+    def _store(self, key: Hashable, entry: _Entry) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,141 @@
+#
+# Sinfonia
+#
+# Keep pre-installed backends ready to be assigned to clients
+#
+# Copyright (c) 2022 Carnegie Mellon University
+#
+# SPDX-License-Identifier: MIT
+#
+"""Pools of pre-installed, unassigned deployments by recipe.
+
+Installing a helm chart on the request path means the client waits for the
+namespace to be created, the chart to be fetched and the pods to be scheduled.
+When a recipe specifies `warm_pool: N`, Tier2 keeps up to N releases of that
+recipe installed without a Peer object. A deployment request takes one of
+these and only has to create the Peer that routes the client to it. The pool
+is then refilled in the background. At startup the pools of all recipes in
+the repository are filled.
+
+Warm releases are only tracked in memory, releases that are still idle when
+Tier2 exits should be removed with drain().
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable
+from uuid import UUID
+
+import randomname
+from attrs import define, field
+
+from .cluster_backend import ClusterBackend
+from .deployment_recipe import DeploymentRecipe
+from .deployment_repository import DeploymentRepository
+
+from src.domain.logger import get_default_logger
+
+logger = get_default_logger()
+
+
+@define
+class WarmPool:
+    """Thread-safe pools of idle releases, keyed by recipe uuid."""
+
+    backend: ClusterBackend
+    max_workers: int = 2
+
+    _idle: dict[UUID, deque[str]] = field(init=False, factory=dict)
+    _installing: Counter = field(init=False, factory=Counter)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+    _executor: ThreadPoolExecutor = field(init=False)
+
+    @_executor.default
+    def _default_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="warm-pool"
+        )
+
+    def idle(self, recipe: DeploymentRecipe) -> int:
+        with self._lock:
+            return len(self._idle.get(recipe.uuid, ()))
+
+    def take(self, recipe: DeploymentRecipe) -> str | None:
+        """Name of an idle release of recipe, None when none are ready."""
+        with self._lock:
+            idle = self._idle.get(recipe.uuid)
+            name = idle.popleft() if idle else None
+
+        if recipe.warm_pool:
+            self.fill(recipe)
+        return name
+
+    def fill(self, recipe: DeploymentRecipe) -> list[Future]:
+        """Start installing releases until the pool of recipe is full."""
+        with self._lock:
+            ready = len(self._idle.get(recipe.uuid, ()))
+            needed = recipe.warm_pool - ready - self._installing[recipe.uuid]
+            if needed <= 0:
+                return []
+            self._installing[recipe.uuid] += needed
+
+        futures = []
+        for _ in range(needed):
+            future = self._executor.submit(self._install, recipe)
+            future.add_done_callback(self._log_failure)
+            futures.append(future)
+        return futures
+
+    def fill_all(
+        self, repository: DeploymentRepository, recipe_uuids: Iterable[UUID] = ()
+    ) -> list[Future]:
+        """Fill the pools of all recipes with a warm_pool size in repository,
+        and of recipe_uuids for repositories that can not be listed.
+        """
+        futures = []
+        for uuid in sorted({*repository.recipe_uuids(), *recipe_uuids}):
+            try:
+                recipe = DeploymentRecipe.from_repo(repository, uuid)
+            except Exception:
+                logger.exception(f"[warm_pool] failed to load recipe {uuid}")
+                continue
+            if recipe.warm_pool:
+                futures.extend(self.fill(recipe))
+        return futures
+
+    def _install(self, recipe: DeploymentRecipe) -> None:
+        name = randomname.get_name()
+        try:
+            self.backend.install(name, recipe.chart_path(), recipe.values)
+        except Exception:
+            with self._lock:
+                self._installing[recipe.uuid] -= 1
+            self.backend.uninstall(name)
+            self.backend.delete_namespace(name)
+            raise
+
+        with self._lock:
+            self._installing[recipe.uuid] -= 1
+            self._idle.setdefault(recipe.uuid, deque()).append(name)
+        logger.debug(f"[warm_pool] {name} ready for {recipe.uuid}")
+
+    @staticmethod
+    def _log_failure(future: Future) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            logger.error("[warm_pool] failed to install release", exc_info=exc)
+
+    def drain(self) -> None:
+        """Stop refilling and remove all idle releases."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            names = [name for idle in self._idle.values() for name in idle]
+            self._idle.clear()
+        for name in names:
+            self.backend.uninstall(name)
+            self.backend.delete_namespace(name)
@@ -0,0 +1,67 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+from ipaddress import ip_address, ip_network
+
+import pytest
+
+from src.sinfonia.address_allocator import AddressAllocator
+from src.sinfonia.deployment import CLIENT_NETWORK
+
+
+class TestAddressAllocator:
+    def test_allocate(self):
+        network = ip_network("10.5.0.0/29")
+        allocator = AddressAllocator(network)
+        assert allocator.available == 6
+
+        allocated = {allocator.allocate() for _ in range(6)}
+        assert allocated == set(network.hosts())
+        assert len(allocator) == 6
+        assert all(address in allocator for address in allocated)
+
+        with pytest.raises(ValueError):
+            allocator.allocate()
+
+        allocator.release(ip_address("10.5.0.3"))
+        assert ip_address("10.5.0.3") not in allocator
+        assert allocator.allocate() == ip_address("10.5.0.3")
+
+    def test_reserve(self):
+        allocator = AddressAllocator(CLIENT_NETWORK)
+        address = ip_address("10.5.12.34")
+
+        assert allocator.reserve(address)
+        assert not allocator.reserve(address)
+        assert not allocator.reserve(ip_address("10.6.0.1"))
+        assert not allocator.reserve(CLIENT_NETWORK.network_address)
+        assert address in allocator
+
+        for _ in range(1000):
+            assert allocator.allocate() != address
+
+        allocator.release(address)
+        allocator.release(address)
+        assert allocator.available == CLIENT_NETWORK.num_addresses - 2 - 1000
+
+    def test_sync(self):
+        allocator = AddressAllocator(ip_network("10.5.0.0/28"))
+        pending = allocator.allocate()
+        confirmed = allocator.allocate()
+        allocator.confirm(confirmed)
+        allocator.reserve(ip_address("10.5.0.9"))
+
+        # recent allocations are kept until they show up in the cluster
+        in_use = ip_address("10.5.0.14")
+        allocator.sync([in_use])
+        assert pending in allocator
+        assert confirmed not in allocator or confirmed == in_use
+        assert ip_address("10.5.0.9") not in allocator or pending == ip_address(
+            "10.5.0.9"
+        )
+        assert in_use in allocator
+
+        allocator.pending_seconds = 0
+        allocator.sync([])
+        assert len(allocator) == 0
+        assert allocator.available == 14
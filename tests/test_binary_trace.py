@@ -0,0 +1,138 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from src.sinfonia.carbon.simulation import trace as carbon_trace
+from src.sinfonia.carbon.simulation.binary_trace import (
+    DTYPE_WIDTH,
+    HEADER,
+    MAGIC,
+    NAME_WIDTH,
+    convert_csv,
+    is_binary_trace,
+    read_trace,
+    write_trace,
+)
+from src.sinfonia.carbon.simulation.trace import CarbonTrace
+
+from .test_carbon_trace import HOUR, TRACE
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text(TRACE)
+    return path
+
+
+class TestBinaryTrace:
+    def test_convert(self, csv_path, tmp_path):
+        path = tmp_path / "trace.bin"
+        convert_csv(csv_path, path)
+
+        assert is_binary_trace(path)
+        assert not is_binary_trace(csv_path)
+        # text columns are kept, 3 x 7 bytes of zone padded to 24
+        assert path.stat().st_size == (
+            HEADER.size + 2 * (NAME_WIDTH + DTYPE_WIDTH) + 3 * 8 + 24 + 3 * 8
+        )
+
+        columns = read_trace(path)
+        assert list(columns) == [
+            "timestamp",
+            "zone",
+            "carbon_intensity_gco2_kwh_direct",
+        ]
+        assert isinstance(columns["timestamp"], np.memmap)
+        assert columns["timestamp"].tolist() == [0, HOUR, 2 * HOUR]
+        assert columns["zone"].tolist() == [b"US-TEST"] * 3
+        assert columns["carbon_intensity_gco2_kwh_direct"].dtype == np.float64
+        assert columns["carbon_intensity_gco2_kwh_direct"].tolist() == [
+            100.0,
+            200.0,
+            300.0,
+        ]
+        with pytest.raises(ValueError):
+            read_trace(csv_path)
+
+    def test_carbon_trace(self, csv_path, tmp_path, monkeypatch):
+        monkeypatch.setattr(carbon_trace, "RELOAD_CHECK_SECONDS", 0.0)
+        path = tmp_path / "trace.bin"
+        convert_csv(csv_path, path)
+
+        trace = CarbonTrace(path)
+        expected = CarbonTrace(csv_path)
+        for timestamp in range(-HOUR, 3 * HOUR, HOUR // 3):
+            assert trace.intensity(timestamp) == pytest.approx(
+                expected.intensity(timestamp)
+            )
+        # rows read the same as from the csv trace
+        for timestamp in (0, HOUR, 2 * HOUR):
+            assert trace.row(timestamp) == expected.row(timestamp)
+
+        # replaced atomically, the old mapping stays valid until reloaded
+        old = trace.columns
+        write_trace(
+            path, np.array([0, HOUR]), {"carbon_intensity_gco2_kwh_direct": [1, 2]}
+        )
+        os.utime(path, ns=(0, 0))
+        assert old["timestamp"].tolist() == [0, HOUR, 2 * HOUR]
+        assert trace.intensity(HOUR) == 2.0
+        assert trace.end == HOUR
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "trace.bin"
+        write_trace(path, np.array([], dtype=np.int64), {"a": []})
+        assert {k: len(v) for k, v in read_trace(path).items()} == {
+            "timestamp": 0,
+            "a": 0,
+        }
+        with pytest.raises(ValueError):
+            write_trace(path, np.array([0]), {"x" * (NAME_WIDTH + 1): [0.0]})
+
+    def test_precision(self, tmp_path):
+        path = tmp_path / "trace.bin"
+        write_trace(path, np.array([0, 1]), {"a": [0.1, 1e300], "b": [2**60, 1]})
+        trace = CarbonTrace(path)
+        assert trace.row(0) == {"timestamp": 0, "a": 0.1, "b": 2**60}
+        assert trace.row(1) == {"timestamp": 1, "a": 1e300, "b": 1}
+
+    def test_version_1(self, tmp_path):
+        path = tmp_path / "trace.bin"
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, 1, 0, 2, 1))
+            f.write(b"a".ljust(NAME_WIDTH, b"\0"))
+            f.write(np.array([0, 1], dtype="<i8").tobytes())
+            f.write(np.array([1.5, 2.5], dtype="<f4").tobytes())
+        assert read_trace(path)["a"].tolist() == [1.5, 2.5]
+
+        with open(path, "r+b") as f:
+            f.seek(struct.calcsize("<4s"))
+            f.write(struct.pack("<H", 3))
+        with pytest.raises(ValueError):
+            read_trace(path)
+
+    def test_stale(self, csv_path, tmp_path, monkeypatch):
+        monkeypatch.setattr(carbon_trace, "RELOAD_CHECK_SECONDS", 0.0)
+        path = tmp_path / "trace.bin"
+        monkeypatch.setattr(carbon_trace, "CARBON_TRACE_BINARY_PATH", path)
+        monkeypatch.setattr(carbon_trace, "CARBON_TRACE_FILE_PATH", csv_path)
+        monkeypatch.setattr(carbon_trace, "_traces", {})
+
+        # converted when there is no binary trace yet
+        trace = carbon_trace.get_trace()
+        assert trace.path == path
+        assert is_binary_trace(path)
+        assert trace.intensity(HOUR) == 200.0
+
+        # and again when the csv trace is newer
+        csv_path.write_text(TRACE.replace("200.0", "400.0"))
+        stat = path.stat()
+        os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert trace.intensity(HOUR) == 400.0
+        assert read_trace(path)["carbon_intensity_gco2_kwh_direct"][1] == 400.0
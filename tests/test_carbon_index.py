@@ -0,0 +1,110 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import math
+import random
+import sys
+import threading
+
+from src.sinfonia.carbon_index import CarbonIndex
+
+
+class TestCarbonIndex:
+    def test_order(self):
+        index = CarbonIndex()
+        index.add(0, 300.0)
+        index.add(1, None)
+        index.add(2, 100.0)
+        index.add(3, math.nan)
+        index.add(4, 100.0)
+        assert len(index) == 5
+        assert list(index) == [
+            (100.0, 2),
+            (100.0, 4),
+            (300.0, 0),
+            (None, 1),
+            (None, 3),
+        ]
+
+    def test_update_remove(self):
+        index = CarbonIndex()
+        index.add(0, 300.0)
+        index.add(1, None)
+
+        index.add(0, 50.0)
+        index.add(1, 10.0)
+        assert list(index) == [(10.0, 1), (50.0, 0)]
+
+        index.remove(1)
+        index.remove(1)
+        assert 1 not in index
+        assert list(index) == [(50.0, 0)]
+
+    def test_matches_sort(self):
+        rng = random.Random(42)
+        index = CarbonIndex()
+        values = {}
+        for _ in range(1000):
+            slot = rng.randrange(100)
+            if rng.random() < 0.2:
+                index.remove(slot)
+                values.pop(slot, None)
+            else:
+                value = rng.choice([None, rng.uniform(0.0, 800.0)])
+                index.add(slot, value)
+                values[slot] = value
+
+        known = sorted((v, s) for s, v in values.items() if v is not None)
+        unknown = sorted((None, s) for s, v in values.items() if v is None)
+        assert list(index) == known + unknown
+
+    def test_lazy(self):
+        index = CarbonIndex()
+        for slot in range(100):
+            index.add(slot, float(slot))
+
+        walk = iter(index)
+        head = [next(walk) for _ in range(40)]
+        assert head == [(float(slot), slot) for slot in range(40)]
+
+        # updates ahead of the walk are seen, yielded slots are not repeated
+        index.add(99, 70.5)
+        index.add(3, 80.5)
+        index.add(90, None)
+        rest = list(walk)
+        slots = [slot for _, slot in rest]
+        assert slots[slots.index(70) + 1] == 99
+        assert 3 not in slots
+        assert rest[-1] == (None, 90)
+        assert len(head) + len(rest) == 100
+
+    def test_concurrent_updates(self):
+        index = CarbonIndex()
+        for slot in range(100):
+            index.add(slot, float(slot))
+        stop = threading.Event()
+
+        def churn():
+            rng = random.Random(5)
+            while not stop.is_set():
+                index.add(rng.randrange(100), rng.uniform(0.0, 500.0))
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            for _ in range(500):
+                ordering = []
+                for carbon_intensity, slot in index:
+                    ordering.append((carbon_intensity, slot))
+                # in order of carbon intensity, every slot at most once, slots
+                # that moved behind the walk are skipped
+                slots = [slot for _, slot in ordering]
+                assert len(set(slots)) == len(slots)
+                assert set(slots) <= set(range(100))
+                assert ordering == sorted(ordering)
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(interval)
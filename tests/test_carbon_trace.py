@@ -0,0 +1,67 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import os
+
+import numpy as np
+import pytest
+
+from src.sinfonia.carbon.simulation import trace as carbon_trace
+from src.sinfonia.carbon.simulation.trace import CarbonTrace, get_trace
+
+HOUR = 3600
+TRACE = """\
+timestamp,zone,carbon_intensity_gco2_kwh_direct
+7200,US-TEST,300.0
+0,US-TEST,100.0
+3600,US-TEST,200.0
+"""
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text(TRACE)
+    return path
+
+
+class TestCarbonTrace:
+    def test_lookup(self, trace_path):
+        trace = CarbonTrace(trace_path)
+        assert (trace.start, trace.end) == (0, 2 * HOUR)
+
+        assert trace.row(HOUR) == {
+            "timestamp": HOUR,
+            "zone": "US-TEST",
+            "carbon_intensity_gco2_kwh_direct": 200.0,
+        }
+        # first sample at or after the timestamp
+        assert trace.row(HOUR + 1)["timestamp"] == 2 * HOUR
+        assert trace.intensity(HOUR + 1, interpolate=False) == 300.0
+        with pytest.raises(IndexError):
+            trace.row(2 * HOUR + 1)
+
+    def test_interpolate(self, trace_path):
+        trace = CarbonTrace(trace_path)
+        assert trace.intensity(HOUR) == 200.0
+        assert trace.intensity(HOUR + HOUR // 4) == 225.0
+        # clamped outside of the trace
+        assert trace.intensity(-HOUR) == 100.0
+        assert trace.intensity(10 * HOUR) == 300.0
+
+    def test_range(self, trace_path):
+        trace = CarbonTrace(trace_path)
+        timestamps, values = trace.range(1, 2 * HOUR + 1)
+        assert timestamps.tolist() == [HOUR, 2 * HOUR]
+        assert values.tolist() == [200.0, 300.0]
+        assert len(trace.range(5 * HOUR, 6 * HOUR)[0]) == 0
+
+    def test_reload(self, trace_path, monkeypatch):
+        monkeypatch.setattr(carbon_trace, "RELOAD_CHECK_SECONDS", 0.0)
+        trace = get_trace(trace_path)
+        assert get_trace(trace_path) is trace
+
+        trace_path.write_text(TRACE.replace("300.0", "600.0"))
+        os.utime(trace_path, ns=(0, 0))
+        assert trace.intensity(2 * HOUR) == 600.0
+        assert isinstance(trace.timestamps, np.ndarray)
@@ -0,0 +1,95 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import hashlib
+from concurrent.futures import wait
+from uuid import UUID
+
+import pytest
+import requests
+from flask import Flask
+from wireguard_tools import WireguardKey
+
+from src.sinfonia.chart_cache import ChartCache
+from src.sinfonia.cluster import Cluster
+from src.sinfonia.cluster_backend import FakeBackend
+from src.sinfonia.deployment_recipe import DeploymentRecipe
+from src.sinfonia.deployment_repository import DeploymentRepository
+
+from .conftest import GOOD_CONTENT, GOOD_UUID
+
+CHART_URL = "http://test/example-0.1.0.tgz"
+CHART = b"chart archive"
+
+
+@pytest.fixture
+def remote_repository(tmp_path, requests_mock):
+    requests_mock.get(f"http://test/{GOOD_UUID}.yaml", text=GOOD_CONTENT)
+    requests_mock.get(CHART_URL, content=CHART)
+    return DeploymentRepository(
+        "http://test/",
+        chart_cache=ChartCache(tmp_path / "charts", session=requests.Session()),
+    )
+
+
+class TestChartCache:
+    def test_get(self, tmp_path, requests_mock):
+        requests_mock.get(CHART_URL, content=CHART)
+        cache = ChartCache(tmp_path, session=requests.Session())
+
+        path = cache.get(CHART_URL, "charts/example-0.1.0")
+        assert path.read_bytes() == CHART
+        assert path.name == f"example-0.1.0-{hashlib.sha256(CHART).hexdigest()}.tgz"
+        assert cache.get(CHART_URL, "example-0.1.0") == path
+        assert requests_mock.call_count == 1
+
+        # the index survives a restart
+        cache = ChartCache(tmp_path, session=requests.Session())
+        assert cache.get(CHART_URL, "example-0.1.0") == path
+        assert requests_mock.call_count == 1
+
+    def test_retry(self, tmp_path, requests_mock):
+        requests_mock.get(CHART_URL, [{"status_code": 404}, {"content": CHART}])
+        cache = ChartCache(tmp_path, session=requests.Session())
+
+        with pytest.raises(requests.HTTPError):
+            cache.get(CHART_URL, "example-0.1.0")
+        assert list(tmp_path.iterdir()) == []
+
+        assert cache.get(CHART_URL, "example-0.1.0").read_bytes() == CHART
+
+    def test_prefetch(self, remote_repository, requests_mock):
+        recipe = DeploymentRecipe.from_repo(remote_repository, UUID(GOOD_UUID))
+        # loading the recipe started the download
+        wait([remote_repository.chart_cache.pull(recipe.chart_ref, "")])
+        assert requests_mock.call_count == 2
+
+        assert recipe.chart_path().endswith(".tgz")
+        assert requests_mock.call_count == 2
+
+    def test_install(self, remote_repository, requests_mock):
+        backend = FakeBackend()
+        cluster = Cluster(backend)
+        app = Flask("test")
+        app.config["deployment_repository"] = remote_repository
+
+        with app.app_context():
+            for _ in range(3):
+                key = WireguardKey.generate().public_key()
+                cluster.get(UUID(GOOD_UUID), key, create=True).deploy()
+
+        chart_fetches = [r for r in requests_mock.request_history if r.url == CHART_URL]
+        assert len(chart_fetches) == 1
+        charts = {chart_ref for chart_ref, _ in backend.releases.values()}
+        assert len(charts) == 1
+        assert charts.pop().startswith(str(remote_repository.chart_cache.cache_dir))
+
+    def test_local_repository(self, repository, tmp_path):
+        repository = DeploymentRepository(
+            repository.base_url, chart_cache=ChartCache(tmp_path)
+        )
+        recipe = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        # local charts are not copied
+        assert recipe.chart_path() == str(recipe.chart_ref)
+        assert UUID(GOOD_UUID) in repository.recipe_uuids()
+        assert DeploymentRepository("http://test/").recipe_uuids() == []
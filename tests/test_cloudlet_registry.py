@@ -0,0 +1,195 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import random
+import sys
+import threading
+from ipaddress import ip_address
+from uuid import uuid4
+
+import numpy as np
+import pendulum
+import pytest
+from yarl import URL
+
+from src.sinfonia.cloudlet_registry import INITIAL_CAPACITY, CloudletRegistry
+from src.sinfonia.cloudlets import Cloudlet
+from src.sinfonia.geo_location import GeoLocation
+
+
+def make_cloudlet(uuid=None, resources=None, last_update=None, location=None):
+    return Cloudlet.new(
+        uuid or uuid4(),
+        URL("http://localhost/api/v1/deploy"),
+        locations=[location] if location is not None else [],
+        local_networks=["128.2.0.0/16"],
+        resources=resources,
+        last_update=last_update,
+    )
+
+
+class TestCloudletRegistry:
+    def test_mapping(self):
+        registry = CloudletRegistry()
+        cloudlet = make_cloudlet()
+        registry[cloudlet.uuid] = cloudlet
+        assert registry[cloudlet.uuid] is cloudlet
+        assert list(registry.values()) == [cloudlet]
+        assert len(registry) == 1
+
+        with pytest.raises(KeyError):
+            registry[uuid4()] = cloudlet
+
+        assert registry.pop(cloudlet.uuid) is cloudlet
+        assert registry.pop(cloudlet.uuid, None) is None
+        assert len(registry) == 0
+
+    def test_columns(self):
+        registry = CloudletRegistry()
+        first = make_cloudlet(
+            resources={"carbon_intensity_gco2_kwh": 250.0, "cpu_ratio": 0.5},
+            location=GeoLocation(40.4439, -79.9561),
+        )
+        second = make_cloudlet(resources={"mem_ratio": 0.25})
+        registry.add(first)
+        registry.add(second)
+
+        carbon = registry.column("carbon_intensity")
+        assert carbon.shape == (2,)
+        assert carbon[registry.slot(first.uuid)] == 250.0
+        assert np.isnan(carbon[registry.slot(second.uuid)])
+        assert registry.column("mem_ratio")[registry.slot(second.uuid)] == 0.25
+        assert registry.column("latitude")[registry.slot(first.uuid)] == 40.4439
+        assert list(registry.active) == [True, True]
+
+        with pytest.raises(ValueError):
+            carbon[0] = 0.0
+
+        # an updated report replaces the values in the same slot
+        slot = registry.slot(first.uuid)
+        update = make_cloudlet(uuid=first.uuid, resources={"cpu_ratio": 0.75})
+        assert registry.add(update) == slot
+        assert registry[first.uuid] is update
+        assert np.isnan(registry.column("carbon_intensity")[slot])
+        assert registry.column("cpu_ratio")[slot] == 0.75
+
+    def test_bad_values(self):
+        registry = CloudletRegistry()
+        cloudlet = make_cloudlet(
+            resources={
+                "carbon_intensity_gco2_kwh": "250",
+                "cpu_ratio": "busy",
+                "mem_ratio": [0.5],
+            }
+        )
+        slot = registry.add(cloudlet)
+        assert registry.column("carbon_intensity")[slot] == 250.0
+        assert np.isnan(registry.column("cpu_ratio")[slot])
+        assert np.isnan(registry.column("mem_ratio")[slot])
+
+    def test_slot_reuse(self):
+        registry = CloudletRegistry()
+        cloudlets = [make_cloudlet() for _ in range(INITIAL_CAPACITY + 1)]
+        for cloudlet in cloudlets:
+            registry.add(cloudlet)
+        assert registry.capacity == INITIAL_CAPACITY + 1
+
+        slot = registry.slot(cloudlets[3].uuid)
+        del registry[cloudlets[3].uuid]
+        assert not registry.active[slot]
+        assert slot not in registry.network_index
+
+        replacement = make_cloudlet(resources={"cpu_ratio": 0.1})
+        assert registry.add(replacement) == slot
+        assert registry.capacity == INITIAL_CAPACITY + 1
+        assert registry.cloudlet(slot) is replacement
+
+    def test_indexes(self):
+        registry = CloudletRegistry()
+        cloudlet = make_cloudlet(location=GeoLocation(40.4439, -79.9561))
+        slot = registry.add(cloudlet)
+
+        assert cloudlet.uuid in registry.location_index
+        match = registry.network_index.lookup(ip_address("128.2.0.1"))
+        assert match.local == 1 << slot
+        assert list(registry.carbon_index) == [(None, slot)]
+
+        update = make_cloudlet(
+            uuid=cloudlet.uuid, resources={"carbon_intensity_gco2_kwh": 120.0}
+        )
+        registry.add(update)
+        assert list(registry.carbon_index) == [(120.0, slot)]
+
+        registry.remove(cloudlet.uuid)
+        assert slot not in registry.carbon_index
+        assert cloudlet.uuid not in registry.location_index
+        assert registry.network_index.lookup(ip_address("128.2.0.1")).local == 0
+
+    def test_expired(self):
+        now = pendulum.now()
+        registry = CloudletRegistry()
+        static = make_cloudlet()
+        fresh = make_cloudlet(last_update=now)
+        stale = make_cloudlet(last_update=now.subtract(minutes=5))
+        for cloudlet in (static, fresh, stale):
+            registry.add(cloudlet)
+
+        cutoff = now.subtract(minutes=1).timestamp()
+        assert registry.expired(cutoff) == [stale.uuid]
+
+    def test_covers(self):
+        cloudlets = [make_cloudlet() for _ in range(3)]
+        registry = CloudletRegistry.from_cloudlets(cloudlets)
+        assert registry.covers(cloudlets)
+        assert not registry.covers([make_cloudlet()])
+        assert not registry.covers([make_cloudlet(uuid=cloudlets[0].uuid)])
+
+    def test_pinned_generation(self):
+        registry = CloudletRegistry()
+        cloudlet = make_cloudlet()
+        slot = registry.add(cloudlet)
+        active, generations = registry.pin()
+        assert active[slot]
+        assert registry.cloudlet(slot, generations[slot]) is cloudlet
+
+        # an update keeps the slot generation
+        registry.add(make_cloudlet(uuid=cloudlet.uuid))
+        registry.cloudlet(slot, generations[slot])
+
+        # a slot that was freed and reused is no longer the pinned cloudlet
+        registry.remove(cloudlet.uuid)
+        assert registry.add(make_cloudlet()) == slot
+        with pytest.raises(KeyError):
+            registry.cloudlet(slot, generations[slot])
+        assert not active.flags.writeable
+
+    def test_concurrent_readers(self):
+        registry = CloudletRegistry()
+        cloudlets = [make_cloudlet() for _ in range(100)]
+        stop = threading.Event()
+
+        def churn():
+            rng = random.Random(3)
+            while not stop.is_set():
+                cloudlet = rng.choice(cloudlets)
+                if cloudlet.uuid in registry:
+                    registry.remove(cloudlet.uuid)
+                else:
+                    registry.add(cloudlet)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            for _ in range(1000):
+                values = list(registry.values())
+                assert all(cloudlet is not None for cloudlet in values)
+                items = dict(registry.items())
+                assert all(items[uuid].uuid == uuid for uuid in items)
+                active = registry.active
+                assert len(active) <= registry.capacity
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(interval)
@@ -0,0 +1,122 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import pytest
+from flask import Flask
+from wireguard_tools import WireguardKey
+
+from src.sinfonia.cluster import Cluster
+from src.sinfonia.cluster_backend import (
+    ClusterBackendError,
+    FakeBackend,
+    connect_backend,
+)
+from src.sinfonia.deployment import CLIENT_NETWORK
+
+TUNNEL_KEY = WireguardKey.generate().public_key()
+
+
+@pytest.fixture
+def app(repository):
+    app = Flask("test")
+    app.config["deployment_repository"] = repository
+    return app
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend(
+        annotations={
+            "kilo.squat.ai/key": str(TUNNEL_KEY),
+            "kilo.squat.ai/endpoint": "192.0.2.1:51820",
+        },
+        services={("kube-system", "kube-dns"): "10.43.0.10"},
+    )
+
+
+def deploy_clients(app, cluster, uuid, count):
+    with app.app_context():
+        for _ in range(count):
+            key = WireguardKey.generate().public_key()
+            deployment = cluster.get(uuid, key, create=True)
+            deployment.deploy()
+
+
+class TestClusterBackend:
+    def test_fake_backend(self, backend):
+        peer = {"metadata": {"name": "a", "labels": {"x": "1", "y": "2"}}}
+        applied = backend.apply_peer(peer)
+        assert applied["metadata"]["resourceVersion"] == "1"
+        assert "resourceVersion" not in peer["metadata"]
+
+        watch = backend.watch_peers("x=1", 5)
+        backend.apply_peer({"metadata": {"name": "b", "labels": {"x": "2"}}})
+        backend.delete_peer("a")
+        watch.close()
+        assert [(e["type"], e["object"]["metadata"]["name"]) for e in watch] == [
+            ("ADDED", "a"),
+            ("DELETED", "a"),
+        ]
+
+        assert backend.list_peers("x=2")["metadata"]["resourceVersion"] == "3"
+        assert [p["metadata"]["name"] for p in backend.list_peers("")["items"]] == ["b"]
+        assert not backend.has_peer("a")
+
+        with pytest.raises(ClusterBackendError):
+            backend.service_ip("default", "missing")
+        with pytest.raises(ValueError):
+            connect_backend("unknown")
+
+    def test_cluster(self, backend):
+        cluster = Cluster(backend)
+        assert cluster.tunnel_public_key == TUNNEL_KEY
+        assert cluster.tunnel_endpoint == "192.0.2.1:51820"
+        assert str(cluster.kubedns_address) == "10.43.0.10"
+
+    def test_deploy(self, app, backend, good_uuid):
+        cluster = Cluster(backend)
+        key = WireguardKey.generate().public_key()
+
+        with app.app_context():
+            assert cluster.get(good_uuid, key) is None
+
+            deployment = cluster.get(good_uuid, key, create=True)
+            deployment.deploy()
+            assert deployment.client_ip in CLIENT_NETWORK
+            assert deployment.client_ip in cluster.client_addresses
+            assert backend.releases[deployment.name][0].endswith("example-0.1.0.tgz")
+
+            found = cluster.get(good_uuid, key)
+            assert found == deployment
+            assert found.asdict()["Status"] == "Deployed"
+            assert list(cluster.deployments()) == [deployment]
+
+            deployment.expire()
+            assert not backend.peers and not backend.releases
+            assert deployment.client_ip not in cluster.client_addresses
+            assert cluster.get(good_uuid, key) is None
+
+    def test_deploy_overhead(self, app, backend, good_uuid):
+        """Backend calls per deploy, without and with the peer cache."""
+        deploys = 50
+
+        cluster = Cluster(backend)
+        backend.calls.clear()
+        deploy_clients(app, cluster, good_uuid, deploys)
+        assert backend.calls["install"] == deploys
+        assert backend.calls["list_peers"] >= 3 * deploys
+
+        cluster.watch_peers(resync_seconds=60)
+        try:
+            assert cluster.peer_cache.wait_synced(5)
+            backend.calls.clear()
+            deploy_clients(app, cluster, good_uuid, deploys)
+        finally:
+            cluster.peer_cache.stop()
+
+        # the only remaining calls create the peer and the helm release
+        assert backend.calls["list_peers"] == 0
+        assert backend.calls["has_peer"] == 0
+        assert backend.calls["apply_peer"] == deploys
+        assert backend.calls["install"] == deploys
+        assert len(backend.peers) == 2 * deploys
@@ -0,0 +1,105 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import json
+import logging
+import threading
+import time
+
+import pytest
+import requests
+
+from src.sinfonia.cluster import RESOURCE_QUERIES, Cluster
+from src.sinfonia.cluster_backend import FakeBackend
+
+DELAY = 0.05
+
+
+class FakePrometheus:
+    """Session answering every resource query after DELAY seconds."""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data):
+        with self.lock:
+            self.queries += 1
+        time.sleep(DELAY)
+
+        resource = next(r for r, q in RESOURCE_QUERIES.items() if q in data["query"])
+        if resource == "gpu_ratio":
+            value = "NaN"
+        else:
+            value = str(list(RESOURCE_QUERIES).index(resource) / 10)
+
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = json.dumps(
+            {
+                "status": "success",
+                "data": {"resultType": "scalar", "result": [0, value]},
+            }
+        ).encode()
+        return response
+
+
+@pytest.fixture
+def prometheus():
+    return FakePrometheus()
+
+
+@pytest.fixture
+def cluster(prometheus):
+    return Cluster(FakeBackend(), session=prometheus)
+
+
+class TestClusterResources:
+    def test_scrape(self, cluster, prometheus):
+        start = time.monotonic()
+        resources = cluster.get_resources()
+        # queries run concurrently
+        assert time.monotonic() - start < len(RESOURCE_QUERIES) * DELAY
+        assert prometheus.queries == len(RESOURCE_QUERIES)
+
+        assert resources == {
+            "cpu_ratio": 0.0,
+            "mem_ratio": 0.1,
+            "net_rx_rate": 0.2,
+            "net_tx_rate": 0.3,
+        }
+        for resource in RESOURCE_QUERIES:
+            assert cluster.resource_latency.percentile(resource, 50) >= DELAY
+
+    def test_max_age(self, cluster, prometheus):
+        resources = cluster.get_resources()
+        # callers get their own copy
+        resources["carbon_intensity"] = 1.0
+        assert "carbon_intensity" not in cluster.get_resources()
+        assert prometheus.queries == len(RESOURCE_QUERIES)
+
+        cluster.resource_max_age = 0
+        cluster.get_resources()
+        assert prometheus.queries == 2 * len(RESOURCE_QUERIES)
+
+    def test_shared_scrape(self, cluster, prometheus):
+        threads = [threading.Thread(target=cluster.get_resources) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert prometheus.queries == len(RESOURCE_QUERIES)
+
+    def test_failure(self):
+        cluster = Cluster(FakeBackend(), session=FakePrometheus(status_code=503))
+        assert cluster.get_resources() == {}
+
+    def test_latency_logged(self, cluster, caplog):
+        caplog.set_level(logging.DEBUG, logger="main")
+        cluster.get_resources()
+
+        # every scrape logs the latency of each query
+        (message,) = [m for m in caplog.messages if "query latency" in m]
+        for resource in RESOURCE_QUERIES:
+            assert f"'{resource}': {{'p50'" in message
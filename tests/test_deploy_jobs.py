@@ -0,0 +1,123 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import IPv4Address
+from uuid import UUID, uuid4
+
+import pytest
+from flask import Flask
+from wireguard_tools import WireguardKey
+from yarl import URL
+
+from src.sinfonia.client_info import ClientInfo
+from src.sinfonia.cloudlets import Cloudlet
+from src.sinfonia.deploy_jobs import (
+    FAILED,
+    RUNNING,
+    SUCCEEDED,
+    DeployJobs,
+    TooManyJobs,
+)
+from src.sinfonia.latency_stats import LatencyStats
+
+APP_UUID = UUID("00000000-0000-0000-0000-000000000000")
+JOB_ID = "00000000-0000-0000-0000-0000000000aa"
+
+
+class TestDeployJobs:
+    def test_submit(self):
+        jobs = DeployJobs(max_workers=1)
+        job = jobs.submit(APP_UUID, "key", lambda: [{"n": 1}])
+
+        assert job.wait(5)
+        assert job.status == SUCCEEDED
+        assert jobs.get(job.id) is job
+        assert job.asdict() == {
+            "id": str(job.id),
+            "UUID": str(APP_UUID),
+            "ApplicationKey": "key",
+            "status": SUCCEEDED,
+            "result": [{"n": 1}],
+        }
+        assert jobs.get(uuid4()) is None
+
+    def test_failed(self):
+        def deploy():
+            raise RuntimeError("install failed")
+
+        job = DeployJobs().submit(APP_UUID, "key", deploy)
+        assert job.wait(5)
+        assert job.status == FAILED
+        assert "install failed" in job.asdict()["error"]
+        assert "result" not in job.asdict()
+
+    def test_dedupe_and_limit(self):
+        release = threading.Event()
+        jobs = DeployJobs(max_workers=1, max_pending=2)
+
+        first = jobs.submit(APP_UUID, "a", release.wait)
+        # the same client gets the job already in progress
+        assert jobs.submit(APP_UUID, "a", release.wait) is first
+        second = jobs.submit(APP_UUID, "b", release.wait)
+        with pytest.raises(TooManyJobs):
+            jobs.submit(APP_UUID, "c", release.wait)
+        assert not first.wait(0.05)
+
+        release.set()
+        assert first.wait(5) and second.wait(5)
+        # completed jobs no longer count against the limit or dedupe
+        third = jobs.submit(APP_UUID, "a", lambda: [])
+        assert third is not first
+        assert third.wait(5)
+
+    def test_expire(self):
+        jobs = DeployJobs(ttl=0)
+        job = jobs.submit(APP_UUID, "a", lambda: [])
+        assert job.wait(5)
+        jobs.submit(APP_UUID, "b", lambda: [])
+        assert jobs.get(job.id) is None
+
+
+class TestAsyncDeploy:
+    @pytest.fixture
+    def app(self):
+        app = Flask("test")
+        app.config["executor"] = ThreadPoolExecutor(max_workers=1)
+        app.config["DEPLOY_ASYNC"] = True
+        app.config["DEPLOY_ASYNC_POLL_SECONDS"] = 1
+        app.config["latency_stats"] = LatencyStats(min_samples=1)
+        yield app
+        app.config["executor"].shutdown()
+
+    def test_poll(self, app, requests_mock):
+        key = WireguardKey.generate().public_key()
+        cloudlet = Cloudlet.new(
+            uuid4(), URL("http://tier2.test/api/v1/deploy"), name="tier2"
+        )
+        client_info = ClientInfo(key, IPv4Address("192.0.2.1"), None)
+
+        deploy = requests_mock.post(
+            f"http://tier2.test/api/v1/deploy/{APP_UUID}/{key.urlsafe}",
+            status_code=202,
+            headers={"Location": f"/api/v1/deploy_jobs/{JOB_ID}"},
+            json={"id": JOB_ID, "status": RUNNING},
+        )
+        poll = requests_mock.get(
+            f"http://tier2.test/api/v1/deploy_jobs/{JOB_ID}",
+            [
+                {"json": {"id": JOB_ID, "status": RUNNING}},
+                {"json": {"id": JOB_ID, "status": SUCCEEDED, "result": [{"n": 1}]}},
+            ],
+        )
+
+        with app.app_context():
+            result = cloudlet.deploy_async(APP_UUID, client_info).result(5)
+
+        assert result == [{"n": 1}]
+        assert deploy.last_request.headers["Prefer"] == "respond-async"
+        assert poll.call_count == 2
+        assert poll.last_request.qs == {"wait": ["1"]}
+        # the hedge delay is based on the time until the job completed
+        assert app.config["latency_stats"].percentile(cloudlet.uuid, 50) is not None
@@ -0,0 +1,118 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+
+import pendulum
+import pytest
+import requests
+from flask import Flask
+from wireguard_tools import WireguardKey
+
+from src.sinfonia.cluster import Cluster
+from src.sinfonia.cluster_backend import FakeBackend
+from src.sinfonia.deployment_expiry import expired_peers
+
+PROMETHEUS = "http://prometheus.test/api/v1/query"
+
+
+def deploy_clients(repository, cluster, uuid, count):
+    app = Flask("test")
+    app.config["deployment_repository"] = repository
+    keys = [WireguardKey.generate().public_key() for _ in range(count)]
+    with app.app_context():
+        for key in keys:
+            cluster.get(uuid, key, create=True).deploy()
+    return keys
+
+
+def age_peers(backend, minutes):
+    created = str(pendulum.now().subtract(minutes=minutes))
+    for peer in backend.peers.values():
+        peer["metadata"]["annotations"]["findcloudlet.org/created"] = created
+
+
+def active_response(keys):
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": {"public_key": str(key)}} for key in keys],
+        },
+    }
+
+
+class SlowBackend(FakeBackend):
+    """Backend that tracks how many uninstalls run at the same time."""
+
+    delay = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+
+    def uninstall(self, name):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        super().uninstall(name)
+
+
+@pytest.fixture
+def cluster():
+    return Cluster(FakeBackend(), prometheus_url=PROMETHEUS, session=requests.Session())
+
+
+class TestDeploymentExpiry:
+    def test_expired_peers(self, cluster, repository, good_uuid):
+        keys = deploy_clients(repository, cluster, good_uuid, 3)
+        peers = cluster.get_peers()
+        cutoff = pendulum.now().add(minutes=1)
+
+        assert len(list(expired_peers(peers, set(keys[1:]), cutoff))) == 1
+        assert not list(expired_peers(peers, set(), pendulum.now().subtract(days=1)))
+
+        del peers[0]["metadata"]["labels"]["findcloudlet.org/key"]
+        assert len(list(expired_peers(peers, set(), cutoff))) == 2
+
+    def test_sweep(self, cluster, repository, good_uuid, requests_mock):
+        backend = cluster.backend
+        keys = deploy_clients(repository, cluster, good_uuid, 10)
+        age_peers(backend, 30)
+        requests_mock.post(PROMETHEUS, json=active_response(keys[:4]))
+
+        backend.calls.clear()
+        # recipes are not needed, there is no application context
+        result = cluster.expire_inactive_deployments()
+
+        assert (result.peers, result.expired, result.removed) == (10, 6, 6)
+        assert result.duration >= 0
+        assert len(backend.peers) == len(backend.releases) == 4
+        assert len(cluster.client_addresses) == 4
+        assert backend.calls["list_peers"] == 1
+        assert backend.calls["uninstall"] == 6
+
+        result = cluster.expire_inactive_deployments()
+        assert (result.peers, result.expired, result.removed) == (4, 0, 0)
+
+    def test_concurrent(self, repository, good_uuid, requests_mock):
+        backend = SlowBackend()
+        cluster = Cluster(
+            backend, prometheus_url=PROMETHEUS, session=requests.Session()
+        )
+        deploy_clients(repository, cluster, good_uuid, 8)
+        age_peers(backend, 30)
+        requests_mock.post(PROMETHEUS, json=active_response([]))
+
+        cluster.expiry_workers = 4
+        start = time.monotonic()
+        result = cluster.expire_inactive_deployments()
+
+        assert result.removed == 8
+        assert backend.max_running == 4
+        assert time.monotonic() - start < 8 * SlowBackend.delay
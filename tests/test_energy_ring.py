@@ -0,0 +1,117 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import csv
+import time
+from multiprocessing import Process
+
+import numpy as np
+import pytest
+
+from src.sinfonia.carbon.meter.energy_ring import EnergyRing
+from src.sinfonia.carbon.meter.intel_rapl import EnergyCsvWriter, sample_energy_joules
+
+
+@pytest.fixture
+def ring():
+    ring = EnergyRing.create(capacity=8)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def write_samples(name, count):
+    ring = EnergyRing.attach(name)
+    for ts in range(count):
+        ring.append(ts, ts / 2, float(ts))
+    ring.close()
+
+
+class TestEnergyRing:
+    def test_empty(self, ring):
+        assert ring.count == 0
+        assert len(ring.last(5)) == 0
+        assert ring.sum_joules(5) == 0.0
+
+    def test_last(self, ring):
+        for ts in range(5):
+            ring.append(ts, ts / 2, float(ts))
+        records = ring.last(3)
+        assert records["timestamp"].tolist() == [2, 3, 4]
+        assert records["average_watts"].tolist() == [1.0, 1.5, 2.0]
+        assert ring.sum_joules(3) == 2.0 + 3.0 + 4.0
+        # fewer records than requested
+        assert ring.last(10)["timestamp"].tolist() == [0, 1, 2, 3, 4]
+        assert len(ring.last(0)) == 0
+
+    def test_wrap_around(self, ring):
+        for ts in range(21):
+            ring.append(ts, 0.0, float(ts))
+        assert ring.count == 21
+        assert ring.last(3)["timestamp"].tolist() == [18, 19, 20]
+        # no more than capacity records are kept
+        assert ring.last(100)["timestamp"].tolist() == list(range(13, 21))
+
+    def test_last_is_a_copy(self, ring):
+        ring.append(1, 0.0, 1.0)
+        records = ring.last(1)
+        for ts in range(2, 10):
+            ring.append(ts, 0.0, float(ts))
+        assert records["timestamp"].tolist() == [1]
+
+    def test_attach(self, ring):
+        other = EnergyRing.attach(ring.name)
+        try:
+            assert other.capacity == ring.capacity
+            ring.append(7, 1.0, 2.0)
+            assert other.last(1)["joules"].tolist() == [2.0]
+        finally:
+            other.close()
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            EnergyRing.create(capacity=0)
+
+    def test_cross_process(self):
+        ring = EnergyRing.create(capacity=64)
+        try:
+            writer = Process(target=write_samples, args=(ring.name, 20000))
+            writer.start()
+            # records read while the writer wraps around are consistent
+            while writer.is_alive():
+                records = ring.last(16)
+                timestamps = records["timestamp"]
+                assert np.array_equal(records["joules"], timestamps)
+                assert np.all(np.diff(timestamps) == 1)
+            writer.join()
+            assert writer.exitcode == 0
+            assert ring.count == 20000
+            assert ring.sum_joules(2) == 19998.0 + 19999.0
+        finally:
+            ring.close()
+            ring.unlink()
+
+
+class TestEnergyCsvWriter:
+    def test_write(self, tmp_path):
+        path = tmp_path / "carbon" / "energy.csv"
+        writer = EnergyCsvWriter(path, reset_interval_seconds=3600)
+        for ts in range(5):
+            writer.write(ts + 1700000000, ts / 2, float(ts))
+        writer.close()
+
+        with open(path, newline="") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["timestamp", "average_joules", "summation_joules"]
+        assert len(rows) == 6
+        assert sample_energy_joules(path, 2) == 3.0 + 4.0
+
+    def test_reset(self, tmp_path):
+        path = tmp_path / "energy.csv"
+        writer = EnergyCsvWriter(path, reset_interval_seconds=0)
+        ts = int(time.time()) + 10
+        writer.write(ts, 0.0, 1.0)
+        writer.write(ts + 1, 0.0, 2.0)
+        writer.close()
+        # every row starts a new file
+        assert sample_energy_joules(path, 10) == 2.0
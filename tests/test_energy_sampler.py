@@ -0,0 +1,55 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import io
+
+import pandas as pd
+import pytest
+
+from src.sinfonia.carbon.meter import intel_rapl
+from src.sinfonia.carbon.meter.intel_rapl import _reversed_lines, sample_energy_joules
+
+HEADER = "timestamp,average_joules,summation_joules\r\n"
+
+
+def energy_csv(path, rows, partial=""):
+    with open(path, "w", newline="") as f:
+        f.write(HEADER)
+        for ts in range(rows):
+            f.write(f"{ts},{ts / 2},{float(ts)}\r\n")
+        f.write(partial)
+    return path
+
+
+def read_csv_sample(path, period_seconds):
+    """Previous implementation, parses the whole file."""
+    df = pd.read_csv(path, on_bad_lines="skip")
+    return df.tail(period_seconds).iloc[:, -1].sum()
+
+
+class TestEnergySampler:
+    @pytest.mark.parametrize("block_size", [1, 7, 4096])
+    def test_reversed_lines(self, block_size):
+        data = b"a\nbb\r\n\nccc\nddd"
+        lines = list(_reversed_lines(io.BytesIO(data), block_size))
+        assert lines == [b"ccc", b"", b"bb", b"a"]
+        lines = list(_reversed_lines(io.BytesIO(data + b"\n"), block_size))
+        assert lines == [b"ddd", b"ccc", b"", b"bb", b"a"]
+        assert list(_reversed_lines(io.BytesIO(b"partial"), block_size)) == []
+
+    @pytest.mark.parametrize("period", [1, 15, 99, 100, 500])
+    def test_sample(self, tmp_path, monkeypatch, period):
+        monkeypatch.setattr(intel_rapl, "BLOCK_SIZE", 64)
+        path = energy_csv(tmp_path / "energy.csv", 100)
+        assert sample_energy_joules(path, period) == read_csv_sample(path, period)
+
+    def test_partial_row(self, tmp_path):
+        # the row being written is not included
+        path = energy_csv(tmp_path / "energy.csv", 10, partial="10,5.0,1")
+        assert sample_energy_joules(path, 2) == 9.0 + 8.0
+
+    def test_empty(self, tmp_path):
+        path = tmp_path / "energy.csv"
+        path.write_text(HEADER)
+        assert sample_energy_joules(path, 15) == 0.0
+        assert sample_energy_joules(energy_csv(path, 5), 0) == 0.0
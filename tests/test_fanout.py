@@ -0,0 +1,193 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.sinfonia.fanout import deploy_first, gather_first, gather_hedged
+
+
+def completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def failed():
+    future = Future()
+    future.set_exception(RuntimeError("cloudlet unreachable"))
+    return future
+
+
+class TestFanout:
+    def test_first_k(self):
+        pending = Future()
+        requests = [pending, completed([{"n": 1}]), completed([{"n": 2}])]
+
+        assert gather_first(requests, 2) == [{"n": 1}, {"n": 2}]
+        # outstanding requests are cancelled
+        assert pending.cancelled()
+
+    def test_rank_order(self):
+        requests = [
+            completed([{"n": 1}, {"n": 3}]),
+            failed(),
+            completed(None),
+            completed([{"n": 2}]),
+        ]
+        assert gather_first(requests, 3) == [{"n": 1}, {"n": 2}, {"n": 3}]
+        assert gather_first(requests, 2) == [{"n": 1}, {"n": 2}]
+
+    def test_timeout(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            slow = executor.submit(time.sleep, 0.5)
+            requests = [slow, completed([{"n": 1}])]
+
+            start = time.monotonic()
+            assert gather_first(requests, 2, timeout=0.1) == [{"n": 1}]
+            assert time.monotonic() - start < 0.4
+            # running requests can not be cancelled, they finish in the background
+            assert not slow.cancelled()
+            assert slow.result() is None
+
+    def test_slow_cloudlet(self):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+
+            def deploy(delay, result):
+                time.sleep(delay)
+                return [result]
+
+            requests = [
+                executor.submit(deploy, 0.5, {"n": 1}),
+                executor.submit(deploy, 0.0, {"n": 2}),
+                executor.submit(deploy, 0.0, {"n": 3}),
+            ]
+            start = time.monotonic()
+            assert gather_first(requests, 2) == [{"n": 2}, {"n": 3}]
+            assert time.monotonic() - start < 0.4
+
+
+class TestDeployFirst:
+    def run(self, delays, max_results=1, spares=1, existing=()):
+        """Deploy to cloudlets that answer after the given delays (None fails),
+        cloudlets in existing return a deployment the client already had.
+        """
+        released = []
+        with ThreadPoolExecutor(max_workers=len(delays)) as executor:
+
+            def deploy(name):
+                def slow():
+                    delay = delays[name]
+                    time.sleep(delay or 0.0)
+                    if delay is None:
+                        return []
+                    return [{"name": name, "NewDeployment": name not in existing}]
+
+                return executor.submit(slow)
+
+            start = time.monotonic()
+            results = deploy_first(
+                list(delays),
+                deploy=deploy,
+                release=released.append,
+                max_results=max_results,
+                spares=spares,
+            )
+            self.elapsed = time.monotonic() - start
+        return [r["name"] for r in results], released
+
+    def test_fast_candidates(self):
+        results, released = self.run({"a": 0.0, "b": 0.0, "c": 0.2}, max_results=2)
+        assert results == ["a", "b"]
+        # the spare is not needed, it is cancelled or released once it completes
+        assert released in ([], ["c"])
+
+    def test_slow_cloudlet(self):
+        # one slow cloudlet among k+1 does not hold up the response
+        results, released = self.run({"a": 0.5, "b": 0.0, "c": 0.0}, max_results=2)
+        assert self.elapsed < 0.4
+        assert results == ["b", "c"]
+        # the slow cloudlet completed after we returned and is released
+        assert released == ["a"]
+
+    def test_failed_cloudlet(self):
+        assert self.run({"a": None, "b": 0.0}) == (["b"], [])
+
+    def test_spares(self):
+        # only max_results + spares candidates get a request
+        results, released = self.run({"a": 0.3, "b": 0.3, "c": 0.0})
+        assert results == ["a"]
+        assert released == ["b"]
+
+    def test_existing_deployment(self):
+        # deployments the client already had are not released
+        results, released = self.run(
+            {"a": 0.0, "b": 0.2, "c": 0.1}, max_results=1, spares=2, existing="bc"
+        )
+        assert results == ["a"]
+        assert released == []
+
+
+class TestHedging:
+    def run(self, delays, max_results=1, max_hedges=1, hedge_delay=0.1, existing=()):
+        """Deploy to cloudlets that answer after the given delays (None fails),
+        cloudlets in existing return a deployment the client already had.
+        """
+        released = []
+        with ThreadPoolExecutor(max_workers=len(delays)) as executor:
+
+            def deploy(name):
+                def slow():
+                    delay = delays[name]
+                    time.sleep(delay or 0.0)
+                    if delay is None:
+                        return []
+                    return [{"name": name, "NewDeployment": name not in existing}]
+
+                return executor.submit(slow)
+
+            start = time.monotonic()
+            results = gather_hedged(
+                list(delays),
+                deploy=deploy,
+                release=released.append,
+                hedge_delay=lambda _name: hedge_delay,
+                max_results=max_results,
+                max_hedges=max_hedges,
+            )
+            self.elapsed = time.monotonic() - start
+        return [r["name"] for r in results], released
+
+    def test_fast_primary(self):
+        assert self.run({"a": 0.0, "b": 0.0}) == (["a"], [])
+
+    def test_slow_primary(self):
+        results, released = self.run({"a": 0.5, "b": 0.0})
+        assert self.elapsed < 0.4
+        assert results == ["b"]
+        # the slow primary completed after we returned and is released
+        assert released == ["a"]
+
+    def test_failed_primary(self):
+        assert self.run({"a": None, "b": 0.0}, hedge_delay=10.0) == (["b"], [])
+
+    def test_max_hedges(self):
+        results, released = self.run(
+            {"a": 0.3, "b": 0.3, "c": 0.0}, max_hedges=1, hedge_delay=0.05
+        )
+        # only b is tried as a backup, c never gets a request
+        assert results == ["a"]
+        assert released == ["b"]
+
+    def test_rank_order(self):
+        results, released = self.run(
+            {"a": 0.2, "b": 0.0, "c": 0.0}, max_results=2, hedge_delay=0.1
+        )
+        assert results == ["b", "c"]
+        assert released == ["a"]
+
+    def test_existing_deployment(self):
+        # the slow primary already held the client's deployment, it is kept
+        results, released = self.run({"a": 0.5, "b": 0.0}, existing="a")
+        assert results == ["b"]
+        assert released == []
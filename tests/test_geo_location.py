@@ -1,9 +1,20 @@
 # Copyright (c) 2022 Carnegie Mellon University
 # SPDX-License-Identifier: MIT
 
+import geopy.distance
+import numpy as np
 import pytest
 
-from src.sinfonia.geo_location import GeoLocation
+from src.sinfonia.geo_location import (
+    DistanceMode,
+    GeoLocation,
+    coordinates_array,
+    distances,
+)
+
+# haversine assumes a spherical earth, the geodesic distance on the WGS-84
+# ellipsoid can differ by up to 0.5%
+HAVERSINE_RELATIVE_ERROR = 0.005
 
 
 class TestGeoLocation:
@@ -63,3 +74,49 @@ class TestGeoLocation:
         location2 = GeoLocation(52.3556, 4.9135)
         assert int(location1 - location2) == 6274
         assert int(location2 - location1) == 6274
+
+    @pytest.fixture(scope="class")
+    def random_coordinates(self):
+        rng = np.random.default_rng(42)
+        coordinates = np.column_stack(
+            [rng.uniform(-90.0, 90.0, 2000), rng.uniform(-180.0, 180.0, 2000)]
+        )
+        # include some edge cases, same point, poles and (nearly) antipodal
+        return np.vstack(
+            [
+                coordinates,
+                [
+                    [40.4439, -79.9561],
+                    [90.0, 0.0],
+                    [-90.0, 0.0],
+                    [-40.4439, 100.0439],
+                    [-40.4439, 100.05],
+                ],
+            ]
+        )
+
+    def test_distances(self, random_coordinates):
+        origin = GeoLocation(40.4439, -79.9561)
+        expected = np.array(
+            [
+                geopy.distance.distance(origin.coordinate, tuple(coord)).km
+                for coord in random_coordinates
+            ]
+        )
+
+        geodesic = distances(origin, random_coordinates, DistanceMode.GEODESIC)
+        np.testing.assert_allclose(geodesic, expected, rtol=0, atol=1e-3)
+
+        haversine = distances(origin, random_coordinates, "haversine")
+        np.testing.assert_allclose(
+            haversine, expected, rtol=HAVERSINE_RELATIVE_ERROR, atol=1e-9
+        )
+
+    def test_coordinates_array(self):
+        locations = [GeoLocation(40.4439, -79.9561), GeoLocation(52.3556, 4.9135)]
+        array = coordinates_array(locations)
+        assert array.shape == (2, 2)
+        assert int(distances(locations[0], array)[1]) == 6274
+
+        assert coordinates_array([]).shape == (0, 2)
+        assert distances(locations[0], coordinates_array([])).shape == (0,)
@@ -0,0 +1,109 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+from ipaddress import ip_address
+
+import pytest
+from flask import Flask
+
+from src.sinfonia import geolocation_cache as cache_module
+from src.sinfonia.geo_location import GeoLocation
+from src.sinfonia.geolocation_cache import GeolocationCache
+
+PITTSBURGH = GeoLocation(40.4439, -79.9561)
+
+
+class CountingLookup:
+    def __init__(self, location=PITTSBURGH):
+        self.location = location
+        self.calls = []
+
+    def __call__(self, address):
+        self.calls.append(address)
+        return self.location
+
+
+class TestGeolocationCache:
+    def test_hit_miss(self):
+        cache = GeolocationCache()
+        lookup = CountingLookup()
+        address = ip_address("128.2.0.1")
+
+        assert cache.get(address, lookup) == PITTSBURGH
+        assert cache.get(address, lookup) == PITTSBURGH
+        assert lookup.calls == [address]
+        assert cache.stats() == {
+            "size": 1,
+            "maxsize": cache.maxsize,
+            "hits": 1,
+            "misses": 1,
+            "evictions": 0,
+            "hit_ratio": 0.5,
+        }
+
+        # failed lookups are cached as well
+        unknown = CountingLookup(None)
+        assert cache.get(ip_address("10.0.0.1"), unknown) is None
+        assert cache.get(ip_address("10.0.0.1"), unknown) is None
+        assert len(unknown.calls) == 1
+
+    def test_lru(self):
+        cache = GeolocationCache(maxsize=2)
+        lookup = CountingLookup()
+        first, second, third = (ip_address(f"10.0.0.{i}") for i in range(3))
+
+        cache.get(first, lookup)
+        cache.get(second, lookup)
+        cache.get(first, lookup)
+        cache.get(third, lookup)  # evicts second, the least recently used
+        assert len(cache) == 2
+        assert cache.stats()["evictions"] == 1
+
+        cache.get(first, lookup)
+        cache.get(second, lookup)
+        assert lookup.calls == [first, second, third, second]
+
+    def test_ttl(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+        cache = GeolocationCache(ttl=60.0)
+        lookup = CountingLookup()
+        address = ip_address("128.2.0.1")
+
+        cache.get(address, lookup)
+        now[0] += 59.0
+        cache.get(address, lookup)
+        assert len(lookup.calls) == 1
+
+        now[0] += 2.0
+        cache.get(address, lookup)
+        assert len(lookup.calls) == 2
+
+    def test_prefix(self):
+        cache = GeolocationCache(prefix_v4=24, prefix_v6=48)
+        lookup = CountingLookup()
+
+        cache.get(ip_address("128.2.0.1"), lookup)
+        cache.get(ip_address("128.2.0.200"), lookup)
+        cache.get(ip_address("128.2.1.1"), lookup)
+        cache.get(ip_address("2001:db8:1::1"), lookup)
+        cache.get(ip_address("2001:db8:1:ffff::1"), lookup)
+        cache.get(ip_address("2001:db8:2::1"), lookup)
+        assert len(lookup.calls) == 4
+
+        with pytest.raises(ValueError):
+            GeolocationCache(prefix_v4=33)
+
+    def test_from_address(self, flask_app):
+        app = Flask("cached")
+        cache = app.config["geolocation_cache"] = GeolocationCache()
+        with app.app_context():
+            for _ in range(3):
+                location = GeoLocation.from_address("128.2.0.1")
+                assert location.coordinate == PITTSBURGH.coordinate
+            with pytest.raises(ValueError):
+                GeoLocation.from_address("10.0.0.1")
+            with pytest.raises(ValueError):
+                GeoLocation.from_address("10.0.0.1")
+        assert cache.stats()["hits"] == 3
+        assert cache.stats()["misses"] == 2
@@ -0,0 +1,116 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from flask import Flask
+
+from src.sinfonia.http_transport import (
+    create_session,
+    default_http_session,
+    http_session,
+    session_from_config,
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, avoid delayed ack stalls
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        server = self.server
+        server.requests += 1
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        status = server.statuses.pop(0) if server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"[]")
+
+    do_GET = do_POST = _respond
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.requests = server.connections = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server, path="/"):
+    host, port = server.server_address
+    return f"http://{host}:{port}{path}"
+
+
+class TestHttpTransport:
+    def test_keep_alive(self, stub_server):
+        session = create_session()
+        for _ in range(10):
+            session.post(url(stub_server), json={}).raise_for_status()
+        assert stub_server.requests == 10
+        assert stub_server.connections == 1
+
+    def test_default_timeout(self, monkeypatch):
+        session = create_session(timeout=(1.0, 2.0))
+        seen = []
+
+        def send(request, **kwargs):
+            seen.append(kwargs["timeout"])
+            raise requests.ConnectionError
+
+        monkeypatch.setattr(session, "send", send)
+        for timeout in (None, 5.0):
+            with pytest.raises(requests.ConnectionError):
+                session.get("http://test/", timeout=timeout)
+        assert seen == [(1.0, 2.0), 5.0]
+
+    def test_retry(self, stub_server):
+        session = create_session(retries=2, backoff_factor=0)
+
+        # idempotent requests are retried on server errors
+        stub_server.statuses = [503, 503]
+        assert session.get(url(stub_server)).status_code == 200
+        assert stub_server.requests == 3
+
+        # but a POST that reached the server is not repeated
+        stub_server.statuses = [503]
+        assert session.post(url(stub_server)).status_code == 503
+        assert stub_server.requests == 4
+
+    def test_session_from_config(self):
+        app = Flask("test")
+        app.config.update(
+            HTTP_POOL_MAXSIZE=4,
+            HTTP_CONNECT_TIMEOUT_SECONDS=1,
+            HTTP_READ_TIMEOUT_SECONDS=10,
+        )
+        session = session_from_config(app.config)
+        assert session.timeout == (1.0, 10.0)
+        assert session.get_adapter("http://test/")._pool_maxsize == 4
+
+        # outside of an application we fall back on the default session
+        assert http_session() is default_http_session()
+        with app.app_context():
+            assert http_session() is default_http_session()
+            app.config["http_session"] = session
+            assert http_session() is session
+        assert http_session(app.config) is session
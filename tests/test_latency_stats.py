@@ -0,0 +1,64 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+from uuid import uuid4
+
+import pytest
+
+from src.sinfonia.latency_stats import (
+    BUCKET_GROWTH,
+    DECAY_AFTER,
+    LatencyHistogram,
+    LatencyStats,
+)
+
+
+class TestLatencyStats:
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000)
+
+        for percentile in (50, 90, 99):
+            expected = percentile / 1000
+            found = histogram.percentile(percentile)
+            assert expected <= found <= expected * BUCKET_GROWTH
+
+        # latencies beyond the last bucket are clamped
+        histogram.record(3600.0)
+        assert histogram.percentile(100) == pytest.approx(120, rel=0.2)
+
+    def test_decay(self):
+        histogram = LatencyHistogram()
+        for _ in range(DECAY_AFTER):
+            histogram.record(0.010)
+        for _ in range(DECAY_AFTER):
+            histogram.record(1.0)
+        # recent samples outweigh the older ones
+        assert histogram.percentile(50) >= 1.0
+        assert histogram.total <= DECAY_AFTER
+
+    def test_min_samples(self):
+        stats = LatencyStats(min_samples=3)
+        uuid = uuid4()
+        stats.record(uuid, 0.1)
+        stats.record(uuid, 0.1)
+        assert stats.percentile(uuid, 95) is None
+        stats.record(uuid, 0.1)
+        assert stats.percentile(uuid, 95) == pytest.approx(0.1, rel=BUCKET_GROWTH)
+
+        stats.forget(uuid)
+        assert stats.percentile(uuid, 95) is None
+        assert stats.percentile(uuid4(), 95) is None
+
+    def test_summary(self):
+        stats = LatencyStats(min_samples=2)
+        stats.record("cpu_ratio", 0.1)
+        stats.record("cpu_ratio", 0.1)
+        stats.record("mem_ratio", 0.1)
+
+        # keys without enough samples are left out
+        summary = stats.summary((50, 99.9))
+        assert list(summary) == ["cpu_ratio"]
+        assert list(summary["cpu_ratio"]) == ["p50", "p99.9"]
+        assert summary["cpu_ratio"]["p50"] == pytest.approx(0.1, rel=BUCKET_GROWTH)
@@ -0,0 +1,111 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import random
+import sys
+import threading
+from uuid import uuid4
+
+import pytest
+
+from src.sinfonia.geo_location import GeoLocation
+from src.sinfonia.location_index import LocationIndex
+
+
+def random_location(rng):
+    return GeoLocation(rng.uniform(-90.0, 90.0), rng.uniform(-180.0, 180.0))
+
+
+class TestLocationIndex:
+    def test_cell_size(self):
+        with pytest.raises(ValueError):
+            LocationIndex(cell_size=7.0)
+        with pytest.raises(ValueError):
+            LocationIndex(cell_size=0.0)
+
+    def test_add_remove(self):
+        index = LocationIndex()
+        uuid = uuid4()
+        index.add(uuid, [GeoLocation(40.4439, -79.9561), GeoLocation(52.3556, 4.9135)])
+        assert uuid in index
+        assert len(index) == 1
+
+        # re-adding replaces the previous locations
+        index.add(uuid, [GeoLocation(52.3556, 4.9135)])
+        assert index.within(GeoLocation(40.4439, -79.9561), 1000.0) == []
+
+        index.remove(uuid)
+        assert uuid not in index
+        assert len(index) == 0
+        index.remove(uuid)
+
+        # cloudlets without a location are not indexed
+        index.add(uuid, [])
+        assert uuid not in index
+
+    def test_matches_full_scan(self):
+        rng = random.Random(42)
+        index = LocationIndex()
+        locations = {uuid4(): [random_location(rng)] for _ in range(500)}
+        for uuid, locs in locations.items():
+            index.add(uuid, locs)
+
+        clients = [random_location(rng) for _ in range(20)]
+        # poles and the antimeridian need special handling
+        clients += [
+            GeoLocation(89.9, 0.0),
+            GeoLocation(-89.9, 100.0),
+            GeoLocation(10.0, 179.9),
+            GeoLocation(-10.0, -179.9),
+        ]
+        for client in clients:
+            for radius in (500.0, 2000.0, 8000.0):
+                expected = sorted(
+                    (locs[0] - client, uuid)
+                    for uuid, locs in locations.items()
+                    if locs[0] - client <= radius
+                )
+                found = list(index.nearest(client, radius))
+                assert [uuid for _, uuid in found] == [uuid for _, uuid in expected]
+                assert [km for km, _ in found] == pytest.approx(
+                    [km for km, _ in expected]
+                )
+
+    def test_closest_location(self):
+        index = LocationIndex()
+        uuid = uuid4()
+        pittsburgh = GeoLocation(40.4439, -79.9561)
+        amsterdam = GeoLocation(52.3556, 4.9135)
+        index.add(uuid, [amsterdam, pittsburgh])
+
+        [(distance, found)] = index.within(GeoLocation(40.0, -80.0), None)
+        assert found == uuid
+        assert distance == pytest.approx(pittsburgh - GeoLocation(40.0, -80.0))
+
+    def test_concurrent_updates(self):
+        rng = random.Random(7)
+        index = LocationIndex()
+        center = GeoLocation(40.4439, -79.9561)
+        uuids = [uuid4() for _ in range(200)]
+        stop = threading.Event()
+
+        def churn():
+            while not stop.is_set():
+                uuid = rng.choice(uuids)
+                if uuid in index:
+                    index.remove(uuid)
+                else:
+                    index.add(uuid, [random_location(rng) for _ in range(4)])
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=churn)
+        writer.start()
+        try:
+            for _ in range(50):
+                index.within(center, 10000.0)
+                index.within(center)
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(interval)
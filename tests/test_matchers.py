@@ -1,19 +1,35 @@
 # Copyright (c) 2022 Carnegie Mellon University
 # SPDX-License-Identifier: MIT
 
+import random
 from io import StringIO
 from pathlib import Path
+from uuid import uuid4
 
+import numpy as np
 import pytest
+from flask import Flask
+from yarl import URL
 
 from sinfonia import cloudlets
 from src.sinfonia.client_info import ClientInfo
+from src.sinfonia.cloudlet_registry import CloudletRegistry
+from src.sinfonia.cloudlets import Cloudlet
 from src.sinfonia.deployment_recipe import DeploymentRecipe
+from src.sinfonia.geo_location import GeoLocation
 from src.sinfonia.matchers import (
+    Candidates,
+    as_stage,
+    carbon_intensity_stage,
+    location_stage,
     match_by_location,
+    match_carbon_intensity,
     match_by_network,
     match_random,
+    network_stage,
+    random_stage,
     tier1_best_match,
+    weighted_stage,
 )
 
 
@@ -122,6 +138,62 @@ class TestMatchers:
             assert cloudlet == all_cloudlets[0]
             assert len(cloudlets) == 0
 
+    def test_by_network_acls(self, deployment_recipe, flask_app, example_wgkey):
+        with flask_app.app_context():
+            client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+            local, rejecting, other, remote, elsewhere = self.load(
+                "endpoint: http://localhost/api/v1/deploy\n"
+                "local_networks: [128.2.0.0/16]\n"
+                "---\n"
+                "endpoint: http://localhost/api/v1/deploy\n"
+                "local_networks: [128.2.0.0/16]\n"
+                "rejected_clients: [128.2.0.0/24]\n"
+                "---\n"
+                "endpoint: http://localhost/api/v1/deploy\n"
+                "local_networks: [10.0.0.0/8]\n"
+                "---\n"
+                "endpoint: http://localhost/api/v1/deploy\n"
+                "local_networks: []\n"
+                "accepted_clients: [10.0.0.0/8, 128.2.0.0/16]\n"
+                "---\n"
+                "endpoint: http://localhost/api/v1/deploy\n"
+                "local_networks: []\n"
+                "accepted_clients: [10.0.0.0/8]\n"
+            )
+            cloudlets = [rejecting, other, local, remote, elsewhere]
+            assert list(
+                match_by_network(client_info, deployment_recipe, cloudlets)
+            ) == [local]
+            assert cloudlets == [other, remote]
+
+    def test_network_stage_accepts_all(self, deployment_recipe, example_wgkey):
+        # an empty accepted_clients list accepts any client
+        accept_all, accept_other, local = self.load(
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "local_networks: []\n"
+            "accepted_clients: []\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "local_networks: []\n"
+            "accepted_clients: [10.0.0.0/8]\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "local_networks: [128.2.0.0/16]\n"
+            "accepted_clients: []\n"
+        )
+        registry = CloudletRegistry.from_cloudlets([accept_all, accept_other, local])
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+        with Flask("network").app_context():
+            candidates = network_stage(
+                client_info,
+                deployment_recipe,
+                registry,
+                Candidates.from_mask(registry.active),
+            )
+        kept = [registry.cloudlet(slot) for slot in candidates.slots().tolist()]
+        assert kept == [accept_all, local]
+        assert candidates.scores[registry.slot(local.uuid)] == 0.0
+
     def test_by_location(
         self, aws_cloudlets, deployment_recipe, flask_app, example_wgkey
     ):
@@ -141,6 +213,28 @@ class TestMatchers:
                 assert nearest == nearby
                 assert len(cloudlets) == 0
 
+    def test_by_location_index(self, aws_cloudlets, deployment_recipe, example_wgkey):
+        indexed_app = Flask("indexed")
+        indexed_app.config["cloudlets"] = CloudletRegistry.from_cloudlets(aws_cloudlets)
+
+        for address in self.NEARBY:
+            client_info = ClientInfo.from_address(example_wgkey, address)
+
+            with indexed_app.app_context():
+                indexed = aws_cloudlets[:]
+                nearest = list(
+                    match_by_location(client_info, deployment_recipe, indexed)
+                )
+
+            with Flask("scan").app_context():
+                scanned = aws_cloudlets[:]
+                expected = list(
+                    match_by_location(client_info, deployment_recipe, scanned)
+                )
+
+            assert nearest and nearest == expected
+            assert indexed == scanned
+
     def test_random(self, aws_cloudlets, deployment_recipe, flask_app, example_wgkey):
         with flask_app.app_context():
             client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
@@ -167,3 +261,239 @@ class TestMatchers:
                     )
                 ]
                 assert nearest == nearby
+
+    def test_pipeline(self, aws_cloudlets, deployment_recipe, example_wgkey):
+        [unknown] = self.load("endpoint: http://localhost/api/v1/deploy\n")
+        registry = CloudletRegistry.from_cloudlets([*aws_cloudlets, unknown])
+        active = registry.active.copy()
+        stages = [network_stage, location_stage, random_stage]
+
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+        with Flask("pipeline").app_context():
+            best = list(
+                tier1_best_match(stages, client_info, deployment_recipe, registry)
+            )
+        # nearby cloudlets, far away ones are dropped, then any without location
+        assert [cloudlet.name for cloudlet in best[:-1]] == [
+            "AWS Northern Virginia",
+            "AWS Ohio",
+            "AWS Canada",
+        ]
+        assert best[-1] is unknown
+        # matching does not modify the registry
+        assert len(registry) == len(aws_cloudlets) + 1
+        assert (registry.active == active).all()
+
+    def test_pipeline_max_results(
+        self, aws_cloudlets, deployment_recipe, example_wgkey
+    ):
+        registry = CloudletRegistry.from_cloudlets(aws_cloudlets)
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+
+        def unreachable(*_args):
+            raise AssertionError("stage should not run")
+
+        best = list(
+            tier1_best_match(
+                [location_stage, unreachable],
+                client_info,
+                deployment_recipe,
+                registry,
+                max_results=1,
+            )
+        )
+        assert [cloudlet.name for cloudlet in best] == ["AWS Northern Virginia"]
+
+    def test_legacy_plugin(self, aws_cloudlets, deployment_recipe, example_wgkey):
+        def match_by_name(_client_info, _deployment_recipe, cloudlets):
+            for cloudlet in sorted(cloudlets, key=lambda c: c.name, reverse=True):
+                cloudlets.remove(cloudlet)
+                if cloudlet.name.startswith("AWS S"):
+                    yield cloudlet
+
+        registry = CloudletRegistry.from_cloudlets(aws_cloudlets)
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+
+        stage = as_stage(match_by_name)
+        assert as_stage(stage) is stage
+        assert as_stage(match_random) is random_stage
+
+        best = list(tier1_best_match([stage], client_info, deployment_recipe, registry))
+        assert [cloudlet.name for cloudlet in best] == [
+            "AWS Sydney",
+            "AWS Stockholm",
+            "AWS Singapore",
+            "AWS Seoul",
+            "AWS Sao Paulo",
+        ]
+        assert len(registry) == len(aws_cloudlets)
+
+    def test_carbon_intensity(self, deployment_recipe, flask_app, example_wgkey):
+        low, high, unknown = self.load(
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "resources: {carbon_intensity_gco2_kwh: 10}\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "resources: {carbon_intensity_gco2_kwh: 500}\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+        )
+        registry = CloudletRegistry.from_cloudlets([high, unknown, low])
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+
+        candidates = Candidates.from_mask(registry.active)
+        result = carbon_intensity_stage(
+            client_info, deployment_recipe, registry, candidates
+        )
+        ranked = [registry.cloudlet(slot) for slot in result.ranked()]
+        assert ranked == [low, high, unknown]
+
+        # with a limit only the head of the carbon index is settled
+        limited = carbon_intensity_stage(
+            client_info,
+            deployment_recipe,
+            registry,
+            Candidates.from_mask(registry.active, limit=1),
+        )
+        assert [registry.cloudlet(slot) for slot in limited.ranked()] == [low]
+        assert len(limited.unranked()) == 2
+
+        # reports without a carbon intensity no longer raise KeyError
+        with flask_app.app_context():
+            cloudlets = [unknown, high, low]
+            assert list(
+                match_carbon_intensity(client_info, deployment_recipe, cloudlets)
+            ) == [low, high, unknown]
+            assert cloudlets == []
+        # stage inputs are immutable
+        with pytest.raises(ValueError):
+            candidates.mask[0] = False
+        assert np.isnan(candidates.scores).all()
+
+    def weighted_app(self, weights, mode="linear"):
+        app = Flask("weighted")
+        app.config["WEIGHTED_MATCHER_WEIGHTS"] = weights
+        app.config["WEIGHTED_MATCHER_MODE"] = mode
+        return app
+
+    def test_weighted_linear(self, deployment_recipe, example_wgkey):
+        green, busy, unknown = self.load(
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "resources: {carbon_intensity_gco2_kwh: 10, cpu_ratio: 0.9}\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+            "resources: {carbon_intensity_gco2_kwh: 500, cpu_ratio: 0.1}\n"
+            "---\n"
+            "endpoint: http://localhost/api/v1/deploy\n"
+        )
+        registry = CloudletRegistry.from_cloudlets([busy, unknown, green])
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+
+        for weights, expected in (
+            ({"carbon_intensity": 1.0}, [green, busy, unknown]),
+            ({"carbon_intensity": 1.0, "cpu_ratio": 3.0}, [busy, green, unknown]),
+        ):
+            with self.weighted_app(weights).app_context():
+                best = list(
+                    tier1_best_match(
+                        [weighted_stage], client_info, deployment_recipe, registry
+                    )
+                )
+            assert best == expected
+
+        with self.weighted_app({"latency": 1.0}).app_context():
+            with pytest.raises(ValueError):
+                list(
+                    tier1_best_match(
+                        [weighted_stage], client_info, deployment_recipe, registry
+                    )
+                )
+
+    def test_weighted_distance(self, deployment_recipe, example_wgkey):
+        # primary location in Tokyo, secondary location in Pittsburgh
+        nearby = Cloudlet.new(
+            uuid4(),
+            URL("http://localhost/api/v1/deploy"),
+            locations=[GeoLocation(35.68, 139.69), GeoLocation(40.44, -79.99)],
+        )
+        chicago = Cloudlet.new(
+            uuid4(),
+            URL("http://localhost/api/v1/deploy"),
+            locations=[GeoLocation(41.88, -87.63)],
+        )
+        london = Cloudlet.new(
+            uuid4(),
+            URL("http://localhost/api/v1/deploy"),
+            locations=[GeoLocation(51.51, -0.13)],
+        )
+        registry = CloudletRegistry.from_cloudlets([london, chicago, nearby])
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+
+        with self.weighted_app({"distance": 1.0}).app_context():
+            best = list(
+                tier1_best_match(
+                    [weighted_stage], client_info, deployment_recipe, registry
+                )
+            )
+        assert best == [nearby, chicago, london]
+
+    def test_weighted_pareto(self, deployment_recipe, example_wgkey):
+        rng = random.Random(42)
+        cloudlets = [
+            Cloudlet.new(
+                uuid4(),
+                URL("http://localhost/api/v1/deploy"),
+                locations=[GeoLocation(rng.uniform(-60, 60), rng.uniform(-180, 180))],
+                local_networks=[],
+                resources={
+                    "carbon_intensity_gco2_kwh": rng.uniform(0, 800),
+                    "cpu_ratio": rng.choice([0.2, 0.5, 0.8]),
+                },
+            )
+            for _ in range(300)
+        ]
+        registry = CloudletRegistry.from_cloudlets(cloudlets)
+        client_info = ClientInfo.from_address(example_wgkey, "128.2.0.1")
+        weights = {"distance": 1.0, "carbon_intensity": 1.0, "cpu_ratio": 1.0}
+
+        with self.weighted_app(weights, "pareto").app_context():
+            result = weighted_stage(
+                client_info,
+                deployment_recipe,
+                registry,
+                Candidates.from_mask(registry.active),
+            )
+            limited = weighted_stage(
+                client_info,
+                deployment_recipe,
+                registry,
+                Candidates.from_mask(registry.active, limit=1),
+            )
+
+        # compare against pairwise dominance on the raw objectives
+        def objectives(cloudlet):
+            return (
+                cloudlet.distance_from(client_info.location),
+                cloudlet.resources["carbon_intensity_gco2_kwh"],
+                cloudlet.resources["cpu_ratio"],
+            )
+
+        def dominates(a, b):
+            return all(x <= y for x, y in zip(a, b)) and a != b
+
+        remaining = {registry.slot(c.uuid): objectives(c) for c in cloudlets}
+        front = 0
+        while remaining:
+            nondominated = [
+                slot
+                for slot, point in remaining.items()
+                if not any(dominates(other, point) for other in remaining.values())
+            ]
+            for slot in nondominated:
+                assert int(result.scores[slot]) == front
+                del remaining[slot]
+            if front == 0:
+                # with a limit only (part of) the first front is settled
+                assert set(limited.ranked()) <= set(nondominated)
+                assert limited.ranked()[0] == result.ranked()[0]
+            front += 1
@@ -0,0 +1,129 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import random
+from ipaddress import IPv4Address, IPv4Network, ip_address
+from uuid import uuid4
+
+from yarl import URL
+
+from src.sinfonia.cloudlets import Cloudlet
+from src.sinfonia.network_index import NetworkIndex, bitset_mask, slots
+
+
+def make_cloudlet(local=(), accepted=("0.0.0.0/0",), rejected=()):
+    return Cloudlet.new(
+        uuid4(),
+        URL("http://localhost/api/v1/deploy"),
+        locations=[],
+        local_networks=list(local),
+        accepted_clients=list(accepted),
+        rejected_clients=list(rejected),
+    )
+
+
+def make_index(cloudlets):
+    index = NetworkIndex()
+    for slot, cloudlet in enumerate(cloudlets):
+        index.add(slot, cloudlet)
+    return index
+
+
+def random_network(rng):
+    prefixlen = rng.randint(0, 32)
+    address = IPv4Address(rng.getrandbits(32))
+    return IPv4Network((address, prefixlen), strict=False)
+
+
+class TestNetworkIndex:
+    def test_lookup(self):
+        cmu = make_cloudlet(local=["128.2.0.0/16"], rejected=["128.2.1.0/24"])
+        home = make_cloudlet(local=["192.168.0.0/16"], accepted=["192.168.0.0/16"])
+        v6 = make_cloudlet(local=["2001:db8::/32"], accepted=["::/0"])
+        index = make_index([cmu, home, v6])
+        assert len(index) == 3
+
+        match = index.lookup(ip_address("128.2.0.1"))
+        assert list(slots(match.local)) == [0]
+        assert match.rejected == 0
+        assert list(slots(match.accepted)) == [0]
+
+        match = index.lookup(ip_address("128.2.1.1"))
+        assert list(slots(match.rejected)) == [0]
+
+        match = index.lookup(ip_address("192.168.1.1"))
+        assert list(slots(match.accepted)) == [0, 1]
+        assert list(slots(match.local)) == [1]
+
+        match = index.lookup(ip_address("2001:db8::1"))
+        assert list(slots(match.local)) == [2]
+        assert list(slots(match.accepted)) == [2]
+
+    def test_remove(self):
+        first = make_cloudlet(local=["10.0.0.0/8"])
+        second = make_cloudlet(local=["10.1.0.0/16"])
+        index = make_index([first, second])
+
+        index.remove(0)
+        assert 0 not in index
+        match = index.lookup(ip_address("10.1.2.3"))
+        assert list(slots(match.local)) == [1]
+        assert list(slots(match.accepted)) == [1]
+
+        # re-adding a slot replaces the previous networks
+        index.add(1, first)
+        match = index.lookup(ip_address("10.1.2.3"))
+        assert list(slots(match.local)) == [1]
+        assert index.lookup(ip_address("10.2.0.1")).local == 2
+
+        index.remove(1)
+        index.remove(1)
+        assert len(index) == 0
+        assert index.lookup(ip_address("10.1.2.3")).accepted == 0
+        assert index._roots[4].is_empty()
+
+    def test_empty_accepted_clients(self):
+        open_cloudlet = make_cloudlet(accepted=())
+        closed = make_cloudlet(accepted=["10.0.0.0/8"])
+        index = make_index([open_cloudlet, closed])
+
+        assert list(slots(index.lookup(ip_address("128.2.0.1")).accepted)) == [0]
+        assert list(slots(index.lookup(ip_address("2001:db8::1")).accepted)) == [0]
+        assert list(slots(index.lookup(ip_address("10.0.0.1")).accepted)) == [0, 1]
+
+        index.remove(0)
+        assert index.lookup(ip_address("128.2.0.1")).accepted == 0
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(42)
+        cloudlets = [
+            make_cloudlet(
+                local=[random_network(rng) for _ in range(rng.randint(0, 3))],
+                accepted=[random_network(rng) for _ in range(rng.randint(0, 3))],
+                rejected=[random_network(rng) for _ in range(rng.randint(0, 2))],
+            )
+            for _ in range(100)
+        ]
+        index = make_index(cloudlets)
+
+        for _ in range(200):
+            address = IPv4Address(rng.getrandbits(32))
+            match = index.lookup(address)
+            for slot, cloudlet in enumerate(cloudlets):
+                mask = 1 << slot
+                for kind, networks in (
+                    (match.rejected, cloudlet.rejected_clients),
+                    (match.local, cloudlet.local_networks),
+                    (match.accepted, cloudlet.accepted_clients),
+                ):
+                    expected = any(address in network for network in networks)
+                    if kind is match.accepted and not networks:
+                        expected = True
+                    assert bool(kind & mask) == expected
+
+    def test_bitset_mask(self):
+        bitset = (1 << 0) | (1 << 9) | (1 << 70)
+        assert list(bitset_mask(bitset, 72).nonzero()[0]) == list(slots(bitset))
+        # slots beyond size are ignored
+        assert list(bitset_mask(bitset, 10).nonzero()[0]) == [0, 9]
+        assert not bitset_mask(0, 5).any()
@@ -0,0 +1,145 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import json
+import sys
+import time
+
+from plumbum import local
+
+from src.sinfonia.cluster_backend import KubectlBackend, iter_json
+from src.sinfonia.peer_cache import PEER_SELECTOR, PeerCache
+
+
+def peer(name, uuid="app", key="key", client="10.5.0.1", version=1):
+    return {
+        "metadata": {
+            "name": name,
+            "resourceVersion": str(version),
+            "labels": {
+                "findcloudlet.org": "deployment",
+                "findcloudlet.org/uuid": uuid,
+                "findcloudlet.org/key": key,
+                "findcloudlet.org/client": client,
+            },
+        }
+    }
+
+
+class FakeBackend:
+    def __init__(self, *items):
+        self.items = list(items)
+
+    def list_peers(self, selector):
+        return {"metadata": {"resourceVersion": ""}, "items": self.items}
+
+
+# stands in for kubectl, lists one peer and then watches another one appear
+FAKE_KUBECTL = """\
+import json, sys, time
+peer = json.loads(sys.argv[1])
+if "--watch" in sys.argv:
+    time.sleep(0.1)
+    text = json.dumps({"type": "ADDED", "object": peer}, indent=2)
+    for line in text.splitlines(keepends=True):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    time.sleep(10)
+else:
+    listed = dict(peer, metadata=dict(peer["metadata"], name="listed"))
+    # like kubectl, the List itself has no resourceVersion
+    print(json.dumps({"metadata": {"resourceVersion": ""}, "items": [listed]}))
+"""
+
+
+class TestPeerCache:
+    def test_iter_json(self):
+        text = json.dumps({"a": [1, 2]}, indent=2) + "\n" + json.dumps({"b": "}"})
+        chunks = [text[i : i + 3] for i in range(0, len(text), 3)]
+        assert list(iter_json(chunks)) == [{"a": [1, 2]}, {"b": "}"}]
+
+    def test_select(self):
+        cache = PeerCache(None)
+        cache.apply(peer("one", uuid="a", key="k1", client="10.5.0.1", version=2))
+
+        # not answered until synced with a full listing
+        assert cache.select("findcloudlet.org/uuid=a") is None
+
+        cache.replace([peer("two", uuid="a", key="k2", client="10.5.0.2")], 1)
+        assert [p["metadata"]["name"] for p in cache.select(PEER_SELECTOR)] == [
+            "one",
+            "two",
+        ]
+        found = cache.select("findcloudlet.org/uuid=a", "findcloudlet.org/key=k2")
+        assert [p["metadata"]["name"] for p in found] == ["two"]
+        assert cache.select("findcloudlet.org/client=10.5.0.3") == []
+        assert cache.select("app.kubernetes.io/name=x") is None
+
+        # relabeled peers are reindexed
+        cache.apply(peer("two", uuid="b", key="k2", client="10.5.0.2", version=2))
+        assert len(cache.select("findcloudlet.org/uuid=a")) == 1
+        assert len(cache.select("findcloudlet.org/uuid=b")) == 1
+
+    def test_versions(self):
+        cache = PeerCache(None)
+        cache.replace([peer("one", version=5), peer("two", version=5)], 5)
+
+        # events older than what we know are ignored
+        cache.apply(peer("one", uuid="old", version=4))
+        assert cache.get("one")["metadata"]["labels"]["findcloudlet.org/uuid"] == "app"
+
+        # a stale listing does not resurrect deleted peers, or drop newer ones
+        cache.delete(peer("one", version=7))
+        cache.apply(peer("three", version=8))
+        cache.replace([peer("one", version=5), peer("two", version=5)], 6)
+        assert cache.get("one") is None
+        assert cache.get("three") is not None
+
+        # an up to date listing drops peers we missed the delete event for
+        cache.replace([peer("three", version=8)], 9)
+        assert cache.get("two") is None
+        assert len(cache) == 1
+
+        # peers deleted by us are gone right away
+        cache.delete("three")
+        assert cache.select(PEER_SELECTOR) == []
+
+    def test_resync_without_list_version(self):
+        backend = FakeBackend(peer("one", version=5), peer("two", version=6))
+        cache = PeerCache(backend)
+        cache.resync()
+        assert len(cache) == 2
+
+        # peers missing from a later listing are dropped and forgotten
+        backend.items = [peer("two", version=6)]
+        cache.resync()
+        assert cache.get("one") is None
+        assert len(cache) == 1
+
+        # as are all peers when the listing is empty
+        cache.delete(peer("three", version=7))
+        backend.items = []
+        cache.resync()
+        assert len(cache) == 0
+        assert cache._versions == {}
+
+    def test_copies(self):
+        cache = PeerCache(None)
+        cache.replace([peer("one")], 1)
+        cache.get("one")["metadata"]["labels"].clear()
+        cache.select(PEER_SELECTOR)[0]["metadata"]["name"] = "two"
+        assert cache.select("findcloudlet.org/uuid=app") == [peer("one")]
+
+    def test_watch(self):
+        kubectl = local[sys.executable]["-c", FAKE_KUBECTL, json.dumps(peer("watched"))]
+        cache = PeerCache(KubectlBackend(kubectl, helm=None), resync_seconds=60)
+        cache.start()
+        try:
+            assert cache.wait_synced(5)
+            deadline = time.monotonic() + 5
+            while cache.get("watched") is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            names = [p["metadata"]["name"] for p in cache.select(PEER_SELECTOR)]
+            assert names == ["listed", "watched"]
+        finally:
+            cache.stop()
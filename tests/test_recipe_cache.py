@@ -0,0 +1,152 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import os
+from uuid import UUID
+
+import pytest
+import requests
+
+from src.sinfonia.deployment_recipe import DeploymentRecipe
+from src.sinfonia.deployment_repository import DeploymentRepository
+from src.sinfonia.recipe_cache import RecipeCache
+
+from .conftest import GOOD_CONTENT, GOOD_UUID
+
+UPDATED_CONTENT = """\
+chart: example
+version: 0.2.0
+"""
+
+
+def load_count(requests_mock):
+    return sum(r.url.endswith(".yaml") for r in requests_mock.request_history)
+
+
+class TestRecipeCache:
+    def test_lru(self):
+        cache = RecipeCache(maxsize=2)
+        for key in "aba":
+            assert cache.get(key, lambda _: (key.upper(), None)) == key.upper()
+        assert cache.stats()["hits"] == 1
+
+        cache.get("c", lambda _: ("C", None))
+        assert len(cache) == 2
+        assert cache.stats()["evictions"] == 1
+        # "b" was least recently used
+        assert cache.get("a", lambda _: ("reloaded", None)) == "A"
+        assert cache.get("b", lambda _: ("reloaded", None)) == "reloaded"
+
+    def test_negative(self):
+        cache = RecipeCache(negative_ttl=60)
+        calls = []
+
+        def load(validator):
+            calls.append(validator)
+            raise FileNotFoundError
+
+        errors = []
+        for _ in range(3):
+            with pytest.raises(FileNotFoundError) as excinfo:
+                cache.get("unknown", load)
+            errors.append(excinfo.value)
+        assert len(calls) == 1
+        # every lookup raises its own exception
+        assert len({id(error) for error in errors}) == 3
+
+    def test_transient(self):
+        cache = RecipeCache(negative_ttl=60)
+        calls = []
+
+        def load(validator):
+            calls.append(validator)
+            raise requests.ConnectionError
+
+        for _ in range(3):
+            with pytest.raises(requests.ConnectionError):
+                cache.get("unreachable", load)
+        assert len(calls) == 3
+        assert len(cache) == 0
+
+    def test_revalidate(self):
+        cache = RecipeCache(max_age=0)
+        assert cache.get("a", lambda _: ("A", ("mtime", "1"))) == "A"
+
+        validators = []
+
+        def unchanged(validator):
+            validators.append(validator)
+            return None, validator
+
+        assert cache.get("a", unchanged) == "A"
+        assert validators == [("mtime", "1")]
+
+
+class TestCachedRecipes:
+    def test_local(self, tmp_path):
+        path = tmp_path / f"{GOOD_UUID}.yaml"
+        path.write_text(GOOD_CONTENT)
+        repository = DeploymentRepository(tmp_path, recipe_cache=RecipeCache(max_age=0))
+
+        recipe = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        assert DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID)) is recipe
+
+        path.write_text(UPDATED_CONTENT)
+        os.utime(path, ns=(0, 0))
+        updated = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        assert updated.version == "0.2.0"
+
+        with pytest.raises(FileNotFoundError):
+            DeploymentRecipe.from_repo(repository, UUID(int=1))
+        (tmp_path / f"{UUID(int=1)}.yaml").write_text(GOOD_CONTENT)
+        # negative lookups are cached
+        with pytest.raises(FileNotFoundError):
+            DeploymentRecipe.from_repo(repository, UUID(int=1))
+
+    def test_etag(self, requests_mock):
+        url = f"http://test/{GOOD_UUID}.yaml"
+        requests_mock.get(
+            url,
+            [
+                {"text": GOOD_CONTENT, "headers": {"ETag": '"v1"'}},
+                {"status_code": 304},
+                {"text": UPDATED_CONTENT, "headers": {"ETag": '"v2"'}},
+            ],
+        )
+        repository = DeploymentRepository(
+            "http://test/",
+            session=requests.Session(),
+            recipe_cache=RecipeCache(max_age=0),
+        )
+
+        recipe = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        assert DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID)) is recipe
+        assert requests_mock.last_request.headers["If-None-Match"] == '"v1"'
+
+        updated = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        assert updated.version == "0.2.0"
+        assert load_count(requests_mock) == 3
+
+    def test_fetch_storm(self, requests_mock):
+        requests_mock.get(f"http://test/{GOOD_UUID}.yaml", text=GOOD_CONTENT)
+        requests_mock.get(f"http://test/{UUID(int=1)}.yaml", status_code=404)
+        repository = DeploymentRepository("http://test/", session=requests.Session())
+
+        for _ in range(100):
+            DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+            with pytest.raises(requests.HTTPError):
+                DeploymentRecipe.from_repo(repository, UUID(int=1))
+        assert load_count(requests_mock) == 2
+
+    def test_server_error(self, requests_mock):
+        requests_mock.get(
+            f"http://test/{GOOD_UUID}.yaml",
+            [{"status_code": 503}, {"text": GOOD_CONTENT}],
+        )
+        repository = DeploymentRepository("http://test/", session=requests.Session())
+
+        with pytest.raises(requests.HTTPError):
+            DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        # server errors are not cached, the next lookup tries again
+        recipe = DeploymentRecipe.from_repo(repository, UUID(GOOD_UUID))
+        assert recipe.version == "0.1.0"
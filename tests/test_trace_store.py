@@ -0,0 +1,80 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+import pytest
+
+from src.sinfonia.carbon.simulation.binary_trace import write_trace
+from src.sinfonia.carbon.simulation.trace import INTENSITY_COLUMN
+from src.sinfonia.carbon.simulation.trace_store import CarbonTraceStore
+
+from .test_carbon_trace import HOUR, TRACE
+
+
+@pytest.fixture
+def store():
+    store = CarbonTraceStore()
+    store.add("A", np.array([0, HOUR, 2 * HOUR]), np.array([100.0, 200.0, 300.0]))
+    store.add("B", np.array([HOUR, 0]), np.array([50.0, 10.0]))
+    return store
+
+
+class TestCarbonTraceStore:
+    def test_intensity(self, store):
+        assert store.zones == ["A", "B"]
+        np.testing.assert_array_equal(
+            store.intensity(["B", "unknown", "A"], HOUR), [50.0, np.nan, 200.0]
+        )
+        np.testing.assert_array_equal(
+            store.intensity(["A", "B"], HOUR // 2), [150.0, 30.0]
+        )
+        np.testing.assert_array_equal(
+            store.intensity(["A", "B"], HOUR // 2, interpolate=False), [200.0, 50.0]
+        )
+        # clamped outside of the traces, B ends before A
+        np.testing.assert_array_equal(
+            store.intensity(["A", "B"], 3 * HOUR), [300.0, 50.0]
+        )
+        np.testing.assert_array_equal(store.intensity(["A", "B"], -HOUR), [100, 10])
+        assert store.intensities(HOUR) == {"A": 200.0, "B": 50.0}
+
+    def test_sample_grids(self):
+        store = CarbonTraceStore()
+        store.add("A", np.array([0, 2 * HOUR]), np.array([100.0, 300.0]))
+        store.add("B", np.array([HOUR, 3 * HOUR]), np.array([10.0, 30.0]))
+        # only samples that are in the trace of each zone, never the
+        # interpolated values on the shared timestamps
+        for timestamp, expected in (
+            (0, [100.0, 10.0]),
+            (HOUR // 2, [300.0, 10.0]),
+            (HOUR, [300.0, 10.0]),
+            (2 * HOUR, [300.0, 30.0]),
+            (3 * HOUR, [300.0, 30.0]),
+            (4 * HOUR, [300.0, 30.0]),
+        ):
+            np.testing.assert_array_equal(
+                store.intensity(["A", "B"], timestamp, interpolate=False), expected
+            )
+        np.testing.assert_array_equal(store.intensity(["A", "B"], HOUR), [200.0, 10.0])
+
+    def test_series(self, store):
+        timestamps, values = store.series(["A", "C"], HOUR, 3 * HOUR)
+        assert timestamps.tolist() == [HOUR, 2 * HOUR]
+        assert values[0].tolist() == [200.0, 300.0]
+        assert np.isnan(values[1]).all()
+
+    def test_update(self, store):
+        store.add("A", np.array([0]), np.array([1.0]))
+        assert store.intensity(["A"], HOUR).tolist() == [1.0]
+        store.remove("B")
+        assert store.zones == ["A"]
+        assert np.isnan(CarbonTraceStore().intensity(["A"], 0)).all()
+
+    def test_from_directory(self, tmp_path):
+        (tmp_path / "US-CSV.csv").write_text(TRACE)
+        write_trace(
+            tmp_path / "US-BIN.bin", np.array([0, HOUR]), {INTENSITY_COLUMN: [1, 2]}
+        )
+        store = CarbonTraceStore.from_directory(tmp_path)
+        assert sorted(store.zones) == ["US-BIN", "US-CSV"]
+        assert store.intensities(HOUR // 2) == {"US-CSV": 150.0, "US-BIN": 1.5}
@@ -0,0 +1,156 @@
+# Copyright (c) 2022 Carnegie Mellon University
+# SPDX-License-Identifier: MIT
+
+import time
+from concurrent.futures import wait
+from uuid import UUID
+
+import pytest
+from flask import Flask
+from jsonschema import ValidationError
+from wireguard_tools import WireguardKey
+
+from src.sinfonia.cluster import Cluster
+from src.sinfonia.cluster_backend import FakeBackend
+from src.sinfonia.deployment_recipe import DeploymentRecipe
+from src.sinfonia.deployment_repository import DeploymentRepository
+from src.sinfonia.warm_pool import WarmPool
+
+WARM_UUID = UUID("00000000-0000-0000-0000-000000000010")
+WARM_CONTENT = """\
+chart: example
+version: 0.1.0
+warm_pool: 2
+"""
+INVALID_UUID = UUID("00000000-0000-0000-0000-000000000011")
+INVALID_CONTENT = """\
+chart: example
+version: 0.1.0
+warm_pool: -1
+"""
+
+
+@pytest.fixture
+def warm_repository(tmp_path):
+    (tmp_path / f"{WARM_UUID}.yaml").write_text(WARM_CONTENT)
+    (tmp_path / f"{INVALID_UUID}.yaml").write_text(INVALID_CONTENT)
+    return DeploymentRepository(tmp_path)
+
+
+class TestWarmPool:
+    def test_recipe(self, warm_repository, repository, good_uuid):
+        assert DeploymentRecipe.from_repo(warm_repository, WARM_UUID).warm_pool == 2
+        assert DeploymentRecipe.from_repo(repository, good_uuid).warm_pool == 0
+        with pytest.raises(ValidationError):
+            DeploymentRecipe.from_repo(warm_repository, INVALID_UUID)
+
+    def test_fill(self, warm_repository):
+        backend = FakeBackend()
+        pool = WarmPool(backend)
+        recipe = DeploymentRecipe.from_repo(warm_repository, WARM_UUID)
+
+        wait(pool.fill(recipe))
+        assert pool.fill(recipe) == []
+        assert pool.idle(recipe) == 2
+        assert len(backend.releases) == 2
+
+        name = pool.take(recipe)
+        assert name in backend.releases
+
+        # take started refilling the pool
+        deadline = time.monotonic() + 5
+        while pool.idle(recipe) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.idle(recipe) == 2
+        assert backend.calls["install"] == 3
+
+        pool.drain()
+        assert list(backend.releases) == [name]
+
+    def test_fill_all(self, warm_repository, repository, good_uuid):
+        backend = FakeBackend()
+        pool = WarmPool(backend)
+
+        # the invalid recipe is skipped, recipes without a pool size are not filled
+        wait(pool.fill_all(warm_repository))
+        recipe = DeploymentRecipe.from_repo(warm_repository, WARM_UUID)
+        assert pool.idle(recipe) == 2
+        assert pool.fill_all(repository, [good_uuid]) == []
+        pool.drain()
+
+    def test_install_failure(self, warm_repository, caplog):
+        class FailingBackend(FakeBackend):
+            def install(self, name, chart_ref, values):
+                raise RuntimeError("chart not found")
+
+            def uninstall(self, name):
+                raise RuntimeError("cleanup failed")
+
+        pool = WarmPool(FailingBackend())
+        recipe = DeploymentRecipe.from_repo(warm_repository, WARM_UUID)
+
+        wait(pool.fill(recipe))
+        assert pool.idle(recipe) == 0
+        # failed installs are no longer counted, so the pool can be refilled
+        wait(pool.fill(recipe))
+        pool.drain()
+
+        # failures are logged, including those while cleaning up
+        assert caplog.text.count("failed to install") == 4
+        assert "cleanup failed" in caplog.text
+
+    def test_deploy(self, warm_repository):
+        backend = FakeBackend()
+        cluster = Cluster(backend, warm_pool=WarmPool(backend))
+        app = Flask("test")
+        app.config["deployment_repository"] = warm_repository
+        recipe = DeploymentRecipe.from_repo(warm_repository, WARM_UUID)
+        wait(cluster.warm_pool.fill(recipe))
+
+        with app.app_context():
+            installs = backend.calls["install"]
+            key = WireguardKey.generate().public_key()
+            deployment = cluster.get(WARM_UUID, key, create=True)
+            # the warm release is only taken when deploying
+            assert not deployment.warm
+            assert cluster.warm_pool.idle(deployment.recipe) == 2
+            assert deployment.deploy()
+            assert deployment.warm
+            # deploying again reuses the existing deployment
+            assert not cluster.get(WARM_UUID, key, create=True).deploy()
+            peer = backend.peers[deployment.name]
+            assert peer["metadata"]["name"] in backend.releases
+            assert cluster.get(WARM_UUID, key) == deployment
+
+            # the only install was to refill the pool
+            recipe = deployment.recipe
+            deadline = time.monotonic() + 5
+            while cluster.warm_pool.idle(recipe) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cluster.warm_pool.drain()
+            assert backend.calls["install"] == installs + 1
+            assert list(backend.releases) == [deployment.name]
+
+    def test_deploy_failure(self, warm_repository):
+        class FailingBackend(FakeBackend):
+            def apply_peer(self, manifest):
+                raise RuntimeError("api server unavailable")
+
+        backend = FailingBackend()
+        cluster = Cluster(backend, warm_pool=WarmPool(backend))
+        app = Flask("test")
+        app.config["deployment_repository"] = warm_repository
+        recipe = DeploymentRecipe.from_repo(warm_repository, WARM_UUID)
+        wait(cluster.warm_pool.fill(recipe))
+
+        with app.app_context():
+            key = WireguardKey.generate().public_key()
+            deployment = cluster.get(WARM_UUID, key, create=True)
+            with pytest.raises(RuntimeError):
+                deployment.deploy()
+
+            # the warm release that was taken is not leaked
+            assert deployment.warm
+            assert deployment.name not in backend.releases
+            cluster.warm_pool.drain()
+            assert backend.releases == {}